@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import mmap
+import weakref
+from dataclasses import dataclass
+from typing import Callable
+
+from cooperative import CooperativeCall, DEFAULT_SLICE_FUEL
+from custom_exceptions import InvalidSyntaxError, UnknownFunctionError, UnknownImportError, \
+    InvalidFunctionSignatureError
+from enums import NumberType
+from evaluations import DataExpression
+from expressions import SExpression, ModuleExpression
+from function import FunctionExpression, ImportedFunctionExpression, FunctionRegistry, imported_functions, \
+    compile_functions, EXPORTED_FUNCTIONS
+from host import HostFunction
+from instantiate import ExpressionInstantiater
+from module_cache import ParseCache, instantiate_module
+from source_map import SourceMap, normalize
+from variables import FixedNumber, Stack, VariableWatch, GlobalVariable, GlobalVariableWatch, Memory, \
+    SharedLinearMemory
+
+
+@dataclass
+class InstanceState:
+    # What an instance owns of the interpreter state. The state is process-wide, so the one of an instance is
+    # installed before its calls and put aside while another instance runs
+    memory: tuple[bytearray | memoryview | mmap.mmap, int | None, SharedLinearMemory | None]
+    globals: tuple[int, dict[int | str, GlobalVariable]]
+    table: list[FunctionExpression]
+    # Instances of modules parsed from the same text share the functions, so the imports are bound again too
+    hosts: dict[ImportedFunctionExpression, HostFunction | None]
+    dropped: dict[DataExpression, bool]
+
+    @staticmethod
+    def capture(module: ModuleExpression | None) -> InstanceState:
+        children: list[SExpression] = module.children if module is not None else []
+        return InstanceState(Memory().save(), GlobalVariableWatch().save(), FunctionRegistry().functions,
+                             {function: function.host for function in imported_functions(module)}
+                             if module is not None else {},
+                             {child: child.dropped for child in children if isinstance(child, DataExpression)})
+
+    @staticmethod
+    def blank() -> InstanceState:
+        return InstanceState((bytearray(), None, None), (0, {}), [], {}, {})
+
+    def install(self) -> None:
+        Memory().restore(self.memory)
+        GlobalVariableWatch().restore(self.globals)
+        FunctionRegistry().functions = self.table
+        for function, host in self.hosts.items():
+            function.host = host
+        for data, dropped in self.dropped.items():
+            data.dropped = dropped
+
+
+# Instance whose state is installed
+_active_instance: Instance | None = None
+
+
+def switch_instance(instance: Instance | None) -> None:
+    # Puts the state of the running instance aside and installs the one of instance, or a blank state for a module
+    # about to be instantiated
+    global _active_instance
+    if instance is not None and instance is _active_instance:
+        return
+    if _active_instance is not None:
+        _active_instance.state = InstanceState.capture(_active_instance.module.expression)
+    (instance.state if instance is not None else InstanceState.blank()).install()
+    _active_instance = instance
+
+
+class ExportedFunction:
+    # Python callable for an exported function: takes and returns Python numbers (None for no result, a tuple for
+    # several results). Traps are raised as WebAssemblyException
+    name: str
+    function: FunctionExpression
+    instance: Instance | None
+
+    def __init__(self, name: str, function: FunctionExpression, instance: Instance | None = None):
+        self.name = name
+        self.function = function
+        self.instance = instance
+
+    @property
+    def parameter_types(self) -> list[NumberType]:
+        return [parameter.number_type for parameter in self.function.parameters]
+
+    @property
+    def result_types(self) -> list[NumberType]:
+        return self.function.result_types if self.function.result_types is not None else []
+
+    def __call__(self, *args: int | float) -> int | float | tuple[int | float, ...] | None:
+        if len(args) != len(self.function.parameters):
+            raise InvalidFunctionSignatureError(self.function, *args)
+        arguments: list[FixedNumber] = [FixedNumber(arg, number_type)
+                                        for arg, number_type in zip(args, self.parameter_types)]
+        if self.instance is not None:
+            switch_instance(self.instance)
+        stack: Stack = Stack()
+        stack.init()
+        self.function.invoke(stack, VariableWatch(), None, *arguments)
+        results: list[int | float] = [stack.pop().value for _ in self.result_types][::-1]
+        stack.init()
+        if len(results) == 0:
+            return None
+        if len(results) == 1:
+            return results[0]
+        return tuple(results)
+
+    async def async_call(self, *args: int | float, slice_fuel: int = DEFAULT_SLICE_FUEL) \
+            -> int | float | tuple[int | float, ...] | None:
+        # Like calling the function, but the event loop gets control back every slice_fuel units of fuel. Concurrent
+        # calls take turns, and cancelling the task stops the call at its next checkpoint. Direct calls must not run
+        # while cooperative ones are pending, since they share the interpreter state
+        if len(args) != len(self.function.parameters):
+            raise InvalidFunctionSignatureError(self.function, *args)
+        return await CooperativeCall(lambda: self(*args), slice_fuel).run()
+
+    def __repr__(self) -> str:
+        return f'<ExportedFunction "{self.name}">'
+
+
+class Exports:
+    # instance.exports.name(...), or instance.exports["name"](...) for names that aren't identifiers
+    _functions: dict[str, ExportedFunction]
+
+    def __init__(self, functions: dict[str, ExportedFunction]):
+        self._functions = functions
+
+    def __getitem__(self, name: str) -> ExportedFunction:
+        if name not in self._functions:
+            raise UnknownFunctionError(name)
+        return self._functions[name]
+
+    def __getattr__(self, name: str) -> ExportedFunction:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except UnknownFunctionError as error:
+            raise AttributeError(name) from error
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._functions
+
+    def __iter__(self):
+        return iter(self._functions)
+
+    def __len__(self) -> int:
+        return len(self._functions)
+
+
+class Instance:
+    # Made once the module has been instantiated (after switch_instance(None)): the interpreter state at that point
+    # becomes the state of the instance
+    module: Module
+    exports: Exports
+    state: InstanceState
+
+    def __init__(self, module: Module):
+        global _active_instance
+        self.module = module
+        self.exports = Exports({child.export_as: ExportedFunction(child.export_as, child, self)
+                                for child in module.expression.children
+                                if isinstance(child, FunctionExpression) and child.export_as is not None})
+        self.state = InstanceState.capture(module.expression)
+        _active_instance = self
+        shared: SharedLinearMemory | None = self.state.memory[2]
+        if shared is not None:
+            # Nothing else closes the shared memory of an instance that is no longer used
+            weakref.finalize(self, shared.close)
+
+
+class Module:
+    # A parsed and validated module. Nothing is printed or written to files: expressions that aren't implemented
+    # are listed in not_implemented
+    expression: ModuleExpression
+    not_implemented: list[str]
+
+    def __init__(self, expression: ModuleExpression, not_implemented: list[str] | None = None):
+        self.expression = expression
+        self.not_implemented = not_implemented if not_implemented is not None else []
+
+    @staticmethod
+    def from_text(text: str, name: str = '<text>', lazy: bool = False) -> Module:
+        # The text holds one module, possibly among other top-level expressions (e.g. a .wast file). With lazy, the
+        # function bodies are parsed and validated on their first call (or by validate)
+        normalized, source_map = normalize(text, name)
+        modules: list[tuple[int, str]] = [(offset, string) for offset, string in
+                                          SExpression.iterate_parentheses(normalized)
+                                          if string.startswith('(module')]
+        if len(modules) != 1:
+            raise InvalidSyntaxError(f'Expected one module in {name}, found {len(modules)}')
+        offset, string = modules[0]
+        return Module.parse(string, source_map, offset, lazy)
+
+    @staticmethod
+    def from_file(file_name: str, lazy: bool = False) -> Module:
+        with open(file_name, 'r') as input_file:
+            return Module.from_text(input_file.read(), file_name, lazy)
+
+    @staticmethod
+    def parse(expression_string: str, source_map: SourceMap | None = None, offset: int | None = None,
+              lazy: bool = False, cache: bool = True) -> Module:
+        # expression_string is a normalized (module ...) expression. Parsing leaves the interpreter state as it was:
+        # the definitions are set up on a blank state that is thrown away, and the memory and data segments aren't
+        # set up at all, so that the module is instantiated once, by instantiate
+        if cache:
+            cached: ModuleExpression | None = ParseCache().lookup(expression_string)
+            if cached is not None:
+                module: Module = Module(cached)
+                if not lazy:
+                    # The cached module may have been parsed lazily
+                    module.validate()
+                return module
+        state: InstanceState = InstanceState.capture(None)
+        exported_functions: dict[str, FunctionExpression] = EXPORTED_FUNCTIONS.copy()
+        InstanceState.blank().install()
+        Stack().init()
+        instantiater: ExpressionInstantiater = ExpressionInstantiater(source_map, lazy, instantiate=False)
+        try:
+            expression: SExpression = instantiater.create_expression(expression_string, offset=offset)
+        finally:
+            Stack().init()
+            state.install()
+            EXPORTED_FUNCTIONS.clear()
+            EXPORTED_FUNCTIONS.update(exported_functions)
+        if not isinstance(expression, ModuleExpression):
+            raise InvalidSyntaxError(f'Expected a module, found {expression.expression_name}')
+        if cache:
+            ParseCache().store(expression_string, expression)
+        return Module(expression, instantiater.not_implemented)
+
+    def validate(self) -> None:
+        # Parses and validates the function bodies that a lazy parse left for their first call
+        compile_functions(self.expression)
+
+    @property
+    def exports(self) -> list[str]:
+        return [child.export_as for child in self.expression.children
+                if isinstance(child, FunctionExpression) and child.export_as is not None]
+
+    @property
+    def imports(self) -> list[tuple[str, str]]:
+        return [(function.module_name, function.field_name) for function in imported_functions(self.expression)]
+
+    def instantiate(self, imports: dict[str, dict[str, HostFunction | Callable]] | None = None) -> Instance:
+        # imports: {module name: {field name: host function}}. Every instance has its own memory, globals, table and
+        # imports (see InstanceState)
+        switch_instance(None)
+        self.bind_imports(imports)
+        instantiate_module(self.expression)
+        return Instance(self)
+
+    def bind_imports(self, imports: dict[str, dict[str, HostFunction | Callable]] | None = None) -> None:
+        imports = imports if imports is not None else {}
+        for function in imported_functions(self.expression):
+            fields: dict[str, HostFunction | Callable] = imports.get(function.module_name, {})
+            if function.field_name not in fields:
+                raise UnknownImportError(function.module_name, function.field_name)
+            function.bind(fields[function.field_name])
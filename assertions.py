@@ -2,17 +2,25 @@ from __future__ import annotations
 
 import re
 import sys
+import time
 
 from abc import abstractmethod
-from typing import Pattern, Type
+from dataclasses import dataclass
+from typing import Generator, Pattern, Type
 
 from custom_exceptions import *
+from enums import NumberType
 from evaluations import Evaluation
 from expressions import SExpression, ModuleExpression
+from function import FunctionExpression, EXPORTED_FUNCTIONS
+from operations import ConstExpression, parse_constant, constant_matches
+from source_map import SourceMap
 from variables import VariableWatch, FixedNumber, Stack, GlobalVariableWatch
 
 
 class AssertExpression(SExpression):
+    # Exception raised while checking the assertion, if any
+    trap: WebAssemblyException | None = None
 
     @property
     def assert_operand(self) -> SExpression:
@@ -51,6 +59,7 @@ class AssertInvalidExpression(AssertExpression):
         expected_exceptions: list[Type] = [getattr(sys.modules[__name__], exception_name) for exception_name in
                                            EXCEPTION_NAMES[exception_name]]
         if self.instantiation_errors is not None:
+            self.trap = self.instantiation_errors[0]
             for error in self.instantiation_errors:
                 for e in expected_exceptions:
                     if isinstance(error, e):
@@ -86,6 +95,10 @@ class AssertReturnExpression(AssertExpression):
 
             result: FixedNumber = stack.pop()
 
+            if isinstance(result_expression, ConstExpression):
+                if not result_expression.matches(result):
+                    return False
+                continue
             result_expression.evaluate(stack, VariableWatch())
             expected_result: FixedNumber = stack.pop()
             if abs(result) != abs(expected_result):
@@ -111,9 +124,93 @@ class AssertTrapExpression(AssertExpression):
         try:
             self.assert_operand.evaluate(Stack(), VariableWatch(), GlobalVariableWatch())
         except WebAssemblyException as exception:
+            self.trap = exception
             # Check if it's the right exception
             expected_exceptions: list[Type] = [getattr(sys.modules[__name__], exception_name) for exception_name in EXCEPTION_NAMES[exception_name]]
             for e in expected_exceptions:
                 if isinstance(exception, e):
                     return True
         return False
+
+
+# assert_return of an invoke whose arguments and expected results are all constants, in normalized text
+CONSTANT_ASSERT_RETURN_REGEX: Pattern[str] = re.compile(
+    r'\(assert_return \(invoke "([^"]*)"((?: \((?:i32|i64|f32|f64)\.const [^ ()]+\))*) ?\)'
+    r'((?: \((?:i32|i64|f32|f64)\.const [^ ()]+\))*) ?\)')
+CONSTANT_REGEX: Pattern[str] = re.compile(r'\((i32|i64|f32|f64)\.const ([^ ()]+)\)')
+
+
+@dataclass
+class BatchedAssertion:
+    arguments: list[FixedNumber]
+    # Expected results with their NaN pattern
+    results: list[tuple[FixedNumber, str | None]]
+    # Position in the normalized source, for the source map
+    offset: int | None = None
+    parse_time: int = 0
+    trap: WebAssemblyException | None = None
+
+
+class AssertReturnBatch:
+    # Consecutive assert_return of constants against the same export. The constants are parsed straight from the
+    # text and the function is called in a loop, without building and validating an expression for each assertion
+    expression_name: str = 'assert_return'
+    export_name: str
+    function: FunctionExpression
+    assertions: list[BatchedAssertion]
+
+    source_map: SourceMap | None = None
+
+    def __init__(self, export_name: str, source_map: SourceMap | None = None):
+        if export_name not in EXPORTED_FUNCTIONS:
+            raise UnknownFunctionError(export_name)
+        self.export_name = export_name
+        self.function = EXPORTED_FUNCTIONS[export_name]
+        self.source_map = source_map
+        self.assertions = []
+
+    def __str__(self) -> str:
+        return self.expression_name
+
+    @staticmethod
+    def parse(expression_string: str) -> tuple[str, BatchedAssertion] | None:
+        # Export name and assertion, or None when the assertion needs the general path
+        match: re.Match[str] | None = CONSTANT_ASSERT_RETURN_REGEX.fullmatch(expression_string)
+        if match is None:
+            return None
+        try:
+            arguments: list[FixedNumber] = [FixedNumber(parse_constant(literal, NumberType(number_type)),
+                                                        NumberType(number_type))
+                                            for number_type, literal in CONSTANT_REGEX.findall(match.group(2))]
+            results: list[tuple[FixedNumber, str | None]] = [
+                (FixedNumber(parse_constant(literal, NumberType(number_type)), NumberType(number_type)),
+                 literal if literal.startswith('nan:') else None)
+                for number_type, literal in CONSTANT_REGEX.findall(match.group(3))]
+        except WebAssemblyException:
+            # Let the general path report it
+            return None
+        return match.group(1), BatchedAssertion(arguments, results)
+
+    def run(self) -> Generator[tuple[BatchedAssertion, bool, int], None, None]:
+        # Every assertion with its result and the nanoseconds it took; traps are kept in the assertion
+        stack: Stack = Stack()
+        for assertion in self.assertions:
+            stack.init()
+            start: int = time.perf_counter_ns()
+            try:
+                self.function.invoke(stack, VariableWatch(), None, *assertion.arguments)
+                asserted: bool = self.check_results(stack, assertion)
+            except WebAssemblyException as exception:
+                assertion.trap = exception
+                asserted = False
+            yield assertion, asserted, time.perf_counter_ns() - start
+
+    @staticmethod
+    def check_results(stack: Stack, assertion: BatchedAssertion) -> bool:
+        # Same as AssertReturnExpression
+        if len(assertion.results) == 0:
+            return len(stack) == 0
+        for expected, nan_pattern in reversed(assertion.results):
+            if not constant_matches(stack.pop(), expected, nan_pattern):
+                return False
+        return True
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import re
+from typing import Callable
+
+from custom_exceptions import EmptyOperandError, InvalidNumberTypeError, UnexpectedTokenError
+from enums import NumberType
+from evaluations import Evaluation
+from variables import FixedNumber, VariableWatch, Stack, Memory
+
+# Read-modify-write operations on the unsigned value in memory
+RMW_OPERATIONS: dict[str, Callable[[int, int], int]] = {
+    'add': lambda old, operand: old + operand,
+    'sub': lambda old, operand: old - operand,
+    'and': lambda old, operand: old & operand,
+    'or': lambda old, operand: old | operand,
+    'xor': lambda old, operand: old ^ operand,
+    'xchg': lambda old, operand: operand,
+}
+
+MEMORY_ARGUMENT_REGEX: re.Pattern[str] = re.compile(r'(offset|align)=(\d+|0x[0-9a-fA-F]+)')
+
+
+class AtomicEvaluation(Evaluation):
+    # Atomic instructions of the threads proposal: an i32 address followed by the operands of operand_types, either
+    # as children or taken from the stack. On a shared memory they exclude each other across processes
+    offset: int = 0
+    operand_types: list[NumberType] = None
+    produces_result: bool = True
+
+    def __init__(self, **kwargs):
+        super().__init__()
+        if self.number_type is None:
+            self.number_type = NumberType(self.expression_name[:3])
+        for child in self.children:
+            if isinstance(child, Evaluation):
+                continue
+            for argument, value in MEMORY_ARGUMENT_REGEX.findall(child.expression_name):
+                if argument == 'offset':
+                    self.offset = int(value, 0)
+            if MEMORY_ARGUMENT_REGEX.sub('', child.expression_name).strip() != '':
+                raise UnexpectedTokenError(child.expression_name)
+        self.children = [child for child in self.children if isinstance(child, Evaluation)]
+        types: list[NumberType] = [NumberType.i32] + self.operand_types
+        if len(self.children) < len(types):
+            EmptyOperandError.try_raise(len(types), Stack())
+        for child, number_type in zip(self.children, types[len(types) - len(self.children):]):
+            if child.number_type is not None and child.number_type != number_type:
+                raise InvalidNumberTypeError(FixedNumber(None, child.number_type), number_type)
+        Stack().contract(len(types))
+        if self.produces_result:
+            Stack().expand(1)
+
+    def evaluate_operands(self, stack: Stack, local_variables: VariableWatch = None,
+                          global_variables=None) -> tuple[int, list[FixedNumber]]:
+        # Effective address and operands
+        for child in self.children:
+            child.evaluate(stack, local_variables, global_variables)
+        values: list[FixedNumber] = [stack.pop() for _ in self.operand_types][::-1]
+        return stack.pop().unsigned_value + self.offset, values
+
+
+class AtomicLoadExpression(AtomicEvaluation):
+
+    def __init__(self, **kwargs):
+        self.operand_types = []
+        super().__init__()
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        index, _ = self.evaluate_operands(stack, local_variables, global_variables)
+        stack.push(Memory().atomic_load(index, self.number_type))
+
+
+class AtomicStoreExpression(AtomicEvaluation):
+    produces_result: bool = False
+
+    def __init__(self, **kwargs):
+        self.operand_types = [NumberType(self.expression_name[:3])]
+        super().__init__()
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        index, (value,) = self.evaluate_operands(stack, local_variables, global_variables)
+        Memory().atomic_store(index, value)
+
+
+class AtomicRmwExpression(AtomicEvaluation):
+    # i32.atomic.rmw.add etc.: stores the result of the operation and pushes the old value
+    # Key of RMW_OPERATIONS (functions would keep the tree from being pickled, see parallel.py)
+    operation: str = None
+
+    def __init__(self, **kwargs):
+        self.operand_types = [NumberType(self.expression_name[:3])]
+        self.operation = self.expression_name.rsplit('.', 1)[1]
+        super().__init__()
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        index, (operand,) = self.evaluate_operands(stack, local_variables, global_variables)
+        value: int = operand.unsigned_value
+        operation: Callable[[int, int], int] = RMW_OPERATIONS[self.operation]
+        stack.push(Memory().atomic_rmw(index, self.number_type, lambda old: operation(old, value)))
+
+
+class AtomicCompareExchangeExpression(AtomicEvaluation):
+
+    def __init__(self, **kwargs):
+        number_type: NumberType = NumberType(self.expression_name[:3])
+        self.operand_types = [number_type, number_type]
+        super().__init__()
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        index, (expected, replacement) = self.evaluate_operands(stack, local_variables, global_variables)
+        expected_value: int = expected.unsigned_value
+        replacement_value: int = replacement.unsigned_value
+        stack.push(Memory().atomic_rmw(index, self.number_type,
+                                       lambda old: replacement_value if old == expected_value else old))
+
+
+class AtomicWaitExpression(AtomicEvaluation):
+    # memory.atomic.wait32/wait64 (address, expected, timeout in ns): 0 "ok", 1 "not-equal", 2 "timed-out"
+    number_type: NumberType = NumberType.i32
+
+    def __init__(self, **kwargs):
+        self.operand_types = [NumberType.i32 if self.expression_name.endswith('32') else NumberType.i64,
+                              NumberType.i64]
+        super().__init__()
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        index, (expected, timeout) = self.evaluate_operands(stack, local_variables, global_variables)
+        stack.push(FixedNumber(Memory().wait(index, expected, timeout.value), NumberType.i32))
+
+
+class AtomicNotifyExpression(AtomicEvaluation):
+    # memory.atomic.notify (address, count): number of waiters woken
+    number_type: NumberType = NumberType.i32
+
+    def __init__(self, **kwargs):
+        self.operand_types = [NumberType.i32]
+        super().__init__()
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        index, (count,) = self.evaluate_operands(stack, local_variables, global_variables)
+        stack.push(FixedNumber(Memory().notify(index, count.unsigned_value), NumberType.i32))
+
+
+class AtomicFenceExpression(Evaluation):
+    # Every atomic operation takes the lock of the memory, so they are already sequentially consistent
+
+    def __init__(self, **kwargs):
+        super().__init__()
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        pass
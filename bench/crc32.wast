@@ -0,0 +1,32 @@
+;; Bitwise CRC-32 (IEEE, reflected) of $n generated bytes, kept one per i32 word
+(module
+  (memory 1)
+  (func (export "crc32") (param $n i32) (result i32)
+    (local $i i32) (local $bit i32) (local $crc i32)
+    (block $filled
+      (loop $fill
+        (br_if $filled (i32.ge_u (local.get $i) (local.get $n)))
+        (i32.store (i32.shl (local.get $i) (i32.const 2))
+          (i32.and (i32.add (i32.mul (local.get $i) (i32.const 7)) (i32.const 3)) (i32.const 255)))
+        (local.set $i (i32.add (local.get $i) (i32.const 1)))
+        (br $fill)))
+    (local.set $crc (i32.const -1))
+    (local.set $i (i32.const 0))
+    (block $done
+      (loop $bytes
+        (br_if $done (i32.ge_u (local.get $i) (local.get $n)))
+        (local.set $crc (i32.xor (local.get $crc) (i32.load (i32.shl (local.get $i) (i32.const 2)))))
+        (local.set $bit (i32.const 0))
+        (block $byte_done
+          (loop $bits
+            (br_if $byte_done (i32.ge_u (local.get $bit) (i32.const 8)))
+            ;; crc = (crc >> 1) ^ (0xEDB88320 & -(crc & 1))
+            (local.set $crc (i32.xor (i32.shr_u (local.get $crc) (i32.const 1))
+              (i32.and (i32.const 0xEDB88320) (i32.sub (i32.const 0) (i32.and (local.get $crc) (i32.const 1))))))
+            (local.set $bit (i32.add (local.get $bit) (i32.const 1)))
+            (br $bits)))
+        (local.set $i (i32.add (local.get $i) (i32.const 1)))
+        (br $bytes)))
+    (i32.xor (local.get $crc) (i32.const -1)))
+)
+(assert_return (invoke "crc32" (i32.const 256)) (i32.const 2021806649))
@@ -0,0 +1,16 @@
+;; Iterative Fibonacci modulo 2^32 (calls of a function to itself are not resolved by the interpreter yet)
+(module
+  (func $fib (export "fib") (param $n i32) (result i32)
+    (local $a i32) (local $b i32) (local $t i32) (local $i i32)
+    (local.set $b (i32.const 1))
+    (block $done
+      (loop $next
+        (br_if $done (i32.ge_u (local.get $i) (local.get $n)))
+        (local.set $t (i32.add (local.get $a) (local.get $b)))
+        (local.set $a (local.get $b))
+        (local.set $b (local.get $t))
+        (local.set $i (i32.add (local.get $i) (i32.const 1)))
+        (br $next)))
+    (local.get $a))
+)
+(assert_return (invoke "fib" (i32.const 3000)) (i32.const 993652896))
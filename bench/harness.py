@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import json
+import resource
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser, Namespace, SUPPRESS
+from glob import glob
+from os.path import abspath, basename, dirname, join, splitext
+from statistics import median
+
+BENCH_DIRECTORY: str = dirname(abspath(__file__))
+sys.path.insert(0, dirname(BENCH_DIRECTORY))
+
+from assertions import AssertExpression
+from fuel import FuelMeter
+from interpreter import read_expressions
+from variables import Stack
+
+DEFAULT_BASELINE: str = join(BENCH_DIRECTORY, 'baseline.json')
+
+
+def percentile(values: list[float], percent: float) -> float:
+    # Nearest rank, so that the result is one of the measurements
+    ordered: list[float] = sorted(values)
+    rank: int = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def run_kernel(file_name: str, repeat: int, warmup: int) -> dict:
+    # Runs in its own process, since the interpreter keeps the module state in singletons
+    assertions: list[AssertExpression] = [expression for expression in read_expressions(file_name)
+                                          if isinstance(expression, AssertExpression)]
+
+    def run() -> bool:
+        passed: bool = True
+        for assertion in assertions:
+            Stack().init()
+            passed = assertion.assert_expression() and passed
+        return passed
+
+    # One metered run counts the expressions (the fuel is only a counter here) and checks the results
+    meter: FuelMeter = FuelMeter()
+    meter.configure(fuel=sys.maxsize)
+    passed: bool = run()
+    instructions: int = meter.total_consumed
+    meter.configure()
+    for _ in range(warmup):
+        run()
+    times: list[float] = []
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    median_time: float = median(times)
+    return {
+        'passed': passed,
+        'repeat': repeat,
+        'median': median_time,
+        'p90': percentile(times, 90),
+        'p99': percentile(times, 99),
+        'min': min(times),
+        'instructions': instructions,
+        'instructions_per_second': instructions / median_time if median_time > 0 else 0.0,
+        # Kilobytes on Linux
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], threshold: float) -> list[str]:
+    regressions: list[str] = []
+    for kernel, result in results.items():
+        if kernel not in baseline:
+            continue
+        ratio: float = result['median'] / baseline[kernel]['median']
+        if ratio > 1 + threshold:
+            regressions.append(f'{kernel}: median {result["median"] * 1000:.2f} ms is {(ratio - 1) * 100:.1f}% slower '
+                               f'than the baseline ({baseline[kernel]["median"] * 1000:.2f} ms)')
+    return regressions
+
+
+def format_results(results: dict[str, dict]) -> str:
+    lines: list[str] = ['Kernel      Median (ms)   p90 (ms)   p99 (ms)   Instructions   Instr/s   Peak RSS (MB)']
+    for kernel, result in results.items():
+        lines.append(f'{kernel:<10} {result["median"] * 1000:>12.2f} {result["p90"] * 1000:>10.2f} '
+                     f'{result["p99"] * 1000:>10.2f} {result["instructions"]:>14} '
+                     f'{result["instructions_per_second"]:>9.0f} {result["peak_rss"] / 2 ** 20:>15.1f}' +
+                     ('' if result['passed'] else '   (wrong result)'))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser: ArgumentParser = ArgumentParser(description="Time the .wast kernels of the benchmark suite")
+    parser.add_argument("kernels", nargs="*",
+                        help="names of the kernels to run (default: every .wast file in bench/)")
+    parser.add_argument("--repeat", type=int, default=10, help="timed runs of every kernel (default 10)")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs before the timed ones (default 1)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="fail when a median is this much slower than the baseline (default 0.2, i.e. 20%%)")
+    parser.add_argument("--update-baseline", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--output", metavar="FILE", help="save the results as JSON")
+    # Used by the harness itself to run every kernel in a new process
+    parser.add_argument("--run-kernel", metavar="FILE", help=SUPPRESS)
+
+    args: Namespace = parser.parse_args()
+
+    if args.run_kernel is not None:
+        print(json.dumps(run_kernel(args.run_kernel, args.repeat, args.warmup)))
+        sys.exit(0)
+
+    file_names: list[str] = sorted(glob(join(BENCH_DIRECTORY, '*.wast')))
+    if len(args.kernels) > 0:
+        file_names = [join(BENCH_DIRECTORY, f'{kernel}.wast') for kernel in args.kernels]
+
+    results: dict[str, dict] = {}
+    for file_name in file_names:
+        kernel: str = splitext(basename(file_name))[0]
+        process: subprocess.CompletedProcess = subprocess.run(
+            [sys.executable, abspath(__file__), '--run-kernel', file_name, '--repeat', str(args.repeat),
+             '--warmup', str(args.warmup)], capture_output=True, text=True)
+        if process.returncode != 0:
+            print(process.stderr, file=sys.stderr)
+            raise RuntimeError(f'Kernel {kernel} failed')
+        # The interpreter may print warnings before the result
+        results[kernel] = json.loads(process.stdout.strip().splitlines()[-1])
+
+    print(format_results(results))
+
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=4)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=4)
+        print(f'Baseline saved to {args.baseline}')
+        sys.exit(0)
+
+    failed: bool = any(not result['passed'] for result in results.values())
+    try:
+        with open(args.baseline, 'r') as baseline_file:
+            regressions: list[str] = compare(results, json.load(baseline_file), args.threshold)
+    except FileNotFoundError:
+        print(f'No baseline at {args.baseline}')
+        regressions = []
+    for regression in regressions:
+        print(f'Regression: {regression}')
+    sys.exit(1 if failed or len(regressions) > 0 else 0)
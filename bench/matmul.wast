@@ -0,0 +1,54 @@
+;; Product of two $n x $n i32 matrices, A[i][j] = i + j and B[i][j] = i - j, returning the sum of the result
+(module
+  (memory 1)
+  ;; Address of element (i, j) of the matrix starting at $base
+  (func $address (param $base i32) (param $n i32) (param $i i32) (param $j i32) (result i32)
+    (i32.add (local.get $base)
+      (i32.shl (i32.add (i32.mul (local.get $i) (local.get $n)) (local.get $j)) (i32.const 2))))
+  (func (export "matmul") (param $n i32) (result i32)
+    (local $i i32) (local $j i32) (local $k i32) (local $acc i32) (local $sum i32)
+    (local $a i32) (local $b i32) (local $c i32)
+    (local.set $b (i32.shl (i32.mul (local.get $n) (local.get $n)) (i32.const 2)))
+    (local.set $c (i32.shl (local.get $b) (i32.const 1)))
+    (block $filled
+      (loop $rows
+        (br_if $filled (i32.ge_u (local.get $i) (local.get $n)))
+        (local.set $j (i32.const 0))
+        (block $row_filled
+          (loop $columns
+            (br_if $row_filled (i32.ge_u (local.get $j) (local.get $n)))
+            (i32.store (call $address (local.get $a) (local.get $n) (local.get $i) (local.get $j))
+              (i32.add (local.get $i) (local.get $j)))
+            (i32.store (call $address (local.get $b) (local.get $n) (local.get $i) (local.get $j))
+              (i32.sub (local.get $i) (local.get $j)))
+            (local.set $j (i32.add (local.get $j) (i32.const 1)))
+            (br $columns)))
+        (local.set $i (i32.add (local.get $i) (i32.const 1)))
+        (br $rows)))
+    (local.set $i (i32.const 0))
+    (block $multiplied
+      (loop $result_rows
+        (br_if $multiplied (i32.ge_u (local.get $i) (local.get $n)))
+        (local.set $j (i32.const 0))
+        (block $row_multiplied
+          (loop $result_columns
+            (br_if $row_multiplied (i32.ge_u (local.get $j) (local.get $n)))
+            (local.set $acc (i32.const 0))
+            (local.set $k (i32.const 0))
+            (block $dot_done
+              (loop $dot
+                (br_if $dot_done (i32.ge_u (local.get $k) (local.get $n)))
+                (local.set $acc (i32.add (local.get $acc)
+                  (i32.mul (i32.load (call $address (local.get $a) (local.get $n) (local.get $i) (local.get $k)))
+                           (i32.load (call $address (local.get $b) (local.get $n) (local.get $k) (local.get $j))))))
+                (local.set $k (i32.add (local.get $k) (i32.const 1)))
+                (br $dot)))
+            (i32.store (call $address (local.get $c) (local.get $n) (local.get $i) (local.get $j)) (local.get $acc))
+            (local.set $sum (i32.add (local.get $sum) (local.get $acc)))
+            (local.set $j (i32.add (local.get $j) (i32.const 1)))
+            (br $result_columns)))
+        (local.set $i (i32.add (local.get $i) (i32.const 1)))
+        (br $result_rows)))
+    (local.get $sum))
+)
+(assert_return (invoke "matmul" (i32.const 10)) (i32.const 8250))
@@ -0,0 +1,35 @@
+;; Word by word copy of $n i32 values to a second buffer, returning a checksum of the copy
+(module
+  (memory 1)
+  ;; Returns the number of bytes copied
+  (func $memcpy (param $destination i32) (param $source i32) (param $length i32) (result i32)
+    (local $offset i32)
+    (block $copied
+      (loop $copy
+        (br_if $copied (i32.ge_u (local.get $offset) (local.get $length)))
+        (i32.store (i32.add (local.get $destination) (local.get $offset))
+          (i32.load (i32.add (local.get $source) (local.get $offset))))
+        (local.set $offset (i32.add (local.get $offset) (i32.const 4)))
+        (br $copy)))
+    (local.get $offset))
+  (func (export "memcpy") (param $n i32) (result i32)
+    (local $i i32) (local $length i32) (local $checksum i32)
+    (local.set $length (i32.shl (local.get $n) (i32.const 2)))
+    (block $filled
+      (loop $fill
+        (br_if $filled (i32.ge_u (local.get $i) (local.get $length)))
+        (i32.store (local.get $i) (i32.xor (local.get $i) (i32.const 0x5a5a5a5a)))
+        (local.set $i (i32.add (local.get $i) (i32.const 4)))
+        (br $fill)))
+    (drop (call $memcpy (local.get $length) (i32.const 0) (local.get $length)))
+    (local.set $i (i32.const 0))
+    (block $checked
+      (loop $check
+        (br_if $checked (i32.ge_u (local.get $i) (local.get $length)))
+        (local.set $checksum (i32.add (i32.rotl (local.get $checksum) (i32.const 5))
+          (i32.load (i32.add (local.get $length) (local.get $i)))))
+        (local.set $i (i32.add (local.get $i) (i32.const 4)))
+        (br $check)))
+    (local.get $checksum))
+)
+(assert_return (invoke "memcpy" (i32.const 1024)) (i32.const -925003040))
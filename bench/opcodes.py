@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import json
+import sys
+import time
+from argparse import ArgumentParser, Namespace
+from dataclasses import dataclass, asdict
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from custom_exceptions import WebAssemblyException
+from expressions import ModuleExpression
+from instantiate import ExpressionInstantiater, lookup_class_name
+from optimizer import Optimizer
+from superinstructions import Fuser
+from variables import Stack, VariableWatch
+
+INTEGER_TYPES: tuple[str, ...] = ('i32', 'i64')
+FLOAT_TYPES: tuple[str, ...] = ('f32', 'f64')
+
+# Operand values that don't trap for any instruction (divisions, truncations)
+OPERAND_VALUES: dict[str, str] = {'i32': '7', 'i64': '7', 'f32': '7.5', 'f64': '7.5'}
+
+
+def numeric_instructions() -> dict[str, tuple[str, ...]]:
+    # Every numeric instruction of WebAssembly with the types of its operands
+    instructions: dict[str, tuple[str, ...]] = {}
+    for number_type in INTEGER_TYPES:
+        for operation in ('add', 'sub', 'mul', 'div_s', 'div_u', 'rem_s', 'rem_u', 'and', 'or', 'xor', 'shl', 'shr_s',
+                          'shr_u', 'rotl', 'rotr', 'eq', 'ne', 'lt_s', 'lt_u', 'gt_s', 'gt_u', 'le_s', 'le_u', 'ge_s',
+                          'ge_u'):
+            instructions[f'{number_type}.{operation}'] = (number_type, number_type)
+        for operation in ('clz', 'ctz', 'popcnt', 'eqz', 'extend8_s', 'extend16_s'):
+            instructions[f'{number_type}.{operation}'] = (number_type,)
+        for float_type in FLOAT_TYPES:
+            for operation in ('trunc', 'trunc_sat'):
+                for sign in ('s', 'u'):
+                    instructions[f'{number_type}.{operation}_{float_type}_{sign}'] = (float_type,)
+    instructions['i64.extend32_s'] = ('i64',)
+    instructions['i32.wrap_i64'] = ('i64',)
+    instructions['i64.extend_i32_s'] = ('i32',)
+    instructions['i64.extend_i32_u'] = ('i32',)
+    instructions['i32.reinterpret_f32'] = ('f32',)
+    instructions['i64.reinterpret_f64'] = ('f64',)
+    for number_type in FLOAT_TYPES:
+        for operation in ('add', 'sub', 'mul', 'div', 'min', 'max', 'copysign', 'eq', 'ne', 'lt', 'gt', 'le', 'ge'):
+            instructions[f'{number_type}.{operation}'] = (number_type, number_type)
+        for operation in ('abs', 'neg', 'ceil', 'floor', 'trunc', 'nearest', 'sqrt'):
+            instructions[f'{number_type}.{operation}'] = (number_type,)
+        for integer_type in INTEGER_TYPES:
+            for sign in ('s', 'u'):
+                instructions[f'{number_type}.convert_{integer_type}_{sign}'] = (integer_type,)
+    instructions['f32.demote_f64'] = ('f64',)
+    instructions['f64.promote_f32'] = ('f32',)
+    instructions['f32.reinterpret_i32'] = ('i32',)
+    instructions['f64.reinterpret_i64'] = ('i64',)
+    return instructions
+
+
+def benchmark_bodies() -> dict[str, str]:
+    # The expression run by every iteration of the loop, for each implemented instruction
+    bodies: dict[str, str] = {}
+    for number_type in INTEGER_TYPES + FLOAT_TYPES:
+        if lookup_class_name(f'{number_type}.const') is not None:
+            bodies[f'{number_type}.const'] = f'(drop ({number_type}.const {OPERAND_VALUES[number_type]}))'
+    for instruction, operand_types in numeric_instructions().items():
+        if lookup_class_name(instruction) is None:
+            continue
+        operands: str = ' '.join(f'(local.get $v_{operand_type})' for operand_type in operand_types)
+        bodies[instruction] = f'(drop ({instruction} {operands}))'
+    bodies['local.get'] = '(drop (local.get $v_i32))'
+    bodies['local.set'] = '(local.set $v_i32 (local.get $v_i32))'
+    bodies['local.tee'] = '(drop (local.tee $v_i32 (local.get $v_i32)))'
+    bodies['select'] = '(drop (select (local.get $v_i32) (local.get $v_i32) (local.get $v_i32)))'
+    bodies['i32.load'] = '(drop (i32.load (i32.const 64)))'
+    bodies['i32.store'] = '(i32.store (i32.const 64) (local.get $v_i32))'
+    bodies['i64.load'] = '(drop (i64.load (i32.const 64)))'
+    bodies['i64.store'] = '(i64.store (i32.const 64) (local.get $v_i64))'
+    bodies['block'] = '(block $inner (nop))'
+    bodies['br_if'] = '(block $inner (br_if $inner (local.get $v_i32)))'
+    bodies['if'] = '(if (local.get $v_i32) (then (nop)) (else (nop)))'
+    bodies['call'] = '(drop (call $identity (local.get $v_i32)))'
+    return bodies
+
+
+def module_text(body: str, unroll: int) -> str:
+    # Already normalized: one line, single spaces. The body is repeated so that it outweighs the loop around it.
+    # (memory) is left out: the memory singleton starts with a page, which is enough for the loads and stores
+    initializers: str = ' '.join(f'(local.set $v_{number_type} ({number_type}.const {OPERAND_VALUES[number_type]}))'
+                                 for number_type in INTEGER_TYPES + FLOAT_TYPES)
+    return ('(module '
+            '(func $identity (param $x i32) (result i32) (local.get $x)) '
+            '(func (export "run") (param $n i32) (result i32) '
+            '(local $i i32) (local $v_i32 i32) (local $v_i64 i64) (local $v_f32 f32) (local $v_f64 f64) '
+            f'{initializers} '
+            '(block $done (loop $next '
+            '(br_if $done (i32.ge_u (local.get $i) (local.get $n))) '
+            f'{" ".join([body] * unroll)} '
+            '(local.set $i (i32.add (local.get $i) (i32.const 1))) '
+            '(br $next))) '
+            '(local.get $i)))')
+
+
+@dataclass
+class OpcodeTiming:
+    instruction: str
+    # Nanoseconds per execution, without the cost of the loop around it (measured with nop in place of the body)
+    nanoseconds: float
+    executions: int
+
+
+def time_module(text: str, iterations: int, repeat: int, optimize: bool, fuser: Fuser | None) -> float:
+    Stack().init()
+    module: ModuleExpression = ExpressionInstantiater().create_expression(text)
+    if optimize:
+        Optimizer().optimize_module(module)
+    if fuser is not None:
+        fuser.fuse_module(module)
+    Stack().init()
+    invoke = ExpressionInstantiater().create_expression(f'(invoke "run" (i32.const {iterations}))')
+    best: float = float('inf')
+    for _ in range(repeat):
+        Stack().init()
+        start: float = time.perf_counter()
+        invoke.evaluate(Stack(), VariableWatch())
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(iterations: int, repeat: int, unroll: int, selected: list[str], optimize: bool, fuser: Fuser | None) \
+        -> tuple[list[OpcodeTiming], dict[str, str]]:
+    # Timings, and the instructions that couldn't be run with the reason
+    bodies: dict[str, str] = benchmark_bodies()
+    loop_time: float = time_module(module_text('(nop)', unroll), iterations, repeat, optimize, fuser)
+    timings: list[OpcodeTiming] = []
+    skipped: dict[str, str] = {}
+    for instruction, body in bodies.items():
+        if len(selected) > 0 and instruction not in selected:
+            continue
+        try:
+            elapsed: float = time_module(module_text(body, unroll), iterations, repeat, optimize, fuser)
+        except WebAssemblyException as error:
+            skipped[instruction] = f'{error.__class__.__name__}: {error}'
+            continue
+        timings.append(OpcodeTiming(instruction, (elapsed - loop_time) / (iterations * unroll) * 1e9,
+                                    iterations * unroll))
+    return timings, skipped
+
+
+def format_timings(timings: list[OpcodeTiming], previous: dict[str, float] | None = None) -> str:
+    lines: list[str] = ['Instruction                  ns/exec' + ('   previous   change' if previous else '')]
+    for timing in sorted(timings, key=lambda timing: timing.nanoseconds, reverse=True):
+        line: str = f'{timing.instruction:<25} {timing.nanoseconds:>10.0f}'
+        if previous is not None and timing.instruction in previous and previous[timing.instruction] > 0:
+            change: float = timing.nanoseconds / previous[timing.instruction] - 1
+            line += f' {previous[timing.instruction]:>10.0f} {change * 100:>+7.1f}%'
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser: ArgumentParser = ArgumentParser(
+        description="Time every implemented instruction in a loop, per numeric type")
+    parser.add_argument("instructions", nargs="*", help="only time these instructions (e.g. i32.shr_u)")
+    parser.add_argument("--iterations", type=int, default=100, help="loop iterations per measurement (default 100)")
+    parser.add_argument("--repeat", type=int, default=5, help="measurements per instruction, the best is kept")
+    parser.add_argument("--unroll", type=int, default=10, help="copies of the instruction per iteration (default 10)")
+    parser.add_argument("--optimize", action="store_true", help="run the optimizer on every module first")
+    parser.add_argument("--superinstructions", action="store_true", help="fuse all the superinstructions first")
+    parser.add_argument("--output", metavar="FILE", help="save the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="show the change against results saved with --output")
+
+    args: Namespace = parser.parse_args()
+
+    timings, skipped = run(args.iterations, args.repeat, args.unroll, args.instructions, args.optimize,
+                           Fuser() if args.superinstructions else None)
+    previous: dict[str, float] | None = None
+    if args.compare is not None:
+        with open(args.compare, 'r') as previous_file:
+            previous = {entry['instruction']: entry['nanoseconds'] for entry in json.load(previous_file)['timings']}
+    print(format_timings(timings, previous))
+    for instruction, reason in skipped.items():
+        print(f'Skipped {instruction}: {reason}')
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump({
+                'optimize': args.optimize,
+                'superinstructions': args.superinstructions,
+                'timings': [asdict(timing) for timing in timings],
+                'skipped': skipped,
+            }, output_file, indent=4)
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import json
+import math
+import sys
+import time
+from argparse import ArgumentParser, Namespace
+from dataclasses import dataclass, asdict
+from glob import glob
+from os.path import abspath, basename, dirname, join
+
+BENCH_DIRECTORY: str = dirname(abspath(__file__))
+ROOT_DIRECTORY: str = dirname(BENCH_DIRECTORY)
+sys.path.insert(0, ROOT_DIRECTORY)
+
+from expressions import SExpression
+from instantiate import ExpressionInstantiater
+from module_cache import ModuleCache, cacheable
+from source_map import normalize
+from variables import Stack
+
+DEFAULT_BASELINE: str = join(BENCH_DIRECTORY, 'parsing_baseline.json')
+
+
+@dataclass
+class LoadTimes:
+    name: str
+    size: int
+    # Seconds spent in each phase: removing comments and whitespace, splitting the top-level expressions, building
+    # the expression trees, type checking the instructions and setting up the modules
+    tokenize: float = 0.0
+    split: float = 0.0
+    build: float = 0.0
+    validate: float = 0.0
+    instantiate: float = 0.0
+
+    @property
+    def total(self) -> float:
+        return self.tokenize + self.split + self.build + self.validate + self.instantiate
+
+    @property
+    def throughput(self) -> float:
+        # MB/s
+        return self.size / 2 ** 20 / self.total if self.total > 0 else 0.0
+
+
+def measure(text: str, name: str, cache: ModuleCache | None = None) -> LoadTimes:
+    # With a cache, modules seen before only count their instantiation
+    times: LoadTimes = LoadTimes(name, len(text.encode()))
+    start: int = time.perf_counter_ns()
+    normalized, source_map = normalize(text, name)
+    times.tokenize = (time.perf_counter_ns() - start) / 1e9
+    start = time.perf_counter_ns()
+    pieces: list[tuple[int, str]] = list(SExpression.iterate_parentheses(normalized))
+    times.split = (time.perf_counter_ns() - start) / 1e9
+    for offset, string in pieces:
+        Stack().init()
+        if cache is not None and cacheable(string):
+            start = time.perf_counter_ns()
+            if cache.lookup(string) is not None:
+                times.instantiate += (time.perf_counter_ns() - start) / 1e9
+                continue
+        instantiater: ExpressionInstantiater = ExpressionInstantiater(source_map)
+        start = time.perf_counter_ns()
+        expression: SExpression = instantiater.create_expression(string, offset=offset)
+        elapsed: int = time.perf_counter_ns() - start
+        if cache is not None and cacheable(string):
+            cache.store(string, expression)
+        times.build += (elapsed - instantiater.validate_time - instantiater.instantiate_time) / 1e9
+        times.validate += instantiater.validate_time / 1e9
+        times.instantiate += instantiater.instantiate_time / 1e9
+    Stack().init()
+    return times
+
+
+def synthetic_text(sources: list[str], size: int) -> str:
+    # The bundled files one after the other, as many times as needed to reach the size (in bytes)
+    chunk: str = '\n'.join(sources) + '\n'
+    return chunk * max(1, round(size / len(chunk.encode())))
+
+
+def scaling_exponents(times: list[LoadTimes]) -> list[tuple[str, str, float]]:
+    # Slope of log(time) against log(size) between consecutive sizes: 1 is linear
+    exponents: list[tuple[str, str, float]] = []
+    for smaller, larger in zip(times, times[1:]):
+        exponent: float = math.log(larger.total / smaller.total) / math.log(larger.size / smaller.size)
+        exponents.append((smaller.name, larger.name, exponent))
+    return exponents
+
+
+def format_times(times: list[LoadTimes]) -> str:
+    lines: list[str] = ['File                                   Size (KB)  Tokenize  Split    Build  Validate  Instantiate'
+                        '    MB/s']
+    for entry in times:
+        lines.append(f'{entry.name:<38} {entry.size / 1024:>10.0f} {entry.tokenize * 1000:>9.1f} '
+                     f'{entry.split * 1000:>6.1f} {entry.build * 1000:>8.1f} {entry.validate * 1000:>9.1f} '
+                     f'{entry.instantiate * 1000:>12.1f} {entry.throughput:>7.2f}')
+    lines.append('(phase times in ms)')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser: ArgumentParser = ArgumentParser(
+        description="Measure how fast .wast files are tokenized, built, validated and instantiated")
+    parser.add_argument("--sizes", default="10,100",
+                        help="sizes of the synthetic files in MB, comma separated (default 10,100)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="fail when the MB/s of a file drops by more than this (default 0.2, i.e. 20%%)")
+    parser.add_argument("--max-exponent", type=float, default=1.15,
+                        help="fail when load time grows faster than size^EXPONENT (default 1.15)")
+    parser.add_argument("--update-baseline", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--output", metavar="FILE", help="save the results as JSON")
+    parser.add_argument("--module-cache", action="store_true",
+                        help="load through the module cache, so repeated modules are only instantiated")
+
+    args: Namespace = parser.parse_args()
+
+    sources: dict[str, str] = {}
+    for file_name in sorted(glob(join(ROOT_DIRECTORY, 'wasm', '*.wast'))):
+        with open(file_name, 'r') as source_file:
+            sources[basename(file_name)] = source_file.read()
+
+    def cache() -> ModuleCache | None:
+        # Every file starts with an empty cache
+        if not args.module_cache:
+            return None
+        ModuleCache().clear()
+        return ModuleCache()
+
+    times: list[LoadTimes] = [measure(text, name, cache()) for name, text in sources.items()]
+    synthetic_times: list[LoadTimes] = []
+    for size in sorted(float(size) for size in args.sizes.split(',') if size):
+        synthetic_times.append(measure(synthetic_text(list(sources.values()), int(size * 2 ** 20)),
+                                       f'synthetic-{size:g}MB', cache()))
+    print(format_times(times + synthetic_times))
+
+    results: dict = {
+        'files': {entry.name: asdict(entry) | {'throughput': entry.throughput} for entry in times + synthetic_times},
+        'scaling': [{'from': smaller, 'to': larger, 'exponent': exponent}
+                    for smaller, larger, exponent in scaling_exponents(synthetic_times)],
+    }
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=4)
+    if args.update_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=4)
+        print(f'Baseline saved to {args.baseline}')
+        sys.exit(0)
+
+    failures: list[str] = []
+    for smaller, larger, exponent in scaling_exponents(synthetic_times):
+        print(f'Scaling {smaller} -> {larger}: time grows as size^{exponent:.2f}')
+        if exponent > args.max_exponent:
+            failures.append(f'load time of {larger} grows as size^{exponent:.2f} (more than {args.max_exponent})')
+    try:
+        with open(args.baseline, 'r') as baseline_file:
+            baseline: dict = json.load(baseline_file)['files']
+    except FileNotFoundError:
+        print(f'No baseline at {args.baseline}')
+        baseline = {}
+    for entry in times + synthetic_times:
+        if entry.name in baseline and entry.throughput < baseline[entry.name]['throughput'] * (1 - args.threshold):
+            failures.append(f'{entry.name}: {entry.throughput:.2f} MB/s, baseline '
+                            f'{baseline[entry.name]["throughput"]:.2f} MB/s')
+    for failure in failures:
+        print(f'Regression: {failure}')
+    sys.exit(1 if len(failures) > 0 else 0)
@@ -0,0 +1,147 @@
+;; SHA-256 compression (64 rounds) of the padded message "abc", repeated $blocks times, returning the first word
+;; of the digest
+(module
+  (memory 1)
+  ;; Round constants at 256, message schedule at 0
+  (func $constants
+    (i32.store (i32.const 256) (i32.const 0x428a2f98))
+    (i32.store (i32.const 260) (i32.const 0x71374491))
+    (i32.store (i32.const 264) (i32.const 0xb5c0fbcf))
+    (i32.store (i32.const 268) (i32.const 0xe9b5dba5))
+    (i32.store (i32.const 272) (i32.const 0x3956c25b))
+    (i32.store (i32.const 276) (i32.const 0x59f111f1))
+    (i32.store (i32.const 280) (i32.const 0x923f82a4))
+    (i32.store (i32.const 284) (i32.const 0xab1c5ed5))
+    (i32.store (i32.const 288) (i32.const 0xd807aa98))
+    (i32.store (i32.const 292) (i32.const 0x12835b01))
+    (i32.store (i32.const 296) (i32.const 0x243185be))
+    (i32.store (i32.const 300) (i32.const 0x550c7dc3))
+    (i32.store (i32.const 304) (i32.const 0x72be5d74))
+    (i32.store (i32.const 308) (i32.const 0x80deb1fe))
+    (i32.store (i32.const 312) (i32.const 0x9bdc06a7))
+    (i32.store (i32.const 316) (i32.const 0xc19bf174))
+    (i32.store (i32.const 320) (i32.const 0xe49b69c1))
+    (i32.store (i32.const 324) (i32.const 0xefbe4786))
+    (i32.store (i32.const 328) (i32.const 0x0fc19dc6))
+    (i32.store (i32.const 332) (i32.const 0x240ca1cc))
+    (i32.store (i32.const 336) (i32.const 0x2de92c6f))
+    (i32.store (i32.const 340) (i32.const 0x4a7484aa))
+    (i32.store (i32.const 344) (i32.const 0x5cb0a9dc))
+    (i32.store (i32.const 348) (i32.const 0x76f988da))
+    (i32.store (i32.const 352) (i32.const 0x983e5152))
+    (i32.store (i32.const 356) (i32.const 0xa831c66d))
+    (i32.store (i32.const 360) (i32.const 0xb00327c8))
+    (i32.store (i32.const 364) (i32.const 0xbf597fc7))
+    (i32.store (i32.const 368) (i32.const 0xc6e00bf3))
+    (i32.store (i32.const 372) (i32.const 0xd5a79147))
+    (i32.store (i32.const 376) (i32.const 0x06ca6351))
+    (i32.store (i32.const 380) (i32.const 0x14292967))
+    (i32.store (i32.const 384) (i32.const 0x27b70a85))
+    (i32.store (i32.const 388) (i32.const 0x2e1b2138))
+    (i32.store (i32.const 392) (i32.const 0x4d2c6dfc))
+    (i32.store (i32.const 396) (i32.const 0x53380d13))
+    (i32.store (i32.const 400) (i32.const 0x650a7354))
+    (i32.store (i32.const 404) (i32.const 0x766a0abb))
+    (i32.store (i32.const 408) (i32.const 0x81c2c92e))
+    (i32.store (i32.const 412) (i32.const 0x92722c85))
+    (i32.store (i32.const 416) (i32.const 0xa2bfe8a1))
+    (i32.store (i32.const 420) (i32.const 0xa81a664b))
+    (i32.store (i32.const 424) (i32.const 0xc24b8b70))
+    (i32.store (i32.const 428) (i32.const 0xc76c51a3))
+    (i32.store (i32.const 432) (i32.const 0xd192e819))
+    (i32.store (i32.const 436) (i32.const 0xd6990624))
+    (i32.store (i32.const 440) (i32.const 0xf40e3585))
+    (i32.store (i32.const 444) (i32.const 0x106aa070))
+    (i32.store (i32.const 448) (i32.const 0x19a4c116))
+    (i32.store (i32.const 452) (i32.const 0x1e376c08))
+    (i32.store (i32.const 456) (i32.const 0x2748774c))
+    (i32.store (i32.const 460) (i32.const 0x34b0bcb5))
+    (i32.store (i32.const 464) (i32.const 0x391c0cb3))
+    (i32.store (i32.const 468) (i32.const 0x4ed8aa4a))
+    (i32.store (i32.const 472) (i32.const 0x5b9cca4f))
+    (i32.store (i32.const 476) (i32.const 0x682e6ff3))
+    (i32.store (i32.const 480) (i32.const 0x748f82ee))
+    (i32.store (i32.const 484) (i32.const 0x78a5636f))
+    (i32.store (i32.const 488) (i32.const 0x84c87814))
+    (i32.store (i32.const 492) (i32.const 0x8cc70208))
+    (i32.store (i32.const 496) (i32.const 0x90befffa))
+    (i32.store (i32.const 500) (i32.const 0xa4506ceb))
+    (i32.store (i32.const 504) (i32.const 0xbef9a3f7))
+    (i32.store (i32.const 508) (i32.const 0xc67178f2)))
+  (func $word (param $index i32) (result i32)
+    (i32.load (i32.shl (local.get $index) (i32.const 2))))
+  (func $constant (param $index i32) (result i32)
+    (i32.load (i32.add (i32.const 256) (i32.shl (local.get $index) (i32.const 2)))))
+  (func (export "sha256") (param $blocks i32) (result i32)
+    (local $t i32) (local $x i32) (local $s0 i32) (local $s1 i32) (local $t1 i32) (local $t2 i32) (local $result i32)
+    (local $a i32) (local $b i32) (local $c i32) (local $d i32) (local $e i32) (local $f i32) (local $g i32) (local $h i32)
+    (call $constants)
+    (block $all_done
+      (loop $block
+        (br_if $all_done (i32.eqz (local.get $blocks)))
+        ;; "abc" followed by the padding and the length in bits
+        (i32.store (i32.const 0) (i32.const 0x61626380))
+        (local.set $t (i32.const 1))
+        (block $padded
+          (loop $pad
+            (br_if $padded (i32.ge_u (local.get $t) (i32.const 15)))
+            (i32.store (i32.shl (local.get $t) (i32.const 2)) (i32.const 0))
+            (local.set $t (i32.add (local.get $t) (i32.const 1)))
+            (br $pad)))
+        (i32.store (i32.const 60) (i32.const 24))
+        (local.set $t (i32.const 16))
+        (block $scheduled
+          (loop $schedule
+            (br_if $scheduled (i32.ge_u (local.get $t) (i32.const 64)))
+            (local.set $x (call $word (i32.sub (local.get $t) (i32.const 15))))
+            (local.set $s0 (i32.xor (i32.xor (i32.rotr (local.get $x) (i32.const 7)) (i32.rotr (local.get $x) (i32.const 18)))
+                                    (i32.shr_u (local.get $x) (i32.const 3))))
+            (local.set $x (call $word (i32.sub (local.get $t) (i32.const 2))))
+            (local.set $s1 (i32.xor (i32.xor (i32.rotr (local.get $x) (i32.const 17)) (i32.rotr (local.get $x) (i32.const 19)))
+                                    (i32.shr_u (local.get $x) (i32.const 10))))
+            (i32.store (i32.shl (local.get $t) (i32.const 2))
+              (i32.add (i32.add (call $word (i32.sub (local.get $t) (i32.const 16))) (local.get $s0))
+                       (i32.add (call $word (i32.sub (local.get $t) (i32.const 7))) (local.get $s1))))
+            (local.set $t (i32.add (local.get $t) (i32.const 1)))
+            (br $schedule)))
+        (local.set $a (i32.const 0x6a09e667))
+        (local.set $b (i32.const 0xbb67ae85))
+        (local.set $c (i32.const 0x3c6ef372))
+        (local.set $d (i32.const 0xa54ff53a))
+        (local.set $e (i32.const 0x510e527f))
+        (local.set $f (i32.const 0x9b05688c))
+        (local.set $g (i32.const 0x1f83d9ab))
+        (local.set $h (i32.const 0x5be0cd19))
+        (local.set $t (i32.const 0))
+        (block $compressed
+          (loop $round
+            (br_if $compressed (i32.ge_u (local.get $t) (i32.const 64)))
+            ;; t1 = h + S1(e) + ch(e, f, g) + k[t] + w[t]
+            (local.set $s1 (i32.xor (i32.xor (i32.rotr (local.get $e) (i32.const 6)) (i32.rotr (local.get $e) (i32.const 11)))
+                                    (i32.rotr (local.get $e) (i32.const 25))))
+            (local.set $t1 (i32.add (i32.add (i32.add (local.get $h) (local.get $s1))
+                                             (i32.xor (i32.and (local.get $e) (local.get $f))
+                                                      (i32.and (i32.xor (local.get $e) (i32.const -1)) (local.get $g))))
+                                    (i32.add (call $constant (local.get $t)) (call $word (local.get $t)))))
+            ;; t2 = S0(a) + maj(a, b, c)
+            (local.set $s0 (i32.xor (i32.xor (i32.rotr (local.get $a) (i32.const 2)) (i32.rotr (local.get $a) (i32.const 13)))
+                                    (i32.rotr (local.get $a) (i32.const 22))))
+            (local.set $t2 (i32.add (local.get $s0)
+                                    (i32.xor (i32.xor (i32.and (local.get $a) (local.get $b)) (i32.and (local.get $a) (local.get $c)))
+                                             (i32.and (local.get $b) (local.get $c)))))
+            (local.set $h (local.get $g))
+            (local.set $g (local.get $f))
+            (local.set $f (local.get $e))
+            (local.set $e (i32.add (local.get $d) (local.get $t1)))
+            (local.set $d (local.get $c))
+            (local.set $c (local.get $b))
+            (local.set $b (local.get $a))
+            (local.set $a (i32.add (local.get $t1) (local.get $t2)))
+            (local.set $t (i32.add (local.get $t) (i32.const 1)))
+            (br $round)))
+        (local.set $result (i32.add (local.get $a) (i32.const 0x6a09e667)))
+        (local.set $blocks (i32.sub (local.get $blocks) (i32.const 1)))
+        (br $block)))
+    (local.get $result))
+)
+(assert_return (invoke "sha256" (i32.const 4)) (i32.const 0xba7816bf))
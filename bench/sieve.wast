@@ -0,0 +1,38 @@
+;; Sieve of Eratosthenes over one i32 flag per number, returning the number of primes below $n
+(module
+  (memory 1)
+  (func (export "sieve") (param $n i32) (result i32)
+    (local $i i32) (local $j i32) (local $count i32)
+    ;; Every number from 2 on is a candidate
+    (local.set $i (i32.const 2))
+    (block $filled
+      (loop $fill
+        (br_if $filled (i32.ge_u (local.get $i) (local.get $n)))
+        (i32.store (i32.shl (local.get $i) (i32.const 2)) (i32.const 1))
+        (local.set $i (i32.add (local.get $i) (i32.const 1)))
+        (br $fill)))
+    (local.set $i (i32.const 2))
+    (block $sieved
+      (loop $outer
+        (br_if $sieved (i32.gt_u (i32.mul (local.get $i) (local.get $i)) (local.get $n)))
+        (if (i32.load (i32.shl (local.get $i) (i32.const 2)))
+          (then
+            (local.set $j (i32.mul (local.get $i) (local.get $i)))
+            (block $crossed
+              (loop $inner
+                (br_if $crossed (i32.ge_u (local.get $j) (local.get $n)))
+                (i32.store (i32.shl (local.get $j) (i32.const 2)) (i32.const 0))
+                (local.set $j (i32.add (local.get $j) (local.get $i)))
+                (br $inner)))))
+        (local.set $i (i32.add (local.get $i) (i32.const 1)))
+        (br $outer)))
+    (local.set $i (i32.const 2))
+    (block $counted
+      (loop $tally
+        (br_if $counted (i32.ge_u (local.get $i) (local.get $n)))
+        (local.set $count (i32.add (local.get $count) (i32.load (i32.shl (local.get $i) (i32.const 2)))))
+        (local.set $i (i32.add (local.get $i) (i32.const 1)))
+        (br $tally)))
+    (local.get $count))
+)
+(assert_return (invoke "sieve" (i32.const 2000)) (i32.const 303))
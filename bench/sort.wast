@@ -0,0 +1,42 @@
+;; Insertion sort of $n pseudo-random i32 values (linear congruential generator), returning sum(i * a[i])
+(module
+  (memory 1)
+  (func (export "sort") (param $n i32) (result i32)
+    (local $i i32) (local $j i32) (local $seed i32) (local $key i32) (local $sum i32)
+    (local.set $seed (i32.const 12345))
+    (block $filled
+      (loop $fill
+        (br_if $filled (i32.ge_u (local.get $i) (local.get $n)))
+        (local.set $seed (i32.add (i32.mul (local.get $seed) (i32.const 1103515245)) (i32.const 12345)))
+        (i32.store (i32.shl (local.get $i) (i32.const 2)) (i32.shr_u (local.get $seed) (i32.const 16)))
+        (local.set $i (i32.add (local.get $i) (i32.const 1)))
+        (br $fill)))
+    (local.set $i (i32.const 1))
+    (block $sorted
+      (loop $outer
+        (br_if $sorted (i32.ge_u (local.get $i) (local.get $n)))
+        (local.set $key (i32.load (i32.shl (local.get $i) (i32.const 2))))
+        (local.set $j (local.get $i))
+        (block $placed
+          (loop $shift
+            (br_if $placed (i32.eqz (local.get $j)))
+            (br_if $placed (i32.le_s (i32.load (i32.shl (i32.sub (local.get $j) (i32.const 1)) (i32.const 2)))
+                                     (local.get $key)))
+            (i32.store (i32.shl (local.get $j) (i32.const 2))
+              (i32.load (i32.shl (i32.sub (local.get $j) (i32.const 1)) (i32.const 2))))
+            (local.set $j (i32.sub (local.get $j) (i32.const 1)))
+            (br $shift)))
+        (i32.store (i32.shl (local.get $j) (i32.const 2)) (local.get $key))
+        (local.set $i (i32.add (local.get $i) (i32.const 1)))
+        (br $outer)))
+    (local.set $i (i32.const 0))
+    (block $summed
+      (loop $sum_next
+        (br_if $summed (i32.ge_u (local.get $i) (local.get $n)))
+        (local.set $sum (i32.add (local.get $sum)
+          (i32.mul (local.get $i) (i32.load (i32.shl (local.get $i) (i32.const 2))))))
+        (local.set $i (i32.add (local.get $i) (i32.const 1)))
+        (br $sum_next)))
+    (local.get $sum))
+)
+(assert_return (invoke "sort" (i32.const 64)) (i32.const 88376894))
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import weakref
+from typing import Any, Callable
+
+from custom_exceptions import CallCancelledError
+from fuel import FuelMeter
+from variables import Stack
+
+# Fuel (function entries and loop iterations, weighted by their blocks) run before a call gives the event loop back
+DEFAULT_SLICE_FUEL: int = 10000
+
+# The cooperative call running on the current thread
+_current: threading.local = threading.local()
+# One call runs at a time, since the interpreter state is global: the slices are serialised by a lock of the event
+# loop, and the calls of a second loop (in another thread) are refused while the first one has calls
+_locks: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock] = weakref.WeakKeyDictionary()
+_active_calls: int = 0
+_active_loop: asyncio.AbstractEventLoop | None = None
+_state_lock: threading.Lock = threading.Lock()
+
+
+def checkpoint() -> None:
+    # Called by the fuel meter. Calls made directly (not through async_call) are never paused
+    call: CooperativeCall | None = getattr(_current, 'call', None)
+    if call is not None:
+        call.pause()
+
+
+class CooperativeCall:
+    # A guest call that runs in slices. The tree-walking evaluation can't be suspended in the middle of an expression,
+    # so the call gets its own thread, which is paused at the fuel checkpoints (loop iterations and function entries)
+    # and resumed from the same point. The event loop is never blocked: while a slice runs, the coroutine only waits
+    # for the checkpoint. Between slices, the stack and the fuel of the call are saved, and other calls can run
+    function: Callable[[], Any]
+    loop: asyncio.AbstractEventLoop
+    slice_fuel: int
+    cancelled: bool = False
+    started: bool = False
+    finished: bool = False
+    result: Any = None
+    exception: BaseException | None = None
+
+    _thread: threading.Thread
+    _resume: threading.Event
+    _slice: asyncio.Future | None = None
+    _stack_state: tuple[list[list[Any]], int]
+    _fuel_state: tuple[int, float, int]
+
+    def __init__(self, function: Callable[[], Any], slice_fuel: int = DEFAULT_SLICE_FUEL):
+        self.function = function
+        self.loop = asyncio.get_running_loop()
+        self.slice_fuel = slice_fuel
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._resume = threading.Event()
+        self._stack_state = ([[]], 1024)
+        self._fuel_state = (0, 0.0, slice_fuel)
+
+    def _run(self) -> None:
+        # Guest thread
+        _current.call = self
+        try:
+            if self.cancelled:
+                raise CallCancelledError()
+            self.result = self.function()
+        except BaseException as exception:
+            self.exception = exception
+        finally:
+            self.finished = True
+            self._end_slice()
+
+    def _end_slice(self) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self._set_slice_done)
+        except RuntimeError:
+            # The loop is closed: nobody is waiting for the call any more
+            pass
+
+    def _set_slice_done(self) -> None:
+        if self._slice is not None and not self._slice.done():
+            self._slice.set_result(None)
+
+    def pause(self) -> None:
+        # Guest thread, at a checkpoint
+        self._end_slice()
+        self._resume.wait()
+        self._resume.clear()
+        if self.cancelled:
+            raise CallCancelledError()
+
+    async def _run_slice(self) -> None:
+        # With the lock of the loop held
+        stack: Stack = Stack()
+        meter: FuelMeter = FuelMeter()
+        stack.restore(self._stack_state)
+        meter.restore(self._fuel_state)
+        meter.checkpoint_interval = self.slice_fuel
+        self._slice = self.loop.create_future()
+        if self.started:
+            self._resume.set()
+        else:
+            self.started = True
+            self._thread.start()
+        try:
+            await asyncio.shield(self._slice)
+        except asyncio.CancelledError:
+            # The slice still uses the global state: it has to reach its checkpoint before another call runs
+            self.cancelled = True
+            while not self._slice.done():
+                try:
+                    await asyncio.shield(self._slice)
+                except asyncio.CancelledError:
+                    pass
+            raise
+        finally:
+            self._stack_state = stack.save()
+            self._fuel_state = meter.save()
+
+    async def run(self) -> Any:
+        global _active_calls, _active_loop
+        lock: asyncio.Lock = _locks.setdefault(self.loop, asyncio.Lock())
+        meter: FuelMeter = FuelMeter()
+        with _state_lock:
+            if _active_calls > 0 and _active_loop is not self.loop:
+                raise RuntimeError('Cooperative calls are already running on another event loop')
+            if _active_calls == 0:
+                _active_loop = self.loop
+                meter.set_checkpoint(checkpoint, self.slice_fuel)
+            _active_calls += 1
+        try:
+            while not self.finished:
+                # The lock is fair, so waiting calls run their slices in turn
+                async with lock:
+                    await self._run_slice()
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        finally:
+            if not self.finished and self.started:
+                # Paused at a checkpoint: the thread raises CallCancelledError and ends, without touching the state
+                self.cancelled = True
+                self._resume.set()
+            with _state_lock:
+                _active_calls -= 1
+                if _active_calls == 0:
+                    _active_loop = None
+                    meter.set_checkpoint(None)
+        if self.exception is not None:
+            raise self.exception
+        return self.result
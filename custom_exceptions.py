@@ -11,11 +11,17 @@ EXCEPTION_NAMES: dict[str, list[str]] = {
     'type mismatch': ['InvalidNumberTypeError', 'EmptyOperandError', 'InvalidFunctionResultError'],
     'integer divide by zero': ['DivisionByZeroError'],
     'integer overflow': ['IntegerOverflowError'],
+    'invalid conversion to integer': ['InvalidConversionError'],
     'unexpected token': ['UnexpectedTokenError'],
     'undefined element': ['UndefinedElementError'],
     'inline function type': ['UnexpectedTokenError'],
     'mismatching label': ['UnexpectedTokenError'],
     'unknown label': ['UnknownLabelError'],
+    'unknown import': ['UnknownImportError'],
+    'incompatible import type': ['IncompatibleImportTypeError'],
+    'out of bounds memory access': ['OutOfBoundsMemoryAccessError'],
+    'unaligned atomic': ['UnalignedAtomicError'],
+    'expected shared memory': ['ExpectedSharedMemoryError'],
 }
 
 
@@ -23,6 +29,14 @@ class WebAssemblyException(Exception):
     pass
 
 
+def trap_name(exception: WebAssemblyException) -> str:
+    # Name used by the spec tests (as in assert_trap), or the class name when there is none
+    for name, exception_names in EXCEPTION_NAMES.items():
+        if type(exception).__name__ in exception_names:
+            return name
+    return type(exception).__name__
+
+
 class InvalidNumberTypeError(WebAssemblyException):
 
     def __init__(self, number: FixedNumber = None, expected_number_type: NumberType = None):
@@ -118,6 +132,13 @@ class IntegerOverflowError(WebAssemblyException):
         super().__init__(message)
 
 
+class InvalidConversionError(WebAssemblyException):
+
+    def __init__(self):
+        message: str = 'Invalid conversion to integer: value is NaN'
+        super().__init__(message)
+
+
 class UnexpectedTokenError(WebAssemblyException):
 
     def __init__(self, token: str):
@@ -144,4 +165,117 @@ class UnknownLabelError(WebAssemblyException):
     def __init__(self, label: str):
         self.label = label
         message: str = f'Unknown label: "{label}"'
-        super().__init__(message)
\ No newline at end of file
+        super().__init__(message)
+
+
+class UnknownImportError(WebAssemblyException):
+
+    def __init__(self, module_name: str, field_name: str):
+        self.module_name = module_name
+        self.field_name = field_name
+        message: str = f'Unknown import "{module_name}" "{field_name}"'
+        super().__init__(message)
+
+
+class IncompatibleImportTypeError(WebAssemblyException):
+
+    def __init__(self, module_name: str, field_name: str):
+        self.module_name = module_name
+        self.field_name = field_name
+        message: str = f'Incompatible import type for "{module_name}" "{field_name}"'
+        super().__init__(message)
+
+
+class OutOfBoundsMemoryAccessError(WebAssemblyException):
+
+    def __init__(self, index: int, length: int, size: int):
+        self.index = index
+        self.length = length
+        message: str = f'Out of bounds memory access: {length} bytes at {index} (memory size {size})'
+        super().__init__(message)
+
+
+class ProcessExitError(WebAssemblyException):
+    # Raised by the WASI proc_exit to stop the program, not a trap
+
+    def __init__(self, exit_code: int):
+        self.exit_code = exit_code
+        message: str = f'Process exited with code {exit_code}'
+        super().__init__(message)
+
+
+class UnalignedAtomicError(WebAssemblyException):
+
+    def __init__(self, index: int, width: int):
+        self.index = index
+        self.width = width
+        message: str = f'Unaligned atomic access: address {index} is not a multiple of {width}'
+        super().__init__(message)
+
+
+class ExpectedSharedMemoryError(WebAssemblyException):
+
+    def __init__(self):
+        super().__init__('memory.atomic.wait needs a shared memory')
+
+
+class SharedMemoryTooLargeError(WebAssemblyException):
+    # The whole maximum of a shared memory is reserved when it is created
+
+    def __init__(self, maximum: int, size: int, available: int | None):
+        self.maximum = maximum
+        self.size = size
+        self.available = available
+        message: str = f'Shared memory with a maximum of {maximum} pages needs {size} bytes'
+        if available is not None:
+            message += f', but only {available} are free in /dev/shm'
+        super().__init__(message)
+
+
+class CallCancelledError(WebAssemblyException):
+    # Raised inside a cooperative call that was cancelled, to unwind it at its next checkpoint
+
+    def __init__(self):
+        super().__init__('Call cancelled')
+
+
+class WorkerTrapError(WebAssemblyException):
+    # Trap (or other error) of a call that ran in a worker process
+
+    def __init__(self, trap: str, arguments: tuple):
+        self.trap = trap
+        self.arguments = arguments
+        message: str = f'Call with arguments {arguments} failed in a worker: {trap}'
+        super().__init__(message)
+
+
+class WorkerError(WebAssemblyException):
+    # Error of a call that ran in a worker process other than a trap (e.g. raised by a host function), or a worker
+    # that stopped
+
+    def __init__(self, error: str, arguments: tuple | None = None):
+        self.error = error
+        self.arguments = arguments
+        message: str = f'Call with arguments {arguments} raised in a worker: {error}' if arguments is not None \
+            else error
+        super().__init__(message)
+
+
+class ExecutionLimitError(WebAssemblyException):
+    pass
+
+
+class FuelExhaustedError(ExecutionLimitError):
+
+    def __init__(self, fuel: int):
+        self.fuel = fuel
+        message: str = f'Fuel exhausted: all {fuel} units were consumed'
+        super().__init__(message)
+
+
+class DeadlineExceededError(ExecutionLimitError):
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        message: str = f'Deadline exceeded: execution took longer than {deadline * 1000:g} ms'
+        super().__init__(message)
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
+import re
 from abc import abstractmethod
 from dataclasses import dataclass
-from typing import Tuple
+from typing import Generator, Tuple
 
 from custom_exceptions import InvalidNumberTypeError, UnknownVariableError, EmptyOperandError, UnexpectedTokenError, \
-    UnreachableError
+    UnreachableError, InvalidSyntaxError, OutOfBoundsMemoryAccessError, UndefinedElementError
 from enums import NumberType
 from expressions import SExpression
 from number_types import ResultExpression
@@ -23,6 +24,8 @@ class Evaluation(SExpression):
     number_type: NumberType = None
     children: list[Evaluation]
     result: ResultExpression = None
+    # Loops and functions charge the fuel for their own bodies (fuel.py)
+    charges_fuel: bool = False
 
     def __init__(self, **kwargs) -> None:
         super().__init__()
@@ -37,7 +40,33 @@ class Evaluation(SExpression):
         if global_variables is None:
             global_variables = GlobalVariableWatch()
 
+    def is_branch_target(self, report: EvaluationReport) -> bool:
+        if report.jump_to == 0:
+            return True
+        return self.name is not None and (report.jump_to == self.name or report.jump_to == '$' + self.name)
+
+
+# Operands which are not kept in the children list
+OPERAND_ATTRIBUTES: tuple[str, ...] = ('condition', 'then_clause', 'else_clause', 'first_clause', 'second_clause',
+                                       'call_index')
+
+
+def operands(expression: SExpression) -> Generator[Evaluation, None, None]:
+    for child in expression.children:
+        if isinstance(child, Evaluation):
+            yield child
+    for attribute in OPERAND_ATTRIBUTES:
+        operand = expression.__dict__.get(attribute)
+        if isinstance(operand, Evaluation):
+            yield operand
+
+
+# Suffix of conversions naming the type of their operand, e.g. i32.trunc_f64_s or f64.promote_f32
+CONVERSION_REGEX: re.Pattern[str] = re.compile(r'.+_(i32|i64|f32|f64)(?:_[su])?')
+
+
 class UnaryEvaluation(Evaluation):
+    operand_type: NumberType = None
 
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
         super().evaluate(stack, local_variables)
@@ -58,9 +87,11 @@ class UnaryEvaluation(Evaluation):
                 self.number_type = NumberType.v128
             else:
                 self.number_type = NumberType(self.expression_name[:3])
+            conversion_match: re.Match[str] | None = CONVERSION_REGEX.fullmatch(self.expression_name)
+            self.operand_type = self.number_type if conversion_match is None else NumberType(conversion_match.group(1))
             if isinstance(self.operand,
-                          Evaluation) and self.operand.number_type is not None and self.operand.number_type != self.number_type:
-                raise InvalidNumberTypeError(FixedNumber(None, self.operand.number_type), self.number_type)
+                          Evaluation) and self.operand.number_type is not None and self.operand.number_type != self.operand_type:
+                raise InvalidNumberTypeError(FixedNumber(None, self.operand.number_type), self.operand_type)
         if len(self.children) == 1 and not kwargs.get('no_input', False):
             Stack().contract(1)
         Stack().expand(1)
@@ -74,6 +105,9 @@ class UnaryEvaluation(Evaluation):
 
 
 class BinaryEvaluation(Evaluation):
+    operand_type: NumberType = None
+    # Type of the result, when it differs from the type of the operands (e.g. comparisons)
+    result_type: NumberType = None
 
     @property
     def first_operand(self) -> Evaluation:
@@ -93,13 +127,14 @@ class BinaryEvaluation(Evaluation):
         super().__init__()
         if len(self.children) < 2:
             EmptyOperandError.try_raise(2, Stack())
-        self.number_type = NumberType(self.expression_name[:3])
+        self.operand_type = NumberType(self.expression_name[:3])
+        self.number_type = self.operand_type if self.result_type is None else self.result_type
         if isinstance(self.first_operand,
-                      Evaluation) and self.first_operand.number_type is not None and self.first_operand.number_type != self.number_type:
-            raise InvalidNumberTypeError(FixedNumber(None, self.first_operand.number_type), self.number_type)
+                      Evaluation) and self.first_operand.number_type is not None and self.first_operand.number_type != self.operand_type:
+            raise InvalidNumberTypeError(FixedNumber(None, self.first_operand.number_type), self.operand_type)
         if isinstance(self.second_operand,
-                      Evaluation) and self.second_operand.number_type is not None and self.second_operand.number_type != self.number_type:
-            raise InvalidNumberTypeError(FixedNumber(None, self.second_operand.number_type), self.number_type)
+                      Evaluation) and self.second_operand.number_type is not None and self.second_operand.number_type != self.operand_type:
+            raise InvalidNumberTypeError(FixedNumber(None, self.second_operand.number_type), self.operand_type)
         if len(self.children) == 2:
             Stack().contract(2)
         Stack().expand(1)
@@ -130,10 +165,10 @@ class BinaryEvaluation(Evaluation):
             second_evaluation: FixedNumber = second_operand
         if len(self.children) == 0:
             first_evaluation, second_evaluation = second_evaluation, first_evaluation
-        if not first_evaluation.number_type == self.number_type:
-            raise InvalidNumberTypeError(first_evaluation, self.number_type)
-        if not second_evaluation.number_type == self.number_type:
-            raise InvalidNumberTypeError(second_evaluation, self.number_type)
+        if not first_evaluation.number_type == self.operand_type:
+            raise InvalidNumberTypeError(first_evaluation, self.operand_type)
+        if not second_evaluation.number_type == self.operand_type:
+            raise InvalidNumberTypeError(second_evaluation, self.operand_type)
         return first_evaluation, second_evaluation
 
     @abstractmethod
@@ -181,6 +216,25 @@ class LocalSetter(Evaluation):
         local_variables[self.name] = stack.pop()
 
 
+class LocalCopy(LocalSetter):
+    source: int | str = None
+
+    def __init__(self, name: int | str, source: int | str, **kwargs):
+        # Built by the optimizer from a local.set of a local.get, so there is nothing to validate
+        self.expression_name = 'local.copy'
+        self.name = name
+        self.source = source
+        self.children = []
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        if self.source not in local_variables:
+            raise UnknownVariableError(self.source)
+        local_variables[self.name] = local_variables[self.source]
+
+    def __str__(self) -> str:
+        return f'{self.expression_name}({self.name} <- {self.source})'
+
+
 class LocalExpression(Evaluation):
     number_type: NumberType = None
     variable_name: str = None
@@ -197,7 +251,7 @@ class LocalExpression(Evaluation):
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
         if local_variables is None:
             local_variables = VariableWatch()
-        local_variables.add_variable(FixedNumber(0, self.number_type))
+        local_variables.add_variable(FixedNumber(0, self.number_type), self.variable_name)
 
 
 class LocalTee(LocalSetter):
@@ -249,7 +303,8 @@ class LoadExpression(UnaryEvaluation):
         if global_variables is None:
             global_variables = GlobalVariableWatch()
         self.operand.evaluate(stack, local_variables, global_variables)
-        stack.push(Memory()[stack.pop().value, self.number_type])
+        # Addresses are unsigned
+        stack.push(Memory()[stack.pop().unsigned_value, self.number_type])
 
 
 class MemoryGrowExpression(UnaryEvaluation):
@@ -259,11 +314,19 @@ class MemoryGrowExpression(UnaryEvaluation):
         super().__init__(numeric=False)
 
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        initial_size = Memory().allocated
         super().evaluate(stack, local_variables, global_variables)
         self.operand.evaluate(stack, local_variables, global_variables)
-        Memory().grow(stack.pop().value)
-        stack.push(FixedNumber(initial_size, NumberType.i32))
+        stack.push(FixedNumber(Memory().grow(stack.pop().unsigned_value), NumberType.i32))
+
+
+class MemorySizeExpression(Evaluation):
+
+    def __init__(self, **kwargs):
+        super().__init__()
+        Stack().expand(1)
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        stack.push(FixedNumber(Memory().allocated, NumberType.i32))
 
 
 class StoreExpression(BinaryEvaluation):
@@ -276,7 +339,104 @@ class StoreExpression(BinaryEvaluation):
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
         super().evaluate(stack, local_variables, global_variables)
         first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables, global_variables)
-        Memory()[first_evaluation.value] = second_evaluation
+        Memory()[first_evaluation.unsigned_value] = second_evaluation
+
+
+class BulkMemoryEvaluation(Evaluation):
+    # memory.copy, memory.fill and memory.init: three i32 operands (destination, source or value, length), no result.
+    # The bytes are moved with a single slice assignment on the memory
+
+    def __init__(self, **kwargs):
+        super().__init__()
+        operands: list[Evaluation] = [child for child in self.children if isinstance(child, Evaluation)]
+        if len(operands) < 3:
+            EmptyOperandError.try_raise(3, Stack())
+        for operand in operands:
+            if operand.number_type is not None and operand.number_type != NumberType.i32:
+                raise InvalidNumberTypeError(FixedNumber(None, operand.number_type), NumberType.i32)
+        Stack().contract(3)
+
+    def evaluate_operands(self, stack: Stack, local_variables: VariableWatch = None,
+                          global_variables=None) -> tuple[int, int, int]:
+        for child in self.children:
+            if isinstance(child, Evaluation):
+                child.evaluate(stack, local_variables, global_variables)
+        length: int = stack.pop().unsigned_value
+        second: FixedNumber = stack.pop()
+        destination: int = stack.pop().unsigned_value
+        return destination, second.unsigned_value, length
+
+
+class MemoryCopyExpression(BulkMemoryEvaluation):
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        destination, source, length = self.evaluate_operands(stack, local_variables, global_variables)
+        Memory().copy(destination, source, length)
+
+
+class MemoryFillExpression(BulkMemoryEvaluation):
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        destination, value, length = self.evaluate_operands(stack, local_variables, global_variables)
+        Memory().fill(destination, value, length)
+
+
+def data_segment(expression: SExpression, variables: VariableWatch) -> tuple[list[DataExpression],
+                                                                              dict[str, DataExpression], int | str]:
+    # Segments of the module (filled as they are parsed, so that they can be used before they are defined)
+    # and the index or name of the one used by memory.init / data.drop
+    if expression.name is not None:
+        identifier: int | str = expression.name
+    else:
+        if len(expression.children) == 0 or isinstance(expression.children[0], Evaluation):
+            raise EmptyOperandError(1)
+        try:
+            identifier = int(expression.children[0].expression_name)
+        except ValueError:
+            raise UnexpectedTokenError(expression.children[0].expression_name)
+        expression.children = expression.children[1:]
+    return variables['~data~'], variables['~data_names~'], identifier
+
+
+def find_data_segment(segments: list[DataExpression], names: dict[str, DataExpression],
+                      identifier: int | str) -> DataExpression:
+    segment: DataExpression | None = names.get(identifier) if isinstance(identifier, str) else \
+        segments[identifier] if identifier < len(segments) else None
+    if segment is None:
+        raise UndefinedElementError(f'Unknown data segment {identifier}')
+    return segment
+
+
+class MemoryInitExpression(BulkMemoryEvaluation):
+    segments: list[DataExpression] = None
+    segment_names: dict[str, DataExpression] = None
+    segment: int | str = None
+
+    def __init__(self, variables=None):
+        self.segments, self.segment_names, self.segment = data_segment(self, variables)
+        super().__init__()
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        destination, source, length = self.evaluate_operands(stack, local_variables, global_variables)
+        data: bytes = find_data_segment(self.segments, self.segment_names, self.segment).data_view
+        if source + length > len(data):
+            raise OutOfBoundsMemoryAccessError(source, length, len(data))
+        # A view of the segment: the bytes are copied once, into the memory
+        with memoryview(data) as view:
+            Memory().write(destination, view[source:source + length])
+
+
+class DataDropExpression(Evaluation):
+    segments: list[DataExpression] = None
+    segment_names: dict[str, DataExpression] = None
+    segment: int | str = None
+
+    def __init__(self, variables=None):
+        super().__init__()
+        self.segments, self.segment_names, self.segment = data_segment(self, variables)
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        find_data_segment(self.segments, self.segment_names, self.segment).dropped = True
 
 
 class NOPExpression(Evaluation):
@@ -289,6 +449,119 @@ class UnreachableExpression(Evaluation):
         raise UnreachableError()
 
 
+# Strings of data segments, and the escapes inside them
+STRING_REGEX: re.Pattern[str] = re.compile(r'"((?:[^"\\]|\\.)*)"')
+ESCAPE_REGEX: re.Pattern[str] = re.compile(r'\\(?:([0-9a-fA-F]{2})|u\{([0-9a-fA-F]+)\}|(.))')
+ESCAPED_CHARACTERS: dict[str, bytes] = {'t': b'\t', 'n': b'\n', 'r': b'\r', '"': b'"', "'": b"'", '\\': b'\\'}
+
+
+def decode_string(text: str) -> bytes:
+    # Bytes of one or more consecutive string literals
+    data: bytearray = bytearray()
+    for literal in STRING_REGEX.findall(text):
+        position: int = 0
+        for match in ESCAPE_REGEX.finditer(literal):
+            data += literal[position:match.start()].encode()
+            hexadecimal, code_point, character = match.groups()
+            if hexadecimal is not None:
+                data.append(int(hexadecimal, 16))
+            elif code_point is not None:
+                data += chr(int(code_point, 16)).encode()
+            elif character in ESCAPED_CHARACTERS:
+                data += ESCAPED_CHARACTERS[character]
+            else:
+                raise UnexpectedTokenError(f'\\{character}')
+            position = match.end()
+        data += literal[position:].encode()
+    return bytes(data)
+
+
+class MemoryExpression(Evaluation):
+    # (memory min max? shared?), possibly exported. Instantiating it gives the module a new memory
+    pages: int = 0
+    maximum: int | None = None
+    shared: bool = False
+    export_as: str = None
+
+    def __init__(self, variables=None):
+        super().__init__()
+        limits: list[str] = []
+        for child in self.children:
+            if child.expression_name == 'export':
+                self.export_as = child.export_name
+            else:
+                limits += child.expression_name.split(' ')
+        if len(limits) > 0 and limits[-1] == 'shared':
+            self.shared = True
+            limits.pop()
+        if len(limits) == 0 or len(limits) > 2:
+            raise InvalidSyntaxError(f'Memory expression has incorrect number of limits ({len(limits)})')
+        try:
+            self.pages = int(limits[0], 0)
+            self.maximum = int(limits[1], 0) if len(limits) > 1 else None
+        except ValueError as error:
+            raise UnexpectedTokenError(str(error))
+        if self.shared and self.maximum is None:
+            raise InvalidSyntaxError('shared memory must have maximum')
+        self.children = []
+        # Modules in assert_invalid are never instantiated
+        if not variables['~assert~'] and variables['~instantiate~']:
+            self.evaluate(Stack())
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        Memory().reset(self.pages, self.maximum, self.shared)
+
+
+class OffsetExpression(UnaryEvaluation):
+
+    def __init__(self, **kwargs):
+        super().__init__(numeric=False)
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        self.operand.evaluate(stack, local_variables, global_variables)
+
+
+class DataExpression(Evaluation):
+    # (data offset? "bytes"...): active segments are copied to the memory when the module is instantiated, passive
+    # ones are used by memory.init. The memory has to be declared before
+    data: bytes = b''
+    offset: Evaluation | None = None
+    dropped: bool = False
+
+    def __init__(self, variables=None):
+        super().__init__()
+        self.data = b''.join(decode_string(child.expression_name) for child in self.children
+                             if not isinstance(child, Evaluation))
+        offsets: list[Evaluation] = [child for child in self.children if isinstance(child, Evaluation)]
+        if len(offsets) > 1:
+            raise InvalidSyntaxError(f'Data expression has {len(offsets)} offsets')
+        if len(offsets) == 1:
+            self.offset = offsets[0]
+            if self.offset.number_type is not None and self.offset.number_type != NumberType.i32:
+                raise InvalidNumberTypeError(FixedNumber(None, self.offset.number_type), NumberType.i32)
+            Stack().contract(1)
+        self.children = []
+        variables['~data~'].append(self)
+        if self.name is not None:
+            variables['~data_names~'][self.name] = self
+        if not variables['~assert~'] and variables['~instantiate~']:
+            self.evaluate(Stack())
+
+    @property
+    def data_view(self) -> bytes:
+        # Dropped segments are empty
+        return b'' if self.dropped else self.data
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        if self.offset is None:
+            self.dropped = False
+            return
+        self.offset.evaluate(stack, VariableWatch(), GlobalVariableWatch())
+        Memory().write(stack.pop().unsigned_value, self.data)
+        # Active segments can't be used after instantiation
+        self.dropped = True
+
+
 class GlobalExpression(Evaluation):
     mutable: bool = True
     number_type: NumberType = None
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import re
 from re import Pattern
-from typing import TYPE_CHECKING
+from typing import Generator, TYPE_CHECKING
 
 from custom_exceptions import InvalidSyntaxError
 if TYPE_CHECKING:
@@ -15,6 +15,26 @@ class SExpression:
     name: str = None
     children: list[SExpression] = []
 
+    @staticmethod
+    def iterate_parentheses(expression: str) -> Generator[tuple[int, str], None, None]:
+        # The top-level expressions of a file with their offsets, one at a time, so that each one can be run before
+        # the rest of the file is split
+        open_parentheses: int = 0
+        start: int = 0
+        for next_parenthesis in re.finditer('[()]', expression):
+            if next_parenthesis.group() == '(':
+                if open_parentheses == 0:
+                    start = next_parenthesis.start()
+                open_parentheses += 1
+            else:
+                open_parentheses -= 1
+                if open_parentheses < 0:
+                    raise InvalidSyntaxError(f'Unexpected ")" at offset {next_parenthesis.start()}')
+                if open_parentheses == 0:
+                    yield start, expression[start:next_parenthesis.end()]
+        if open_parentheses != 0:
+            raise InvalidSyntaxError(f'Parenthesis at offset {start} is never closed')
+
     @staticmethod
     def get_parentheses(expression: str) -> list[str]:
         if len(expression) == 0:
@@ -83,17 +103,27 @@ class SExpression:
         return '\t' * level + '- ' + str(self) + '\n' + ''.join([child.__repr__(level + 1) for child in self.children])
 
 
+EXPORT_KINDS: tuple[str, ...] = ('func', 'memory', 'table', 'global')
+
+
 class ModuleExpression(SExpression):
     pass
 
 
 class ExportExpression(SExpression):
     export_name: str
+    # Top-level exports name what they export: (export "name" (func $f)), (export "memory" (memory 0))...
+    export_kind: str | None = None
+    reference: str | None = None
 
     def __init__(self, **kwargs) -> None:
         super().__init__()
-        if len(self.children) != 1:
+        if len(self.children) not in (1, 2):
             raise InvalidSyntaxError(f"Export expression has incorrect number of parameters ({len(self.children)})")
         # Remove "" from name
         self.export_name = self.children[0].expression_name[1:-1]
+        if len(self.children) == 2:
+            self.export_kind, _, self.reference = self.children[1].expression_name.partition(' ')
+            if self.export_kind not in EXPORT_KINDS or self.reference == '':
+                raise InvalidSyntaxError(f'Invalid export "{self.children[1].expression_name}"')
         self.children = []
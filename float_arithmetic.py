@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import math
+import re
+import struct
+import sys
+from fractions import Fraction
+
+from custom_exceptions import IntegerOverflowError, InvalidConversionError, UnexpectedTokenError
+from enums import NumberType
+from integer_arithmetic import MASKS, MINIMUMS, wrap
+
+# Shared f32/f64 arithmetic. Values are kept as Python floats; f32 values are rounded to single precision by packing
+# them into 4 bytes, so they are always exactly representable. Doing the operation in double precision and then
+# rounding gives the correctly rounded single precision result for +, -, *, / and sqrt.
+
+BITS: dict[NumberType, int] = {NumberType.f32: 32, NumberType.f64: 64}
+
+_F32: struct.Struct = struct.Struct('<f')
+_F64: struct.Struct = struct.Struct('<d')
+_U32: struct.Struct = struct.Struct('<I')
+_U64: struct.Struct = struct.Struct('<Q')
+
+# (mantissa bits, exponent bits) of each width
+FORMATS: dict[int, tuple[int, int]] = {32: (23, 8), 64: (52, 11)}
+SIGN_MASKS: dict[int, int] = {32: 1 << 31, 64: 1 << 63}
+QUIET_BITS: dict[int, int] = {32: 1 << 22, 64: 1 << 51}
+CANONICAL_NANS: dict[int, int] = {32: 0x7fc00000, 64: 0x7ff8000000000000}
+
+# The canonical NaN (positive, only the quiet bit set) in both widths
+NAN: float = _F64.unpack(_U64.pack(CANONICAL_NANS[64]))[0]
+INFINITY: float = math.inf
+# Largest finite number of each width
+MAXIMUMS: dict[int, float] = {32: _F32.unpack(_U32.pack(0x7f7fffff))[0], 64: sys.float_info.max}
+
+
+def round_f32(value: float) -> float:
+    if value != value:
+        return value
+    try:
+        return _F32.unpack(_F32.pack(value))[0]
+    except OverflowError:
+        # Rounds past the largest single precision number
+        return math.copysign(INFINITY, value)
+
+
+def round_to(value: float, bits: int) -> float:
+    return round_f32(value) if bits == 32 else value
+
+
+def canonical(value: float, bits: int) -> float:
+    # Result of an arithmetic operation: every NaN becomes the canonical NaN
+    if value != value:
+        return NAN
+    return round_f32(value) if bits == 32 else value
+
+
+def to_bits(value: float, bits: int) -> int:
+    if bits == 64:
+        return _U64.unpack(_F64.pack(value))[0]
+    if value != value:
+        # Narrowed by hand, so that the payload (and signaling NaNs) survive
+        double_bits: int = _U64.unpack(_F64.pack(value))[0]
+        return ((double_bits >> 32) & SIGN_MASKS[32]) | 0x7f800000 | ((double_bits >> 29) & MASKS[23])
+    return _U32.unpack(_F32.pack(value))[0]
+
+
+def from_bits(value: int, bits: int) -> float:
+    if bits == 64:
+        return _F64.unpack(_U64.pack(value & MASKS[64]))[0]
+    value &= MASKS[32]
+    if value & 0x7f800000 == 0x7f800000 and value & MASKS[23]:
+        # Widened by hand, so that the payload (and signaling NaNs) survive
+        return _F64.unpack(_U64.pack(((value & SIGN_MASKS[32]) << 32) | 0x7ff0000000000000 |
+                                     ((value & MASKS[23]) << 29)))[0]
+    return _F32.unpack(_U32.pack(value))[0]
+
+
+def is_canonical_nan(value: float, bits: int) -> bool:
+    return value != value and to_bits(value, bits) & ~SIGN_MASKS[bits] == CANONICAL_NANS[bits]
+
+
+def is_arithmetic_nan(value: float, bits: int) -> bool:
+    return value != value and to_bits(value, bits) & QUIET_BITS[bits] != 0
+
+
+def add(first: float, second: float, bits: int) -> float:
+    return canonical(first + second, bits)
+
+
+def sub(first: float, second: float, bits: int) -> float:
+    return canonical(first - second, bits)
+
+
+def mul(first: float, second: float, bits: int) -> float:
+    return canonical(first * second, bits)
+
+
+def div(first: float, second: float, bits: int) -> float:
+    if second == 0:
+        if first == 0 or first != first:
+            return NAN
+        return math.copysign(INFINITY, first) * math.copysign(1.0, second)
+    return canonical(first / second, bits)
+
+
+def sqrt(value: float, bits: int) -> float:
+    if value != value or value < 0:
+        return NAN
+    return round_to(math.sqrt(value), bits)
+
+
+def min_(first: float, second: float, bits: int) -> float:
+    if first != first or second != second:
+        return NAN
+    if first == second:
+        # min(-0, 0) is -0
+        return first if math.copysign(1.0, first) < 0 else second
+    return first if first < second else second
+
+
+def max_(first: float, second: float, bits: int) -> float:
+    if first != first or second != second:
+        return NAN
+    if first == second:
+        return second if math.copysign(1.0, first) < 0 else first
+    return first if first > second else second
+
+
+def copysign(first: float, second: float, bits: int) -> float:
+    # Only the sign bit changes, NaN payloads included
+    return from_bits((to_bits(first, bits) & ~SIGN_MASKS[bits]) | (to_bits(second, bits) & SIGN_MASKS[bits]), bits)
+
+
+def abs_(value: float, bits: int) -> float:
+    return from_bits(to_bits(value, bits) & ~SIGN_MASKS[bits], bits)
+
+
+def neg(value: float, bits: int) -> float:
+    return from_bits(to_bits(value, bits) ^ SIGN_MASKS[bits], bits)
+
+
+def _round_integral(value: float, function) -> float:
+    if value != value:
+        return NAN
+    if value == 0 or math.isinf(value):
+        return value
+    # Integral results keep the sign of the operand, so ceil(-0.5) is -0
+    return math.copysign(float(function(value)), value)
+
+
+def ceil(value: float, bits: int) -> float:
+    return _round_integral(value, math.ceil)
+
+
+def floor(value: float, bits: int) -> float:
+    return _round_integral(value, math.floor)
+
+
+def trunc(value: float, bits: int) -> float:
+    return _round_integral(value, math.trunc)
+
+
+def nearest(value: float, bits: int) -> float:
+    # round() rounds halfway cases to even
+    return _round_integral(value, round)
+
+
+def eq(first: float, second: float, bits: int) -> int:
+    return 1 if first == second else 0
+
+
+def ne(first: float, second: float, bits: int) -> int:
+    return 1 if first != second else 0
+
+
+def lt(first: float, second: float, bits: int) -> int:
+    return 1 if first < second else 0
+
+
+def le(first: float, second: float, bits: int) -> int:
+    return 1 if first <= second else 0
+
+
+def gt(first: float, second: float, bits: int) -> int:
+    return 1 if first > second else 0
+
+
+def ge(first: float, second: float, bits: int) -> int:
+    return 1 if first >= second else 0
+
+
+def round_fraction(value: Fraction, bits: int) -> float:
+    # Correctly rounded (to nearest, ties to even) conversion of an exact number
+    if value == 0:
+        return 0.0
+    sign: float = -1.0 if value < 0 else 1.0
+    value = abs(value)
+    mantissa_bits, exponent_bits = FORMATS[bits]
+    minimum_exponent: int = 2 - (1 << (exponent_bits - 1))
+    exponent: int = value.numerator.bit_length() - value.denominator.bit_length()
+    if Fraction(2) ** exponent > value:
+        exponent -= 1
+    # Subnormal numbers have fewer significant bits
+    scale: int = max(exponent, minimum_exponent) - mantissa_bits
+    scaled: Fraction = value / Fraction(2) ** scale
+    mantissa: int = round(scaled)
+    result: Fraction = mantissa * Fraction(2) ** scale
+    if result > MAXIMUMS[bits]:
+        return sign * INFINITY
+    return sign * float(result)
+
+
+def from_integer(value: int, bits: int) -> float:
+    # float() rounds to double precision, which could round twice for f32
+    return round_fraction(Fraction(value), bits) if bits == 32 and value.bit_length() > 24 else float(value)
+
+
+def convert_s(value: int, from_bits: int, bits: int) -> float:
+    return from_integer(value, bits)
+
+
+def convert_u(value: int, from_bits: int, bits: int) -> float:
+    return from_integer(value & MASKS[from_bits], bits)
+
+
+def _truncate(value: float, minimum: int, maximum: int) -> int:
+    if value != value:
+        raise InvalidConversionError()
+    if math.isinf(value):
+        raise IntegerOverflowError()
+    truncated: int = math.trunc(value)
+    if truncated < minimum or truncated > maximum:
+        raise IntegerOverflowError()
+    return truncated
+
+
+def trunc_s(value: float, bits: int) -> int:
+    return _truncate(value, MINIMUMS[bits], MASKS[bits - 1])
+
+
+def trunc_u(value: float, bits: int) -> int:
+    # Unsigned results are stored as signed integers like every other integer
+    return wrap(_truncate(value, 0, MASKS[bits]), bits)
+
+
+def trunc_sat_s(value: float, bits: int) -> int:
+    if value != value:
+        return 0
+    if math.isinf(value):
+        return MINIMUMS[bits] if value < 0 else MASKS[bits - 1]
+    return min(max(math.trunc(value), MINIMUMS[bits]), MASKS[bits - 1])
+
+
+def trunc_sat_u(value: float, bits: int) -> int:
+    if value != value:
+        return 0
+    if math.isinf(value):
+        return 0 if value < 0 else wrap(MASKS[bits], bits)
+    return wrap(min(max(math.trunc(value), 0), MASKS[bits]), bits)
+
+
+def promote(value: float) -> float:
+    # Every f32 is exactly representable as an f64
+    return NAN if value != value else value
+
+
+def demote(value: float) -> float:
+    return NAN if value != value else round_f32(value)
+
+
+def reinterpret_as_integer(value: float, bits: int) -> int:
+    return wrap(to_bits(value, bits), bits)
+
+
+def reinterpret_as_float(value: int, bits: int) -> float:
+    return from_bits(value, bits)
+
+
+_HEX_REGEX: re.Pattern[str] = re.compile(r'0x([0-9a-f]*)(?:\.([0-9a-f]*))?(?:p([+-]?[0-9]+))?')
+
+
+def parse_float(literal: str, bits: int) -> float:
+    text: str = literal.replace('_', '').lower()
+    sign: int = 1
+    if text.startswith(('-', '+')):
+        sign = -1 if text[0] == '-' else 1
+        text = text[1:]
+    if text == 'inf':
+        return sign * INFINITY
+    if text == 'nan':
+        return from_bits(CANONICAL_NANS[bits] | (SIGN_MASKS[bits] if sign < 0 else 0), bits)
+    if text.startswith('nan:0x'):
+        mantissa_bits, exponent_bits = FORMATS[bits]
+        payload: int = int(text[6:], 16)
+        if payload == 0 or payload > MASKS[mantissa_bits]:
+            raise UnexpectedTokenError(literal)
+        return from_bits((SIGN_MASKS[bits] if sign < 0 else 0) | (MASKS[exponent_bits] << mantissa_bits) | payload,
+                         bits)
+    try:
+        if text.startswith('0x'):
+            match: re.Match[str] | None = _HEX_REGEX.fullmatch(text)
+            if match is None or match.group(1) + (match.group(2) or '') == '':
+                raise ValueError(literal)
+            fraction_digits: str = match.group(2) or ''
+            exponent: int = int(match.group(3) or '0') - 4 * len(fraction_digits)
+            value: Fraction = int(match.group(1) + fraction_digits, 16) * Fraction(2) ** exponent
+        elif bits == 64:
+            # float() is correctly rounded for f64
+            return math.copysign(float(text), sign)
+        else:
+            value = Fraction(text)
+    except ValueError:
+        raise UnexpectedTokenError(literal)
+    return math.copysign(round_fraction(value, bits), sign)
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import time
+from typing import Callable
+
+from custom_exceptions import FuelExhaustedError, DeadlineExceededError
+from evaluations import Evaluation, operands
+from singleton import singleton
+
+
+def block_cost(expression: Evaluation) -> int:
+    # Number of expressions run every time the block is entered. Nested loops and functions are left out, since they
+    # charge for themselves (a loop once per iteration)
+    cost: int = 1
+    pending: list[Evaluation] = list(operands(expression))
+    while len(pending) > 0:
+        operand: Evaluation = pending.pop()
+        cost += 1
+        if not operand.charges_fuel:
+            pending.extend(operands(operand))
+    return cost
+
+
+@singleton
+class FuelMeter:
+    # Fuel and time limits of a single invocation. Instead of every expression, only function entries and loop
+    # iterations charge the meter, with the static cost of the block they are about to run
+    fuel: int | None = None
+    # Seconds
+    deadline: float | None = None
+    # Fuel consumed by the current (or last) invocation, and by all of them
+    consumed: int = 0
+    total_consumed: int = 0
+    invocations: int = 0
+    # True when there is a limit to check; looked up by the interpreter before charging anything
+    metering: bool = False
+
+    # Called every checkpoint_interval units of fuel, to pause cooperative calls (see cooperative.py)
+    checkpoint: Callable[[], None] | None = None
+    checkpoint_interval: int = 0
+
+    _deadline_time: float = 0.0
+    _until_checkpoint: int = 0
+
+    def configure(self, fuel: int | None = None, deadline: float | None = None) -> None:
+        self.fuel = fuel
+        self.deadline = deadline
+        self.metering = fuel is not None or deadline is not None or self.checkpoint is not None
+        self.consumed = 0
+        self.total_consumed = 0
+        self.invocations = 0
+
+    def set_checkpoint(self, checkpoint: Callable[[], None] | None, interval: int = 0) -> None:
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = interval
+        self._until_checkpoint = interval
+        self.metering = self.fuel is not None or self.deadline is not None or checkpoint is not None
+
+    def save(self) -> tuple[int, float, int]:
+        # State of the current invocation, for calls that are suspended and resumed later. The deadline is kept as
+        # the time left, so that the time a call spends suspended doesn't count
+        return self.consumed, self._deadline_time - time.monotonic(), self._until_checkpoint
+
+    def restore(self, state: tuple[int, float, int]) -> None:
+        self.consumed, remaining, self._until_checkpoint = state
+        self._deadline_time = time.monotonic() + remaining
+
+    def begin_invocation(self) -> None:
+        self.consumed = 0
+        self.invocations += 1
+        if self.deadline is not None:
+            self._deadline_time = time.monotonic() + self.deadline
+
+    def charge(self, cost: int) -> None:
+        self.consumed += cost
+        self.total_consumed += cost
+        if self.fuel is not None and self.consumed > self.fuel:
+            raise FuelExhaustedError(self.fuel)
+        if self.deadline is not None and time.monotonic() > self._deadline_time:
+            raise DeadlineExceededError(self.deadline)
+        if self.checkpoint is not None:
+            self._until_checkpoint -= cost
+            if self._until_checkpoint <= 0:
+                self._until_checkpoint = self.checkpoint_interval
+                self.checkpoint()
+
+
+# Bound once, so that loops and calls don't go through the singleton wrapper when nothing is metered
+METER: FuelMeter = FuelMeter()
@@ -1,12 +1,18 @@
 from __future__ import annotations
 
+import re
 from enum import Enum
 
+from typing import Any, Callable
+
 from custom_exceptions import InvalidFunctionSignatureError, UnknownFunctionError, EmptyOperandError, \
-    UndefinedElementError, InvalidNumberTypeError, InvalidFunctionResultError
+    UndefinedElementError, InvalidNumberTypeError, InvalidFunctionResultError, UnknownImportError, \
+    IncompatibleImportTypeError, InvalidSyntaxError
 from enums import NumberType
 from evaluations import Evaluation, UnaryEvaluation, EvaluationReport
 from expressions import ExportExpression, SExpression
+from fuel import METER, block_cost
+from host import HostFunction
 from number_types import ResultExpression, ParamExpression
 from singleton import singleton
 from variables import VariableWatch, FixedNumber, NumberVariable, Stack, GlobalVariableWatch
@@ -32,6 +38,8 @@ class FunctionExpression(Evaluation):
     export_as: str = None
     parameters: list[NumberVariable]
     result_types: list[NumberType] | None = None
+    charges_fuel: bool = True
+    fuel_cost: int | None = None
 
     def __str__(self) -> str:
         representation: str = super().__str__()
@@ -46,6 +54,14 @@ class FunctionExpression(Evaluation):
         representation += f' (exported as "{self.export_as}")'
         return representation
 
+    @property
+    def display_name(self) -> str:
+        if self.name is not None:
+            return f'${self.name}'
+        if self.export_as is not None:
+            return f'"{self.export_as}"'
+        return '<anonymous>'
+
     def __init__(self, variables=None) -> None:
         super().__init__()
         self.parameters = []
@@ -55,6 +71,16 @@ class FunctionExpression(Evaluation):
                 self.export_as = export_expression.export_name
                 self.children = self.children[1:]
                 EXPORTED_FUNCTIONS[self.export_as] = self
+        # Inline import: (func $name (import "module" "field") ...)
+        import_expression: ImportExpression | None = None
+        if len(self.children) > 0 and isinstance(self.children[0], ImportExpression):
+            import_expression = self.children[0]
+            self.children = self.children[1:]
+        # (type $t) gives the signature, unless the function spells it out
+        type_expression: TypeExpression | None = None
+        if len(self.children) > 0 and isinstance(self.children[0], TypeExpression):
+            type_expression = self.children[0]
+            self.children = self.children[1:]
         child_index: int = 0
         while child_index < len(self.children) and isinstance(self.children[child_index], ParamExpression):
             parameter_expression: ParamExpression = self.children[child_index]
@@ -70,6 +96,15 @@ class FunctionExpression(Evaluation):
                 self.children = self.children[1:]
         if self.result is not None:
             self.result_types = self.result.number_types
+        if type_expression is not None and child_index == 0 and self.result_types is None:
+            self.parameters = [NumberVariable(parameter.number_type, None) for parameter in type_expression.parameters]
+            self.result_types = type_expression.results or None
+        if import_expression is not None or variables['~import~']:
+            # No body to check, the host function is bound when the module is instantiated
+            self.__class__ = ImportedFunctionExpression
+            if import_expression is not None:
+                self.module_name, self.field_name = import_expression.module_name, import_expression.field_name
+            return
         if self.result_types is not None:
             if not variables['~typing~'] and len(self.result_types) != len(Stack()):
                 raise InvalidFunctionResultError(self, *self.result_types)
@@ -93,17 +128,116 @@ class FunctionExpression(Evaluation):
             if not isinstance(expression, Evaluation):
                 raise TypeError("Expression can not be evaluated")
         return new_local_variables
+
+    def invoke(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None,
+               *args: FixedNumber) -> None:
+        # Call from outside the module (invoke), to which the fuel and time limits apply separately
+        if METER.metering:
+            METER.begin_invocation()
+        self.evaluate(stack, local_variables, global_variables, *args)
+
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None,
                  *args: FixedNumber) -> None:
         super().evaluate(stack, local_variables, global_variables)
         # Check parameters
         local_variables = self.initialize_parameters(local_variables, global_variables, *args)
+        if METER.metering:
+            if self.fuel_cost is None:
+                self.fuel_cost = block_cost(self)
+            METER.charge(self.fuel_cost)
         for evaluation in self.children:
             report: EvaluationReport | None = evaluation.evaluate(stack, local_variables)
-            if report is not None and report.signal_return:
+            if report is not None and (report.signal_return or report.signal_break):
                 break
 
 
+class LazyFunctionExpression(FunctionExpression):
+    # Function of a module parsed with lazy_functions (see ExpressionInstantiater): only the signature and the export
+    # are parsed, the body is kept as text until the first call (or compile_functions). It is then parsed, validated
+    # and the function becomes a FunctionExpression
+    source: str = None
+    source_offset: int | None = None
+    instantiater: Any = None
+
+    def compile(self) -> None:
+        self.instantiater.compile_function(self)
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None,
+                 *args: FixedNumber) -> None:
+        self.compile()
+        self.evaluate(stack, local_variables, global_variables, *args)
+
+
+def compile_functions(module: SExpression) -> None:
+    # Parses and validates the bodies that are still deferred, for the passes that need them (optimizer, inliner...)
+    for child in module.children:
+        if isinstance(child, LazyFunctionExpression):
+            child.compile()
+
+
+class ImportedFunctionExpression(FunctionExpression):
+    module_name: str = None
+    field_name: str = None
+    host: HostFunction | None = None
+
+    def bind(self, host: HostFunction | Callable) -> None:
+        # Plain callables take the signature of the import
+        if not isinstance(host, HostFunction):
+            host = HostFunction(host, [parameter.number_type for parameter in self.parameters],
+                                self.result_types or [])
+        if host.parameter_types != [parameter.number_type for parameter in self.parameters] or \
+                host.result_types != (self.result_types or []):
+            raise IncompatibleImportTypeError(self.module_name, self.field_name)
+        self.host = host
+
+    def __getstate__(self) -> dict:
+        # Host functions are bound again where the module is loaded (parallel.py, snapshot.py)
+        state: dict = self.__dict__.copy()
+        state.pop('host', None)
+        return state
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None,
+                 *args: FixedNumber) -> None:
+        if self.host is None:
+            raise UnknownImportError(self.module_name, self.field_name)
+        if len(args) != len(self.parameters):
+            raise InvalidFunctionSignatureError(self, *args)
+        for result in self.host.call(*args):
+            stack.push(result)
+
+
+class ImportExpression(SExpression):
+    # (import "module" "field" (func ...)), or the (import "module" "field") part of an inline import
+    module_name: str = None
+    field_name: str = None
+    function: ImportedFunctionExpression | None = None
+
+    def __init__(self, variables=None) -> None:
+        super().__init__()
+        variables['~import~'] = False
+        # Both names are parsed as a single child ("module" "field")
+        names: list[str] = re.findall(r'"([^"]*)"', self.children[0].expression_name) if len(self.children) > 0 else []
+        if len(names) != 2:
+            raise InvalidSyntaxError(f'Import expression has incorrect number of names ({len(names)})')
+        self.module_name, self.field_name = names
+        if len(self.children) > 1:
+            if not isinstance(self.children[1], ImportedFunctionExpression):
+                raise InvalidSyntaxError(f'Only functions can be imported, not {self.children[1].expression_name}')
+            self.function = self.children[1]
+            self.function.module_name, self.function.field_name = self.module_name, self.field_name
+        self.children = []
+
+
+def imported_functions(module: SExpression) -> list[ImportedFunctionExpression]:
+    functions: list[ImportedFunctionExpression] = []
+    for child in module.children:
+        if isinstance(child, ImportExpression) and child.function is not None:
+            functions.append(child.function)
+        elif isinstance(child, ImportedFunctionExpression):
+            functions.append(child)
+    return functions
+
+
 class InvokeExpression(Evaluation):
     function: FunctionExpression = None
 
@@ -122,7 +256,7 @@ class InvokeExpression(Evaluation):
         for evaluation in self.children:
             evaluation.evaluate(stack, local_variables)
             parameters.append(stack.pop())
-        self.function.evaluate(stack, local_variables, global_variables, *parameters)
+        self.function.invoke(stack, local_variables, global_variables, *parameters)
 
     def __str__(self):
         return f'{super().__str__()}({self.function.export_as})'
@@ -144,8 +278,8 @@ class CallExpression(Evaluation):
         except KeyError:
             pass
         else:
-            if self.function.result_types is not None:
-                Stack().size_to(len(self.function.result_types))
+            # The arguments are replaced by the results (none for a function without result)
+            Stack().size_to(len(self.function.result_types) if self.function.result_types is not None else 0)
 
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
         super().evaluate(stack, local_variables)
@@ -241,7 +375,7 @@ class TypeExpression(UnaryEvaluation):
     def __init__(self, variables=None) -> None:
         super().__init__(numeric=False, skip_operand_check=True)
         Stack().contract(1)
-        self.expression_name, self.type_name = self.expression_name.split(' ')
+        self.expression_name, _, self.type_name = self.expression_name.partition(' ')
         if len(self.children) != 1:
             operand = variables[self.type_name]
             self.parameters = operand.parameters
@@ -251,11 +385,39 @@ class TypeExpression(UnaryEvaluation):
             function: FunctionExpression = operand
             self.parameters = function.parameters
             self.results = function.result_types
+            # Types are referred to by name or by index, e.g. (type 0) in the output of wasm2wat
+            variables['~types~'].append(self)
+            index: str = str(len(variables['~types~']) - 1)
+            if self.type_name == '':
+                self.type_name = index
             variables[self.type_name] = self
+            variables[index] = self
         variables['~typing~'] = False
 
     def __str__(self):
         return f'{super().__str__()}({self.type_name})'
 
 
+class ModuleExportExpression(ExportExpression):
+    # (export "name" (func $f)) at the top level of a module. Only functions are exported to the host: exports of
+    # the memory, tables and globals are accepted, and the memory stays reachable by host functions through Caller
+
+    def __init__(self, variables=None) -> None:
+        super().__init__()
+        if self.export_kind != 'func':
+            return
+        function: FunctionExpression = self.find_function(variables)
+        function.export_as = self.export_name
+        EXPORTED_FUNCTIONS[self.export_name] = function
+
+    def find_function(self, variables: VariableWatch) -> FunctionExpression:
+        # By name, or by index in the functions of the module (imported ones first)
+        try:
+            if self.reference.startswith('$'):
+                return variables[self.reference]
+            return variables['~functions~'][int(self.reference, 0)]
+        except (KeyError, IndexError, ValueError):
+            raise UnknownFunctionError(self.reference)
+
+
 EXPORTED_FUNCTIONS: dict[str, FunctionExpression] = {}
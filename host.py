@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Iterable
+
+from custom_exceptions import InvalidFunctionResultError
+from enums import NumberType
+from variables import FixedNumber, Memory
+
+
+class Caller:
+    # Passed to host functions that ask for it: access to the linear memory of the guest, without copies.
+    # The views are released when the host function returns (the memory can't grow while they are alive),
+    # so they must not be kept after that
+    _views: list[memoryview]
+
+    def __init__(self):
+        self._views = []
+
+    @property
+    def memory(self) -> memoryview:
+        view: memoryview = Memory().view()
+        self._views.append(view)
+        return view
+
+    def array(self, dtype: Any = 'uint8') -> Any:
+        # NumPy array over the memory, for when NumPy is installed
+        import numpy
+        return numpy.frombuffer(self.memory, dtype=dtype)
+
+    def release(self) -> None:
+        for view in self._views:
+            try:
+                view.release()
+            except BufferError:
+                # Still used by an array the host function kept, which then blocks memory.grow
+                pass
+        self._views = []
+
+
+class HostFunction:
+    # Python function imported by a module. It receives and returns Python numbers (a tuple for several results),
+    # with the Caller first when access_caller is set
+    function: Callable
+    parameter_types: list[NumberType]
+    result_types: list[NumberType]
+    access_caller: bool = False
+    name: str = None
+
+    def __init__(self, function: Callable, parameter_types: Iterable[NumberType | str] = (),
+                 result_types: Iterable[NumberType | str] = (), access_caller: bool = False):
+        self.function = function
+        self.parameter_types = [NumberType(number_type) for number_type in parameter_types]
+        self.result_types = [NumberType(number_type) for number_type in result_types]
+        self.access_caller = access_caller
+        self.name = getattr(function, '__name__', None)
+
+    @property
+    def parameters(self) -> list[NumberType]:
+        # For InvalidFunctionSignatureError
+        return self.parameter_types
+
+    def call(self, *args: FixedNumber) -> list[FixedNumber]:
+        values: list[int | float] = [arg.value for arg in args]
+        if self.access_caller:
+            caller: Caller = Caller()
+            try:
+                result: Any = self.function(caller, *values)
+            finally:
+                caller.release()
+        else:
+            result: Any = self.function(*values)
+        if result is None:
+            results: list[int | float] = []
+        elif isinstance(result, tuple):
+            results = list(result)
+        else:
+            results = [result]
+        if len(results) != len(self.result_types):
+            raise InvalidFunctionResultError(self, *results)
+        return [FixedNumber(value, number_type) for value, number_type in zip(results, self.result_types)]
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import copy
+from dataclasses import dataclass, field
+
+from enums import NumberType
+from evaluations import Evaluation, EvaluationReport, LocalGetter, LocalSetter, LocalCopy, LocalExpression
+from expressions import SExpression, ModuleExpression
+from function import FunctionExpression, CallExpression, ImportedFunctionExpression
+from optimizer import OPERAND_ATTRIBUTES, operands, count_nodes
+from source_map import copy_location
+from superinstructions import FusedEvaluation, FusedLocalSetter, FusedBranchIfExpression
+from variables import Stack, VariableWatch, FixedNumber
+
+
+class InlinedCallExpression(Evaluation):
+    # The children are the call arguments followed by the callee's body
+    function: FunctionExpression = None
+    parameter_slots: list[str]
+    local_slots: list[tuple[str, NumberType]]
+
+    def __init__(self, call: CallExpression, parameter_slots: list[str], local_slots: list[tuple[str, NumberType]],
+                 body: list[Evaluation], **kwargs):
+        self.expression_name = call.expression_name
+        self.function = call.function
+        self.children = call.children + body
+        self.parameter_slots = parameter_slots
+        self.local_slots = local_slots
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        # Same checks as FunctionExpression.initialize_parameters, but the callee's locals live in the caller
+        number_of_parameters: int = len(self.parameter_slots)
+        for index in range(number_of_parameters):
+            self.children[index].evaluate(stack, local_variables)
+            value: FixedNumber = stack.pop()
+            if self.function.parameters[index].number_type != value.number_type:
+                raise TypeError("Invalid parameter type")
+            local_variables[self.parameter_slots[index]] = value
+        for slot, number_type in self.local_slots:
+            local_variables[slot] = FixedNumber(0, number_type)
+        for index in range(number_of_parameters, len(self.children)):
+            report: EvaluationReport | None = self.children[index].evaluate(stack, local_variables)
+            # Returns and branches out of the callee's body end the inlined call
+            if report is not None and (report.signal_return or report.signal_break):
+                break
+
+    def __str__(self) -> str:
+        return f'inlined {self.expression_name}({self.function.display_name})'
+
+
+@dataclass
+class InlinedCallSite:
+    caller: str
+    callee: str
+    site: int
+    size: int
+
+    def __str__(self) -> str:
+        return f'Inlined {self.callee} ({self.size} nodes) into {self.caller} at call #{self.site}'
+
+
+@dataclass
+class InliningReport:
+    call_sites: list[InlinedCallSite] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        lines: list[str] = [str(call_site) for call_site in self.call_sites]
+        lines.append(f'Inlined {len(self.call_sites)} call sites.')
+        return '\n'.join(lines)
+
+
+class Inliner:
+    threshold: int = 20
+    _slot_counter: int = 0
+    _caller: FunctionExpression = None
+    _call_counter: int = 0
+    _report: InliningReport = None
+
+    def __init__(self, threshold: int = 20):
+        self.threshold = threshold
+
+    def inline_module(self, module: ModuleExpression) -> InliningReport:
+        self._report = InliningReport()
+        for child in module.children:
+            if isinstance(child, FunctionExpression):
+                self._caller = child
+                self._call_counter = 0
+                self._inline(child)
+        return self._report
+
+    def _inline(self, expression: SExpression) -> SExpression:
+        if not isinstance(expression, Evaluation):
+            return expression
+        if len(expression.children) > 0:
+            expression.children = [self._inline(child) for child in expression.children]
+        for attribute in OPERAND_ATTRIBUTES:
+            operand = expression.__dict__.get(attribute)
+            if isinstance(operand, Evaluation):
+                setattr(expression, attribute, self._inline(operand))
+        if expression.__class__ is CallExpression:
+            self._call_counter += 1
+            if self.can_inline(expression):
+                return self._inline_call(expression)
+        return expression
+
+    def can_inline(self, call: CallExpression) -> bool:
+        callee: FunctionExpression | None = call.function
+        if callee is None or callee is self._caller or len(call.children) != len(callee.parameters):
+            return False
+        if isinstance(callee, ImportedFunctionExpression):
+            # The body is in the host
+            return False
+        size: int = count_nodes(callee)
+        if size > self.threshold:
+            return False
+        return self._is_leaf(callee)
+
+    @staticmethod
+    def _is_leaf(expression: Evaluation) -> bool:
+        # Calls (which makes the callee non-recursive as well) and fused expressions, whose locals can't be renamed
+        if isinstance(expression, (CallExpression, InlinedCallExpression, FusedEvaluation, FusedLocalSetter,
+                                   FusedBranchIfExpression)):
+            return False
+        return all(Inliner._is_leaf(operand) for operand in operands(expression))
+
+    def _inline_call(self, call: CallExpression) -> Evaluation:
+        callee: FunctionExpression = call.function
+        self._slot_counter += 1
+        prefix: str = f'~inline{self._slot_counter}'
+        # Callee locals are numbered parameters first, then declared locals, like in FunctionExpression
+        slots: dict[int | str, str] = {}
+        parameter_slots: list[str] = []
+        local_slots: list[tuple[str, NumberType]] = []
+        for index, parameter in enumerate(callee.parameters):
+            slot: str = f'{prefix}.{index}'
+            parameter_slots.append(slot)
+            slots[index] = slot
+            if parameter.name is not None:
+                slots[parameter.name.lstrip('$')] = slot
+        body: list[Evaluation] = []
+        for evaluation in callee.children:
+            if isinstance(evaluation, LocalExpression):
+                index: int = len(parameter_slots) + len(local_slots)
+                slot: str = f'{prefix}.{index}'
+                local_slots.append((slot, evaluation.number_type))
+                slots[index] = slot
+                if evaluation.variable_name is not None:
+                    slots[evaluation.variable_name.lstrip('$')] = slot
+            else:
+                body.append(copy.deepcopy(evaluation))
+        try:
+            for evaluation in body:
+                self._rename_locals(evaluation, slots)
+        except KeyError:
+            # Unknown local, keep the call so that it fails at run time like before
+            return call
+        self._report.call_sites.append(
+            InlinedCallSite(self._caller.display_name, callee.display_name, self._call_counter, count_nodes(callee)))
+        inlined_call: InlinedCallExpression = InlinedCallExpression(call, parameter_slots, local_slots, body)
+        copy_location(call, inlined_call)
+        return inlined_call
+
+    def _rename_locals(self, expression: Evaluation, slots: dict[int | str, str]) -> None:
+        if isinstance(expression, (LocalGetter, LocalSetter)):
+            expression.name = slots[self._local_key(expression.name)]
+        if isinstance(expression, LocalCopy):
+            expression.source = slots[self._local_key(expression.source)]
+        for operand in operands(expression):
+            self._rename_locals(operand, slots)
+
+    @staticmethod
+    def _local_key(name: int | str) -> int | str:
+        return name.lstrip('$') if isinstance(name, str) else name
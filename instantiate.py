@@ -2,7 +2,9 @@ from __future__ import annotations
 
 import re
 import sys
+import time
 from re import Match
+from typing import Any
 
 from expressions import *
 from function import *
@@ -11,11 +13,14 @@ from operations import *
 from assertions import *
 from stackoperations import *
 from logic import *
+from atomics import *
+from source_map import SourceMap, record_location
 
 CLASSES_DICT: dict[str, str] = {
     'module': 'ModuleExpression',
     'func': 'FunctionExpression',
     'export': 'ExportExpression',
+    'import': 'ImportExpression',
     'param': 'ParamExpression',
     'result': 'ResultExpression',
     'local.get': 'LocalGetter',
@@ -52,8 +57,8 @@ CLASSES_DICT: dict[str, str] = {
     'gt_u': 'GtuExpression',
     'ge_s': 'GesExpression',
     'ge_u': 'GeuExpression',
-    'f32.gt': 'F32GTExpression',
     'ctz': 'CtzExpression',
+    'extend_i32_s': 'Extendi32sExpression',
     'extend_i32_u': 'Extendi32uExpression',
     'extend8_s': 'Extend8Expression',
     'extend16_s': 'Extend16Expression',
@@ -76,6 +81,27 @@ CLASSES_DICT: dict[str, str] = {
     'type': 'TypeExpression',
     'call_indirect': 'CallIndirectExpression',
     'memory.grow': 'MemoryGrowExpression',
+    'atomic.load': 'AtomicLoadExpression',
+    'atomic.store': 'AtomicStoreExpression',
+    'atomic.rmw.add': 'AtomicRmwExpression',
+    'atomic.rmw.sub': 'AtomicRmwExpression',
+    'atomic.rmw.and': 'AtomicRmwExpression',
+    'atomic.rmw.or': 'AtomicRmwExpression',
+    'atomic.rmw.xor': 'AtomicRmwExpression',
+    'atomic.rmw.xchg': 'AtomicRmwExpression',
+    'atomic.rmw.cmpxchg': 'AtomicCompareExchangeExpression',
+    'memory.atomic.wait32': 'AtomicWaitExpression',
+    'memory.atomic.wait64': 'AtomicWaitExpression',
+    'memory.atomic.notify': 'AtomicNotifyExpression',
+    'atomic.fence': 'AtomicFenceExpression',
+    'memory.size': 'MemorySizeExpression',
+    'memory.copy': 'MemoryCopyExpression',
+    'memory.fill': 'MemoryFillExpression',
+    'memory.init': 'MemoryInitExpression',
+    'data.drop': 'DataDropExpression',
+    'memory': 'MemoryExpression',
+    'data': 'DataExpression',
+    'offset': 'OffsetExpression',
     'store': 'StoreExpression',
     'mul': 'MulExpression',
     'nop': 'NOPExpression',
@@ -83,14 +109,79 @@ CLASSES_DICT: dict[str, str] = {
     'br': 'BranchExpression',
     'br_if': 'BranchIfExpression',
     'br_table': 'BranchTableExpression',
-    'gt': 'F32GTExpression',
     'unreachable': 'UnreachableExpression',
     'global': 'GlobalExpression',
     'wrap_i64': 'WrapI64Expression',
     'i16x8.extadd_pairwise_i8x16_s': 'AddPairwiseSignedExpression',
     'i16x8.extadd_pairwise_i8x16_u': 'AddPairwiseUnsignedExpression',
+    # Float operations sharing their name with an integer operation are matched on the full name
+    'f32.add': 'FloatAddExpression',
+    'f64.add': 'FloatAddExpression',
+    'f32.sub': 'FloatSubExpression',
+    'f64.sub': 'FloatSubExpression',
+    'f32.mul': 'FloatMulExpression',
+    'f64.mul': 'FloatMulExpression',
+    'f32.eq': 'FloatEqExpression',
+    'f64.eq': 'FloatEqExpression',
+    'f32.ne': 'FloatNeExpression',
+    'f64.ne': 'FloatNeExpression',
+    'div': 'FloatDivExpression',
+    'min': 'FloatMinExpression',
+    'max': 'FloatMaxExpression',
+    'copysign': 'FloatCopysignExpression',
+    'sqrt': 'FloatSqrtExpression',
+    'ceil': 'FloatCeilExpression',
+    'floor': 'FloatFloorExpression',
+    'trunc': 'FloatTruncExpression',
+    'nearest': 'FloatNearestExpression',
+    'abs': 'FloatAbsExpression',
+    'neg': 'FloatNegExpression',
+    'lt': 'FloatLtExpression',
+    'le': 'FloatLeExpression',
+    'gt': 'FloatGtExpression',
+    'ge': 'FloatGeExpression',
+    'convert_i32_s': 'ConvertSignedExpression',
+    'convert_i64_s': 'ConvertSignedExpression',
+    'convert_i32_u': 'ConvertUnsignedExpression',
+    'convert_i64_u': 'ConvertUnsignedExpression',
+    'trunc_f32_s': 'TruncSignedExpression',
+    'trunc_f64_s': 'TruncSignedExpression',
+    'trunc_f32_u': 'TruncUnsignedExpression',
+    'trunc_f64_u': 'TruncUnsignedExpression',
+    'trunc_sat_f32_s': 'TruncSatSignedExpression',
+    'trunc_sat_f64_s': 'TruncSatSignedExpression',
+    'trunc_sat_f32_u': 'TruncSatUnsignedExpression',
+    'trunc_sat_f64_u': 'TruncSatUnsignedExpression',
+    'promote_f32': 'PromoteExpression',
+    'demote_f64': 'DemoteExpression',
+    'reinterpret_f32': 'ReinterpretExpression',
+    'reinterpret_f64': 'ReinterpretExpression',
+    'reinterpret_i32': 'ReinterpretExpression',
+    'reinterpret_i64': 'ReinterpretExpression',
 }
 
+
+def lookup_class_name(expression_name: str) -> str | None:
+    # Check if it's a predefined function
+    new_type: str = expression_name
+    if new_type in CLASSES_DICT.keys():
+        # Full names take precedence (e.g. f32.add over add)
+        pass
+    elif re.fullmatch(r'.{3}\.([a-z_0-9]+)', expression_name) is not None:
+        new_type = new_type[4:]
+    elif re.fullmatch(r'i(32|64)\.atomic\..+', expression_name) is not None:
+        new_type = new_type[4:]
+    elif re.fullmatch(r'v128\..+', expression_name) is not None:
+        new_type = new_type[5:]
+    return CLASSES_DICT.get(new_type)
+
+
+# Parts of a module (rather than instructions), whose constructors set up the module
+DEFINITION_TYPES: tuple[type, ...] = (ModuleExpression, FunctionExpression, ExportExpression, ImportExpression,
+                                      ParamExpression, ResultExpression, LocalExpression, GlobalExpression,
+                                      TypeExpression, TableFunctionExpression, ElementExpression, MemoryExpression,
+                                      DataExpression)
+
 WARNING_CODE = '\033[93m'
 FAIL_CODE = '\033[91m'
 ENDC = '\033[0m'
@@ -98,14 +189,38 @@ ENDC = '\033[0m'
 
 class ExpressionInstantiater:
     temporary_variables: VariableWatch = None
+    source_map: SourceMap | None = None
+    # Nanoseconds spent in the constructors of the instructions (type checking on the Stack) and of the definitions
+    # (registering functions, exports, globals...), as opposed to parsing
+    validate_time: int = 0
+    instantiate_time: int = 0
+    # Names of the expressions without a class, reported by the caller (nothing is printed or written while parsing)
+    not_implemented: list[str] = None
+    # Function bodies are parsed on their first call (see LazyFunctionExpression)
+    lazy_functions: bool = False
 
-    def __init__(self):
+    def __init__(self, source_map: SourceMap | None = None, lazy_functions: bool = False, instantiate: bool = True):
+        # Without instantiate, the memory and the data segments are left for instantiate_module (see api.py)
+        self.source_map = source_map
+        self.lazy_functions = lazy_functions
+        self.validate_time = 0
+        self.instantiate_time = 0
+        self.not_implemented = []
         self.temporary_variables = VariableWatch()
         self.temporary_variables.add_variable(False, '~typing~')
         self.temporary_variables.add_variable(False, '~assert~')
         self.temporary_variables.add_variable(0, '~blocks~')
+        self.temporary_variables.add_variable(False, '~import~')
+        self.temporary_variables.add_variable(instantiate, '~instantiate~')
+        # Data segments of the module, by index and by name
+        self.temporary_variables.add_variable([], '~data~')
+        self.temporary_variables.add_variable({}, '~data_names~')
+        # Types and functions of the module, by index
+        self.temporary_variables.add_variable([], '~types~')
+        self.temporary_variables.add_variable([], '~functions~')
 
-    def create_expression(self, expression_string: str, **kwargs) -> SExpression:
+    def create_expression(self, expression_string: str, offset: int | None = None, **kwargs) -> SExpression:
+        # offset is the position of expression_string in the normalized source, for the source map
         instance = SExpression()
 
         # Check if expression has surrounding parentheses
@@ -115,6 +230,15 @@ class ExpressionInstantiater:
             instance.expression_name = expression_string
             return instance
 
+        if self.lazy_functions and expression_string.startswith('(func ') and not self.temporary_variables['~assert~'] \
+                and not self.temporary_variables['~import~'] and not self.temporary_variables['~typing~']:
+            function: LazyFunctionExpression | None = self.create_lazy_function(expression_string, offset)
+            if function is not None:
+                return function
+
+        source_string: str = expression_string
+        source_cursor: int = 0
+
         # Remove redundant parentheses
         expression_string = expression_string[1:-1].strip()
 
@@ -134,7 +258,12 @@ class ExpressionInstantiater:
                 triple_expression: list[str] = expression_string.split(' ', 2)
             else:
                 triple_expression: list[str] = expression_string.split(' ', 1) + ['']
-            split_expression: tuple[str, ...] = (f'{triple_expression[0]} {triple_expression[1]}', triple_expression[2])
+            if triple_expression[1].startswith('('):
+                # Without name or index, e.g. (type (func ...)) in the output of wasm2wat
+                split_expression: tuple[str, ...] = tuple(expression_string.split(' ', 1))
+            else:
+                split_expression: tuple[str, ...] = (f'{triple_expression[0]} {triple_expression[1]}',
+                                                     triple_expression[2])
             if expression_string.startswith('invoke'):
                 instance.__class__ = InvokeExpression
             elif expression_string.startswith('call'):
@@ -176,24 +305,16 @@ class ExpressionInstantiater:
             instance.name = children_parentheses[0][1:]
             children_parentheses.pop(0)
 
-        # Check if it's a predefined function
-        new_type: str = instance.expression_name
-        if re.fullmatch(r'.{3}\.([a-z_0-9]+)', instance.expression_name) is not None:
-            new_type = new_type[4:]
-        elif re.fullmatch(r'v128\..+', instance.expression_name) is not None:
-            new_type = new_type[5:]
-
         # Check expression type
-        if new_type in CLASSES_DICT.keys():
-            instance.__class__ = getattr(sys.modules[__name__], CLASSES_DICT[new_type])
+        class_name: str | None = lookup_class_name(instance.expression_name)
+        if class_name is not None:
+            instance.__class__ = getattr(sys.modules[__name__], class_name)
 
         if instance.__class__ == SExpression:
             if kwargs.get('debug', False):
                 raise NotImplementedError(f'Not implemented {instance.expression_name}!')
             else:
-                with open('not_implemented.txt', 'a') as f:
-                    f.write(f'{instance.expression_name}\n')
-                print(f'{WARNING_CODE}Not implemented {instance.expression_name}!{ENDC}')
+                self.not_implemented.append(instance.expression_name)
 
         initial_stack_size: int = len(Stack())
         restore_stack: bool = False
@@ -209,12 +330,29 @@ class ExpressionInstantiater:
         if isinstance(instance, AssertInvalidExpression):
             self.temporary_variables.add_variable(True, '~assert~')
 
+        if isinstance(instance, ImportExpression):
+            self.temporary_variables.add_variable(True, '~import~')
+
         c = []
         if_parsed_type: bool = False
         if_parsed_condition: bool = False
         for x in children_parentheses:
+            if isinstance(instance, ExportExpression) and x.startswith('('):
+                # (func $f), (memory 0)... refers to a definition of the module, rather than being one
+                instance.__class__ = ModuleExportExpression
+                reference: SExpression = SExpression()
+                reference.expression_name = x[1:-1].strip()
+                c.append(reference)
+                continue
             try:
-                c.append(self.create_expression(x))
+                child_offset: int | None = None
+                if offset is not None:
+                    # Children are substrings of the expression, in order
+                    position: int = source_string.find(x, source_cursor)
+                    if position >= 0:
+                        child_offset = offset + position
+                        source_cursor = position + len(x)
+                c.append(self.create_expression(x, offset=child_offset))
             except WebAssemblyException as e:
                 if not isinstance(instance, AssertInvalidExpression):
                     raise e
@@ -260,7 +398,17 @@ class ExpressionInstantiater:
             # Remove the variable name from the children
             instance.children = instance.children[1:]
 
-        instance.__init__(variables=self.temporary_variables)
+        if offset is not None and self.source_map is not None:
+            record_location(instance, self.source_map, offset)
+
+        start: int = time.perf_counter_ns()
+        try:
+            instance.__init__(variables=self.temporary_variables)
+        finally:
+            if isinstance(instance, DEFINITION_TYPES):
+                self.instantiate_time += time.perf_counter_ns() - start
+            else:
+                self.validate_time += time.perf_counter_ns() - start
 
         if isinstance(instance, IfExpression) and not if_parsed_condition:
             if len(Stack()) == 0:
@@ -272,6 +420,63 @@ class ExpressionInstantiater:
             Stack().pop_stack()
         elif isinstance(instance, ThenExpression) or isinstance(instance, ElseExpression):  # Reset local stack
             Stack().size_to(initial_stack_size)
-        if instance.name is not None:
+        if instance.name is not None and kwargs.get('register', True):
             self.temporary_variables.add_variable(instance, instance.name)
+        if isinstance(instance, FunctionExpression) and kwargs.get('register', True) \
+                and not self.temporary_variables['~typing~']:
+            # Index space of the functions, imported ones first (the functions of type definitions aren't in it)
+            self.temporary_variables['~functions~'].append(instance)
         return instance
+
+    def create_lazy_function(self, expression_string: str, offset: int | None) -> LazyFunctionExpression | None:
+        # Parses the name, export, parameters and results, and keeps the rest as text. Functions that import or use
+        # a type are parsed right away, as are functions without a body
+        name, _, children_string = expression_string[len('(func '):-1].strip().partition(' ')
+        if not name.startswith('$'):
+            name, children_string = '', expression_string[len('(func '):-1].strip()
+        children: list[str] = SExpression.get_parentheses(children_string)
+        if any(child.startswith(('(import', '(type')) for child in children):
+            return None
+        header: list[str] = []
+        for child in children:
+            if not child.startswith(('(export', '(param', '(result')):
+                break
+            header.append(child)
+        if len(header) == len(children):
+            return None
+        # The body isn't there to produce the results
+        typing: bool = self.temporary_variables['~typing~']
+        self.temporary_variables['~typing~'] = True
+        try:
+            function: SExpression = self.create_expression(' '.join(['(func'] + ([name] if name else []) + header) + ')')
+        finally:
+            self.temporary_variables['~typing~'] = typing
+        function.__class__ = LazyFunctionExpression
+        function.source, function.source_offset, function.instantiater = expression_string, offset, self
+        self.temporary_variables['~functions~'].append(function)
+        if offset is not None and self.source_map is not None:
+            record_location(function, self.source_map, offset)
+        return function
+
+    def compile_function(self, function: LazyFunctionExpression) -> None:
+        # Parses the whole function again, on a stack of its own (it may be called in the middle of another function),
+        # and moves the body to the lazy function: the calls and exports parsed until now refer to it
+        stack: Stack = Stack()
+        stack_state: tuple[list[list[Any]], int] = stack.save()
+        previous_export: FunctionExpression | None = EXPORTED_FUNCTIONS.get(function.export_as)
+        stack.init()
+        self.lazy_functions = False
+        try:
+            compiled: SExpression = self.create_expression(function.source, offset=function.source_offset,
+                                                           register=False)
+        finally:
+            self.lazy_functions = True
+            stack.restore(stack_state)
+            if function.export_as is not None:
+                if previous_export is not None:
+                    EXPORTED_FUNCTIONS[function.export_as] = previous_export
+                else:
+                    EXPORTED_FUNCTIONS.pop(function.export_as, None)
+        function.children = compiled.children
+        function.__class__ = FunctionExpression
+        del function.source, function.source_offset, function.instantiater
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+from custom_exceptions import DivisionByZeroError, IntegerOverflowError
+from enums import NumberType
+
+# Shared i32/i64 arithmetic. Values are kept as signed (two's complement) Python integers and every result is wrapped
+# back into the signed range of its width, so an operation never needs more than a couple of integer operations.
+
+BITS: dict[NumberType, int] = {NumberType.i32: 32, NumberType.i64: 64}
+
+# MASKS[n] has the lowest n bits set
+MASKS: tuple[int, ...] = tuple((1 << bits) - 1 for bits in range(65))
+# SIGN_BITS[n] is the sign bit of an n bits integer
+SIGN_BITS: tuple[int, ...] = (0,) + tuple(1 << (bits - 1) for bits in range(1, 65))
+MINIMUMS: tuple[int, ...] = tuple(-sign_bit for sign_bit in SIGN_BITS)
+
+
+def wrap(value: int, bits: int) -> int:
+    sign_bit: int = SIGN_BITS[bits]
+    return ((value + sign_bit) & MASKS[bits]) - sign_bit
+
+
+def to_unsigned(value: int, bits: int) -> int:
+    return value & MASKS[bits]
+
+
+def add(first: int, second: int, bits: int) -> int:
+    return wrap(first + second, bits)
+
+
+def sub(first: int, second: int, bits: int) -> int:
+    return wrap(first - second, bits)
+
+
+def mul(first: int, second: int, bits: int) -> int:
+    return wrap(first * second, bits)
+
+
+def div_s(first: int, second: int, bits: int) -> int:
+    if second == 0:
+        raise DivisionByZeroError()
+    if first == MINIMUMS[bits] and second == -1:
+        raise IntegerOverflowError()
+    # Truncating division
+    quotient: int = abs(first) // abs(second)
+    return -quotient if (first < 0) != (second < 0) else quotient
+
+
+def div_u(first: int, second: int, bits: int) -> int:
+    second &= MASKS[bits]
+    if second == 0:
+        raise DivisionByZeroError()
+    return wrap((first & MASKS[bits]) // second, bits)
+
+
+def rem_s(first: int, second: int, bits: int) -> int:
+    if second == 0:
+        raise DivisionByZeroError()
+    # The remainder has the sign of the dividend
+    remainder: int = abs(first) % abs(second)
+    return -remainder if first < 0 else remainder
+
+
+def rem_u(first: int, second: int, bits: int) -> int:
+    second &= MASKS[bits]
+    if second == 0:
+        raise DivisionByZeroError()
+    return wrap((first & MASKS[bits]) % second, bits)
+
+
+def and_(first: int, second: int, bits: int) -> int:
+    return first & second
+
+
+def or_(first: int, second: int, bits: int) -> int:
+    return first | second
+
+
+def xor(first: int, second: int, bits: int) -> int:
+    return first ^ second
+
+
+def shl(first: int, second: int, bits: int) -> int:
+    return wrap(first << (second & (bits - 1)), bits)
+
+
+def shr_s(first: int, second: int, bits: int) -> int:
+    return first >> (second & (bits - 1))
+
+
+def shr_u(first: int, second: int, bits: int) -> int:
+    return wrap((first & MASKS[bits]) >> (second & (bits - 1)), bits)
+
+
+def rotl(first: int, second: int, bits: int) -> int:
+    unsigned: int = first & MASKS[bits]
+    shift: int = second & (bits - 1)
+    return wrap((unsigned << shift) | (unsigned >> (bits - shift)), bits)
+
+
+def rotr(first: int, second: int, bits: int) -> int:
+    unsigned: int = first & MASKS[bits]
+    shift: int = second & (bits - 1)
+    return wrap((unsigned >> shift) | (unsigned << (bits - shift)), bits)
+
+
+def clz(value: int, bits: int) -> int:
+    return bits - (value & MASKS[bits]).bit_length()
+
+
+def ctz(value: int, bits: int) -> int:
+    if value & MASKS[bits] == 0:
+        return bits
+    # value & -value keeps only the lowest set bit
+    return (value & -value).bit_length() - 1
+
+
+def popcnt(value: int, bits: int) -> int:
+    return (value & MASKS[bits]).bit_count()
+
+
+def extend_s(value: int, from_bits: int) -> int:
+    return wrap(value, from_bits)
+
+
+def extend_u(value: int, from_bits: int) -> int:
+    return value & MASKS[from_bits]
+
+
+def eqz(value: int, bits: int) -> int:
+    return 1 if value == 0 else 0
+
+
+def eq(first: int, second: int, bits: int) -> int:
+    return 1 if first == second else 0
+
+
+def ne(first: int, second: int, bits: int) -> int:
+    return 1 if first != second else 0
+
+
+def lt_s(first: int, second: int, bits: int) -> int:
+    return 1 if first < second else 0
+
+
+def lt_u(first: int, second: int, bits: int) -> int:
+    return 1 if first & MASKS[bits] < second & MASKS[bits] else 0
+
+
+def le_s(first: int, second: int, bits: int) -> int:
+    return 1 if first <= second else 0
+
+
+def le_u(first: int, second: int, bits: int) -> int:
+    return 1 if first & MASKS[bits] <= second & MASKS[bits] else 0
+
+
+def gt_s(first: int, second: int, bits: int) -> int:
+    return 1 if first > second else 0
+
+
+def gt_u(first: int, second: int, bits: int) -> int:
+    return 1 if first & MASKS[bits] > second & MASKS[bits] else 0
+
+
+def ge_s(first: int, second: int, bits: int) -> int:
+    return 1 if first >= second else 0
+
+
+def ge_u(first: int, second: int, bits: int) -> int:
+    return 1 if first & MASKS[bits] >= second & MASKS[bits] else 0
@@ -1,13 +1,24 @@
 from __future__ import annotations
 
+import time
 from argparse import ArgumentParser, Namespace
-from os.path import exists
+from os.path import exists, splitext
 from typing import Generator, TYPE_CHECKING
-import re
 from instantiate import ExpressionInstantiater
 
-from expressions import SExpression
-from assertions import AssertExpression
+from expressions import SExpression, ModuleExpression
+from assertions import AssertExpression, AssertReturnBatch, BatchedAssertion
+from optimizer import Optimizer
+from report import AssertionResult, TestReport
+from profiler import Profiler
+from sampling_profiler import SamplingProfiler
+from inliner import Inliner
+from custom_exceptions import WebAssemblyException
+from function import EXPORTED_FUNCTIONS, compile_functions
+from fuel import FuelMeter
+from module_cache import ModuleCache, cacheable
+from source_map import SourceLocation, normalize, location_of, locate_exception
+from superinstructions import Fuser, FusionProfiler, read_fusion_profile
 from variables import Stack
 
 WARNING_CODE = '\033[93m'
@@ -17,41 +28,167 @@ ENDC = '\033[0m'
 DEBUG = False
 
 
+def report_not_implemented(names: list[str]) -> None:
+    if len(names) == 0:
+        return
+    with open('not_implemented.txt', 'a') as not_implemented_file:
+        not_implemented_file.writelines(f'{name}\n' for name in names)
+    for name in names:
+        print(f'{WARNING_CODE}Not implemented {name}!{ENDC}')
+
+
 # Generator for more efficient parsing
-def read_expressions(input_file_name: str) -> Generator[SExpression, None, None]:
+def read_timed_expressions(input_file_name: str, batch_assertions: bool = False, cache_modules: bool = True,
+                           lazy_functions: bool = False) \
+        -> Generator[tuple[SExpression | AssertReturnBatch, int, int, int], None, None]:
+    # Every top-level expression, with the nanoseconds spent parsing, validating and instantiating it.
+    # With batch_assertions, consecutive assert_return of constants against the same export are grouped instead
+    # (their times are kept in each BatchedAssertion). With cache_modules, modules seen before are only instantiated.
+    # With lazy_functions, function bodies are parsed and validated on their first call, as part of the execution
     with open(input_file_name, 'r') as input_file:
-        # Remove comments
-        expression_string: str = re.sub(r';.*', '', input_file.read()).replace('\n', '')
-        expression_string = re.sub(" +", " ", expression_string)
-        expression_string = expression_string.replace('if(then', 'if (then')
-    for index, string in enumerate(SExpression.get_parentheses(expression_string)):
-        instantiater = ExpressionInstantiater()
-        if DEBUG:
-            # print(f"Parsed expression #{index}: {string}")
-            try:
-                yield instantiater.create_expression(string)
-            except NotImplementedError as error:
-                # print(error)
-                pass
+        # Remove comments and whitespace, keeping track of the original lines
+        expression_string, source_map = normalize(input_file.read(), input_file_name)
+    batch: AssertReturnBatch | None = None
+    for offset, string in SExpression.iterate_parentheses(expression_string):
+        if batch_assertions:
+            start: int = time.perf_counter_ns()
+            parsed: tuple[str, BatchedAssertion] | None = AssertReturnBatch.parse(string)
+            if parsed is not None:
+                export_name, assertion = parsed
+                assertion.offset = offset
+                assertion.parse_time = time.perf_counter_ns() - start
+                if batch is not None and batch.export_name != export_name:
+                    yield batch, 0, 0, 0
+                    batch = None
+                if batch is None and export_name in EXPORTED_FUNCTIONS:
+                    batch = AssertReturnBatch(export_name, source_map)
+                if batch is not None:
+                    batch.assertions.append(assertion)
+                    continue
+            if batch is not None:
+                yield batch, 0, 0, 0
+                batch = None
+        use_cache: bool = cache_modules and cacheable(string)
+        if use_cache:
+            start: int = time.perf_counter_ns()
+            cached: SExpression | None = ModuleCache().lookup(string)
+            if cached is not None:
+                yield cached, 0, 0, time.perf_counter_ns() - start
+                continue
+        instantiater = ExpressionInstantiater(source_map, lazy_functions)
+        start: int = time.perf_counter_ns()
+        try:
+            if DEBUG:
+                # print(f"Parsed expression: {string}")
+                try:
+                    expression: SExpression = instantiater.create_expression(string, offset=offset)
+                except NotImplementedError as error:
+                    # print(error)
+                    continue
+            else:
+                expression: SExpression = instantiater.create_expression(string, offset=offset)
+        finally:
+            elapsed: int = time.perf_counter_ns() - start
+            report_not_implemented(instantiater.not_implemented)
+        if use_cache:
+            ModuleCache().store(string, expression)
+        yield expression, elapsed - instantiater.validate_time - instantiater.instantiate_time, \
+            instantiater.validate_time, instantiater.instantiate_time
+    if batch is not None:
+        yield batch, 0, 0, 0
+
+
+def read_expressions(input_file_name: str) -> Generator[SExpression, None, None]:
+    for expression, _, _, _ in read_timed_expressions(input_file_name):
+        yield expression
+
+
+def check_asserts(input_file_name: str, optimize: bool = False, inliner: Inliner | None = None,
+                  fuser: Fuser | None = None, fusion_profiler: FusionProfiler | None = None,
+                  quiet: bool = False, batch_assertions: bool = True, cache_modules: bool = True,
+                  lazy_functions: bool = False) -> TestReport:
+    report: TestReport = TestReport(input_file_name)
+    meter: FuelMeter = FuelMeter()
+    # In quiet mode nothing is printed until the end, and then only the failures
+    failures: list[str] = []
+
+    def output(line: str, failure: bool = False) -> None:
+        if not quiet:
+            print(line)
+        elif failure:
+            failures.append(line)
+
+    def record(expression: AssertExpression | AssertReturnBatch, asserted: bool, caught: bool,
+               trap: WebAssemblyException | None, location: SourceLocation | None, invoked: bool, *times: int) -> None:
+        # caught: the trap happened where a result was expected
+        assertion_index: int = len(report.results)
+        if caught:
+            trap_location: SourceLocation | None = locate_exception(trap)
+            output(f'{FAIL_CODE}Trap: {trap}' + (f' at {trap_location}' if trap_location else '') + ENDC,
+                   failure=True)
+        if asserted:
+            output(f'Assertion #{assertion_index} of type "{expression}" was successful! ({expression.expression_name})')
         else:
-            yield instantiater.create_expression(string)
+            output(f'{FAIL_CODE}Assertion #{assertion_index} of type "{expression}" was unsuccessful! ({expression.expression_name})' +
+                   (f' at {location}' if location else '') + f' {ENDC}', failure=True)
+        if invoked:
+            output(f'    Fuel consumed: {meter.consumed}')
+        report.results.append(AssertionResult(assertion_index, expression.expression_name, asserted,
+                                              trap.__class__.__name__ if trap is not None else None,
+                                              str(location) if location else None, *times))
 
+    # Cached modules are shared between instances, so they are only transformed once
+    transformed: set[ModuleExpression] = set()
 
-def check_asserts(input_file_name: str) -> None:
-    number_of_correct_assertions: int = 0
-    assertion_index: int = 0
-    for expression in read_expressions(input_file_name):
+    for expression, parse_time, validate_time, instantiate_time in read_timed_expressions(input_file_name,
+                                                                                          batch_assertions,
+                                                                                          cache_modules,
+                                                                                          lazy_functions):
         Stack().init()
+        if isinstance(expression, ModuleExpression) and expression not in transformed:
+            transformed.add(expression)
+            if inliner is not None or optimize or fuser is not None or fusion_profiler is not None:
+                # The transformations need the bodies
+                compile_functions(expression)
+            if inliner is not None:
+                output(str(inliner.inline_module(expression)))
+            if optimize:
+                output(str(Optimizer().optimize_module(expression)))
+            if fuser is not None:
+                fused = fuser.fuse_module(expression)
+                output(f'Superinstructions: {dict(fused.most_common())}')
+            if fusion_profiler is not None:
+                fusion_profiler.instrument_module(expression)
+        if isinstance(expression, AssertReturnBatch):
+            invocations: int = meter.invocations
+            for assertion, asserted, execute_time in expression.run():
+                location: SourceLocation | None = None
+                if assertion.offset is not None:
+                    location = expression.source_map.location(assertion.offset)
+                record(expression, asserted, assertion.trap is not None, assertion.trap, location,
+                       meter.invocations != invocations, assertion.parse_time, 0, 0, execute_time)
+                invocations = meter.invocations
         if isinstance(expression, AssertExpression):
-            asserted: bool = expression.assert_expression()
-            if asserted:
-                number_of_correct_assertions += 1
-                print(f'Assertion #{assertion_index} of type "{expression}" was successful! ({expression.expression_name})')
-            else:
-                print(f'{FAIL_CODE}Assertion #{assertion_index} of type "{expression}" was unsuccessful! ({expression.expression_name}) {ENDC}')
-            assertion_index += 1
+            invocations: int = meter.invocations
+            caught: bool = False
+            start: int = time.perf_counter_ns()
+            try:
+                asserted: bool = expression.assert_expression()
+            except WebAssemblyException as exception:
+                # A trap where a result was expected
+                asserted = False
+                caught = True
+                expression.trap = exception
+            execute_time: int = time.perf_counter_ns() - start
+            record(expression, asserted, caught, expression.trap, location_of(expression),
+                   meter.invocations != invocations, parse_time, validate_time, instantiate_time, execute_time)
+    for line in failures:
+        print(line)
     print()
-    print(f'Correct assertions: {number_of_correct_assertions}/{assertion_index}.')
+    print(f'Correct assertions: {report.passed}/{len(report.results)}.')
+    if meter.metering:
+        print(f'Fuel consumed: {meter.total_consumed} in {meter.invocations} invocations.')
+    return report
 
 
 if __name__ == '__main__':
@@ -63,6 +200,36 @@ if __name__ == '__main__':
     )
 
     parser.add_argument("input_file")
+    parser.add_argument("--optimize", action="store_true",
+                        help="fold constants and remove redundant expressions before running the assertions")
+    parser.add_argument("--inline", type=int, metavar="THRESHOLD",
+                        help="inline calls to leaf functions with at most THRESHOLD expressions")
+    parser.add_argument("--superinstructions", metavar="all|PROFILE",
+                        help="fuse common expression sequences (all of them, or the ones selected in a profile)")
+    parser.add_argument("--profile-superinstructions", metavar="PROFILE",
+                        help="count how often each superinstruction runs and save the selection to a profile")
+    parser.add_argument("--profile", metavar="OUTPUT",
+                        help="time every expression and function, saving OUTPUT.json and OUTPUT.folded (flamegraph)")
+    parser.add_argument("--sample", metavar="OUTPUT",
+                        help="periodically sample the guest call stack, saving OUTPUT.json and OUTPUT.folded")
+    parser.add_argument("--sample-interval", type=float, default=5, metavar="MS",
+                        help="milliseconds between two samples (default 5)")
+    parser.add_argument("--fuel", type=int, metavar="UNITS",
+                        help="trap when an invocation runs more than UNITS expressions (charged per loop iteration and call)")
+    parser.add_argument("--deadline", type=float, metavar="MS",
+                        help="trap when an invocation runs for more than MS milliseconds")
+    parser.add_argument("--report", choices=("json", "junit"),
+                        help="save the result and the parse, instantiate and execute times of every assertion")
+    parser.add_argument("--report-output", metavar="FILE",
+                        help="where to save the report (default: the input file with a .report.json/.report.xml suffix)")
+    parser.add_argument("--quiet", action="store_true",
+                        help="only print the failed assertions and the summary")
+    parser.add_argument("--no-module-cache", action="store_true",
+                        help="parse and validate every module, even the ones seen before")
+    parser.add_argument("--no-batch", action="store_true",
+                        help="build every assert_return separately, instead of batching the ones with constants")
+    parser.add_argument("--lazy", action="store_true",
+                        help="parse and validate function bodies on their first call instead of with their module")
 
     args: Namespace = parser.parse_args()
 
@@ -72,7 +239,52 @@ if __name__ == '__main__':
     # if DEBUG:
     #     open('not_implemented.txt', 'w').close()
 
-    check_asserts(args.input_file)
+    fuser: Fuser | None = None
+    if args.superinstructions is not None:
+        fuser = Fuser(None if args.superinstructions == 'all' else read_fusion_profile(args.superinstructions))
+    fusion_profiler: FusionProfiler | None = None
+    if args.profile_superinstructions is not None:
+        fusion_profiler = FusionProfiler()
+
+    inliner: Inliner | None = Inliner(args.inline) if args.inline is not None else None
+
+    FuelMeter().configure(args.fuel, args.deadline / 1000 if args.deadline is not None else None)
+
+    profiler: Profiler | None = Profiler() if args.profile is not None else None
+    if profiler is not None:
+        profiler.enable()
+    sampling_profiler: SamplingProfiler | None = None
+    if args.sample is not None:
+        sampling_profiler = SamplingProfiler(args.sample_interval / 1000)
+        sampling_profiler.start()
+
+    report: TestReport = check_asserts(args.input_file, optimize=args.optimize, inliner=inliner, fuser=fuser,
+                                       fusion_profiler=fusion_profiler, quiet=args.quiet,
+                                       batch_assertions=not args.no_batch, cache_modules=not args.no_module_cache,
+                                       lazy_functions=args.lazy)
+
+    if args.report is not None:
+        report_file_name: str = args.report_output
+        if report_file_name is None:
+            report_file_name = f'{splitext(args.input_file)[0]}.report.{"json" if args.report == "json" else "xml"}'
+        if args.report == 'json':
+            report.write_json(report_file_name)
+        else:
+            report.write_junit(report_file_name)
+
+    if profiler is not None:
+        profiler.disable()
+        print(profiler)
+        profiler.write_json(f'{args.profile}.json')
+        profiler.write_folded_stacks(f'{args.profile}.folded')
+    if sampling_profiler is not None:
+        sampling_profiler.stop()
+        print(sampling_profiler)
+        sampling_profiler.write_json(f'{args.sample}.json')
+        sampling_profiler.write_folded_stacks(f'{args.sample}.folded')
+
+    if fusion_profiler is not None:
+        fusion_profiler.write(args.profile_superinstructions)
 
     if DEBUG:
         not_implemented_set: set[str]
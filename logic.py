@@ -6,6 +6,7 @@ from custom_exceptions import EmptyOperandError, InvalidNumberTypeError, Unknown
 from enums import NumberType
 from evaluations import Evaluation, LocalGetter, EvaluationReport
 from expressions import SExpression
+from fuel import METER, block_cost
 from function import TypeExpression
 from number_types import ResultExpression, ParamExpression
 from operations import ConstExpression
@@ -31,7 +32,7 @@ class BlockExpression(Evaluation):
                         report.jump_to = int(report.jump_to)
                     except ValueError:
                         pass
-                if report.signal_break and (report.jump_to == 0 or report.jump_to == '$' + self.name):
+                if report.signal_break and self.is_branch_target(report):
                     break
                 elif report.signal_break and isinstance(report.jump_to, int):
                     report.jump_to -= 1
@@ -41,13 +42,37 @@ class BlockExpression(Evaluation):
 
 
 class LoopExpression(Evaluation):
+    charges_fuel: bool = True
+    fuel_cost: int | None = None
 
     def __init__(self, **kwargs):
         super().__init__()
 
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        for child in self.children:
-            child.evaluate(stack, local_variables)
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> EvaluationReport | None:
+        while True:
+            # Every iteration (the back-edge) pays for the whole body
+            if METER.metering:
+                if self.fuel_cost is None:
+                    self.fuel_cost = block_cost(self)
+                METER.charge(self.fuel_cost)
+            for child in self.children:
+                report: EvaluationReport | None = child.evaluate(stack, local_variables)
+                if report is not None:
+                    if report.jump_to is not None:
+                        try:
+                            report.jump_to = int(report.jump_to)
+                        except ValueError:
+                            pass
+                    if report.signal_break and self.is_branch_target(report):
+                        # Branching to a loop jumps back to its start
+                        break
+                    elif report.signal_break and isinstance(report.jump_to, int):
+                        report.jump_to -= 1
+                        return report
+                    if report.signal_return or report.signal_break:
+                        return report
+            else:
+                return None
 
 
 class IfExpression(Evaluation):
@@ -131,14 +156,20 @@ class IfExpression(Evaluation):
         else:
             Stack().size_to(0)
 
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> EvaluationReport | None:
         if self.condition is not None:
             self.condition.evaluate(stack, local_variables, global_variables)
         truth = stack.pop().value
+        report: EvaluationReport | None = None
         if truth != 0:
-            self.then_clause.evaluate(stack, local_variables)
+            report = self.then_clause.evaluate(stack, local_variables)
         elif self.else_clause is not None:
-            self.else_clause.evaluate(stack, local_variables)
+            report = self.else_clause.evaluate(stack, local_variables)
+        # Numeric labels were already counted down by then/else: only a branch to the name of the if ends here
+        if report is not None and report.signal_break and self.name is not None \
+                and report.jump_to in (self.name, '$' + self.name):
+            return None
+        return report
 
 
 class ThenExpression(Evaluation):
@@ -158,12 +189,12 @@ class ThenExpression(Evaluation):
                         report.jump_to = int(report.jump_to)
                     except ValueError:
                         pass
-                if report.signal_break and (report.jump_to == 0 or report.jump_to == self.name):
+                if report.signal_break and report.jump_to == 0:
                     break
                 elif report.signal_break and isinstance(report.jump_to, int):
                     report.jump_to -= 1
                     return report
-                if report.signal_return:
+                if report.signal_return or report.signal_break:
                     return report
 
 
@@ -185,12 +216,12 @@ class ElseExpression(Evaluation):
                         report.jump_to = int(report.jump_to)
                     except ValueError:
                         pass
-                if report.signal_break and (report.jump_to == 0 or report.jump_to == self.name):
+                if report.signal_break and report.jump_to == 0:
                     break
                 elif report.signal_break and isinstance(report.jump_to, int):
                     report.jump_to -= 1
                     return report
-                if report.signal_return:
+                if report.signal_return or report.signal_break:
                     return report
 
 class SelectExpression(Evaluation):
@@ -231,6 +262,11 @@ class BranchIfExpression(Evaluation):
 
     def __init__(self, **kwargs):
         super().__init__()
+        if self.name is not None:
+            # Named label, keep it as the first child like numeric labels
+            label: SExpression = SExpression()
+            label.expression_name = '$' + self.name
+            self.children = [label] + self.children
         if len(self.children) < 2:
             EmptyOperandError.try_raise(2, Stack())
 
@@ -238,7 +274,8 @@ class BranchIfExpression(Evaluation):
         self.children[-1].evaluate(stack, local_variables, global_variables)
         truth = stack.pop().value
         if truth != 0:
-            self.children[1].evaluate(stack, local_variables, global_variables)
+            if len(self.children) > 2:
+                self.children[1].evaluate(stack, local_variables, global_variables)
             return EvaluationReport(signal_break=True, jump_to=self.children[0].expression_name)
 
 
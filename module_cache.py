@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from assertions import AssertInvalidExpression
+from evaluations import GlobalExpression, MemoryExpression, DataExpression
+from expressions import SExpression, ModuleExpression
+from function import FunctionExpression, TableFunctionExpression, EXPORTED_FUNCTIONS
+from singleton import singleton
+from variables import Stack, VariableWatch, GlobalVariableWatch
+
+# Top-level expressions whose outcome only depends on their text
+CACHEABLE_PREFIXES: tuple[str, ...] = ('(module', '(assert_invalid', '(assert_malformed')
+
+
+def cacheable(expression_string: str) -> bool:
+    return expression_string.startswith(CACHEABLE_PREFIXES)
+
+
+def module_key(expression_string: str) -> str:
+    return hashlib.sha256(expression_string.encode()).hexdigest()
+
+
+@dataclass
+class CachedModule:
+    # Validated module, or assertion on an invalid module with its errors
+    expression: ModuleExpression | AssertInvalidExpression
+    instances: int = 1
+
+
+def instantiate_module(module: ModuleExpression, memory: bool = True) -> None:
+    # Repeats what the constructors of the definitions do to the interpreter state (exports, globals, table,
+    # memory and data segments), without parsing and validating the module again. Without memory, the current
+    # memory is kept, with the active data segments already in it (a shared memory, see parallel.py)
+    for child in module.children:
+        if isinstance(child, FunctionExpression) and child.export_as is not None:
+            EXPORTED_FUNCTIONS[child.export_as] = child
+        elif not memory and isinstance(child, MemoryExpression):
+            continue
+        elif not memory and isinstance(child, DataExpression) and child.offset is not None:
+            child.dropped = True
+        elif isinstance(child, (GlobalExpression, MemoryExpression, DataExpression)):
+            child.evaluate(Stack(), VariableWatch(), GlobalVariableWatch())
+        elif isinstance(child, TableFunctionExpression):
+            child.evaluate(Stack(), None)
+
+
+@singleton
+class ModuleCache:
+    # Modules and assert_invalid/assert_malformed outcomes, keyed by a hash of their normalized text, so that a
+    # module seen before (in the same file or another one) is only instantiated again.
+    # The expressions are shared, so source locations point to the first occurrence
+    entries: dict[str, CachedModule] = {}
+    hits: int = 0
+    misses: int = 0
+    # Nanoseconds spent instantiating cached modules
+    instantiate_time: int = 0
+
+    def clear(self) -> None:
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.instantiate_time = 0
+
+    def lookup(self, expression_string: str) -> ModuleExpression | AssertInvalidExpression | None:
+        entry: CachedModule | None = self.entries.get(module_key(expression_string))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry.instances += 1
+        if isinstance(entry.expression, ModuleExpression):
+            start: int = time.perf_counter_ns()
+            instantiate_module(entry.expression)
+            self.instantiate_time += time.perf_counter_ns() - start
+        return entry.expression
+
+    def store(self, expression_string: str, expression: SExpression) -> None:
+        if isinstance(expression, AssertInvalidExpression) and expression.instantiation_errors is None:
+            # The module was valid after all and its definitions took effect, so it has to be parsed again
+            return
+        if not isinstance(expression, (ModuleExpression, AssertInvalidExpression)):
+            return
+        self.entries[module_key(expression_string)] = CachedModule(expression)
+
+
+@singleton
+class ParseCache:
+    # Modules parsed by the API (api.py), keyed like ModuleCache, but only parsed: they are instantiated by
+    # Module.instantiate. The least recently used modules are dropped beyond max_size, and 0 turns the cache off
+    max_size: int = 32
+    entries: OrderedDict[str, ModuleExpression] = OrderedDict()
+
+    def configure(self, max_size: int) -> None:
+        self.max_size = max_size
+        while len(self.entries) > max(max_size, 0):
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries = OrderedDict()
+
+    def lookup(self, expression_string: str) -> ModuleExpression | None:
+        key: str = module_key(expression_string)
+        expression: ModuleExpression | None = self.entries.get(key)
+        if expression is not None:
+            self.entries.move_to_end(key)
+        return expression
+
+    def store(self, expression_string: str, expression: ModuleExpression) -> None:
+        if self.max_size <= 0:
+            return
+        key: str = module_key(expression_string)
+        self.entries[key] = expression
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
@@ -1,17 +1,23 @@
 from __future__ import annotations
 
-import decimal
-from math import floor, ceil
-
-from custom_exceptions import DivisionByZeroError, IntegerOverflowError, UnexpectedTokenError
+import float_arithmetic
+import integer_arithmetic
+from custom_exceptions import UnexpectedTokenError
 from enums import NumberType
+from integer_arithmetic import BITS
 
 from evaluations import BinaryEvaluation, UnaryEvaluation, EvaluationReport
+from expressions import SExpression
 from variables import VariableWatch, FixedNumber, Stack
 
 
+# Expected results of assert_return matching a class of NaNs instead of a single value
+NAN_PATTERNS: tuple[str, ...] = ('nan:canonical', 'nan:arithmetic')
+
+
 class ConstExpression(UnaryEvaluation):
     value: FixedNumber
+    nan_pattern: str | None = None
 
     def __init__(self, **kwargs) -> None:
         super().__init__(no_input=True)
@@ -39,611 +45,431 @@ class ConstExpression(UnaryEvaluation):
                     total_value += number << (16 * index)
             value = total_value
         else:
-            try:
-                if self.number_type == NumberType.i32 or self.number_type == NumberType.i64:
-                    value = int(operand.expression_name, 0)
-                else:
-                    value = float(operand.expression_name)
-            except ValueError:
-                raise UnexpectedTokenError(str(operand.expression_name))
-        if operand.expression_name.startswith("0x"):
-            if self.number_type == NumberType.i32 and (value & 0x80000000):
-                value = -0x80000000 + (value & 0x7fffffff)
-            elif self.number_type == NumberType.i64 and (value & 0x8000000000000000):
-                value = -0x8000000000000000 + (value & 0x7fffffffffffffff)
+            if operand.expression_name in NAN_PATTERNS:
+                # Only valid as an expected result, matches any NaN of that kind
+                self.nan_pattern = operand.expression_name
+            value = parse_constant(operand.expression_name, self.number_type)
         self.value = FixedNumber(value, self.number_type)
         Stack().contract(1)
         Stack().push(self.value.number_type)
 
+    @classmethod
+    def from_number(cls, value: FixedNumber) -> ConstExpression:
+        # Build a constant without going through validation (used when folding expressions)
+        literal: SExpression = SExpression()
+        literal.expression_name = str(value.value)
+        instance: ConstExpression = cls.__new__(cls)
+        instance.expression_name = f'{value.number_type.value}.const'
+        instance.children = [literal]
+        instance.number_type = value.number_type
+        instance.value = value
+        return instance
+
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
         super().evaluate(stack, local_variables)
         stack.push(self.value)
 
-
-class AddExpression(BinaryEvaluation):
-
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> EvaluationReport:
-        super().evaluate(stack, local_variables)
+    def matches(self, number: FixedNumber) -> bool:
+        return constant_matches(number, self.value, self.nan_pattern)
+
+
+def parse_constant(literal: str, number_type: NumberType) -> int | float:
+    # Value of the literal of an i32/i64/f32/f64.const (NaN patterns give a NaN)
+    if number_type == NumberType.f32 or number_type == NumberType.f64:
+        if literal in NAN_PATTERNS:
+            return float_arithmetic.NAN
+        return float_arithmetic.parse_float(literal, float_arithmetic.BITS[number_type])
+    try:
+        value: int = int(literal, 0)
+    except ValueError:
+        raise UnexpectedTokenError(str(literal))
+    if literal.startswith("0x"):
+        if number_type == NumberType.i32 and (value & 0x80000000):
+            value = -0x80000000 + (value & 0x7fffffff)
+        elif number_type == NumberType.i64 and (value & 0x8000000000000000):
+            value = -0x8000000000000000 + (value & 0x7fffffffffffffff)
+    return value
+
+
+def constant_matches(number: FixedNumber, expected: FixedNumber, nan_pattern: str | None = None) -> bool:
+    # Floats are compared by their bit pattern, see FixedNumber.unsigned_value
+    if nan_pattern == 'nan:canonical':
+        return float_arithmetic.is_canonical_nan(number.value, float_arithmetic.BITS[number.number_type])
+    if nan_pattern == 'nan:arithmetic':
+        return float_arithmetic.is_arithmetic_nan(number.value, float_arithmetic.BITS[number.number_type])
+    return abs(number) == abs(expected)
+
+
+class IntegerBinaryEvaluation(BinaryEvaluation):
+    # Function from integer_arithmetic implementing the operation
+    integer_function: staticmethod = None
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> EvaluationReport | None:
         first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
         if first_evaluation is None:
             return second_evaluation
-        stack.push(FixedNumber(first_evaluation.value + second_evaluation.value, self.number_type))
-
+        stack.push(FixedNumber(self.integer_function(first_evaluation.value, second_evaluation.value,
+                                                     BITS[self.operand_type]), self.number_type))
 
-class SubExpression(BinaryEvaluation):
 
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        stack.push(FixedNumber(first_evaluation.value - second_evaluation.value, self.number_type))
+class IntegerComparisonEvaluation(IntegerBinaryEvaluation):
+    result_type = NumberType.i32
 
 
-class MulExpression(BinaryEvaluation):
+class IntegerUnaryEvaluation(UnaryEvaluation):
+    # Function from integer_arithmetic implementing the operation
+    integer_function: staticmethod = None
 
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        stack.push(FixedNumber(first_evaluation.value * second_evaluation.value, self.number_type))
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        stack.push(FixedNumber(self.integer_function(evaluation.value, BITS[self.operand_type]), self.number_type))
 
 
-class DivSignedExpression(BinaryEvaluation):
+class AddExpression(IntegerBinaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.add)
 
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
 
-        def twos_complement(val: int, bits: int) -> int:
-            if (val & (1 << (bits - 1))) != 0:
-                val = val - (1 << bits)
-            return val
+class SubExpression(IntegerBinaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.sub)
 
-        if second_evaluation.value == 0:
-            raise DivisionByZeroError()
-        result = decimal.Decimal(first_evaluation.value) / decimal.Decimal(second_evaluation.value)
-        if result < 0:
-            result = ceil(result)
-        else:
-            result = floor(result)
-        if (self.number_type == NumberType.i32 and not FixedNumber.can_be_reprezented_in_32_bits(result)) or \
-                (self.number_type == NumberType.i64 and not FixedNumber.can_be_reprezented_in_64_bits(result)):
-            raise IntegerOverflowError()
-        stack.push(FixedNumber(result, self.number_type))
 
+class MulExpression(IntegerBinaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.mul)
 
-class DivUnsignedExpression(BinaryEvaluation):
 
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if second_evaluation.value == 0:
-            raise DivisionByZeroError()
-        stack.push(FixedNumber(first_evaluation.unsigned_value // second_evaluation.unsigned_value, self.number_type))
-        # stack.push(FixedNumber(((first_evaluation.value & 0xffffffffffffffff)//(second_evaluation.value & 0xffffffffffffffff)) & 0xffffffffffffffff, self.number_type))
-        # TODO cazul in care ai integer overflow
+class DivSignedExpression(IntegerBinaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.div_s)
 
 
-class RemsExpression(BinaryEvaluation):
+class DivUnsignedExpression(IntegerBinaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.div_u)
 
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if second_evaluation.value == 0:
-            raise DivisionByZeroError()  # TODO
-        if first_evaluation.value >= 0:
-            stack.push(FixedNumber(first_evaluation.value % abs(second_evaluation.value), self.number_type))
-        else:
-            stack.push(FixedNumber(0 - (abs(first_evaluation.value) % abs(second_evaluation.value)), self.number_type))
 
+class RemsExpression(IntegerBinaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.rem_s)
 
-class RemuExpression(BinaryEvaluation):
 
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if second_evaluation.value == 0:
-            raise DivisionByZeroError()  # TODO
-        stack.push(FixedNumber(first_evaluation.unsigned_value % second_evaluation.unsigned_value, self.number_type))
+class RemuExpression(IntegerBinaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.rem_u)
 
 
-class AndExpression(BinaryEvaluation):
+class AndExpression(IntegerBinaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.and_)
 
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        stack.push(FixedNumber(first_evaluation.value & second_evaluation.value, self.number_type))
 
+class OrExpression(IntegerBinaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.or_)
 
-class OrExpression(BinaryEvaluation):
 
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        def twos_complement(val: int, bits: int) -> int:
-            if (val & (1 << (bits - 1))) != 0:
-                val = val - (1 << bits)
-            return val
+class XorExpression(IntegerBinaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.xor)
 
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        stack.push(FixedNumber(twos_complement(first_evaluation.value | second_evaluation.value, 64), self.number_type))
 
+class ShlExpression(IntegerBinaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.shl)
 
-class XorExpression(BinaryEvaluation):
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        def twos_complement(val: int, bits: int) -> int:
-            if (val & (1 << (bits - 1))) != 0:
-                val = val - (1 << bits)
-            return val
 
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        stack.push(FixedNumber(twos_complement(first_evaluation.value ^ second_evaluation.value, 64), self.number_type))
+class ShrsExpression(IntegerBinaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.shr_s)
 
 
-class ShlExpression(BinaryEvaluation):
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.number_type == NumberType.i32:
-            if second_evaluation.value >= 0:
-                stack.push(
-                    FixedNumber((first_evaluation.value * (2 ** (second_evaluation.value % 32))), self.number_type))
-            else:
-                stack.push(FixedNumber(first_evaluation.value * (2 ** (32 - abs(second_evaluation.value) % 32)),
-                                       self.number_type))
-        else:
-            if second_evaluation.value >= 0:
-                stack.push(
-                    FixedNumber((first_evaluation.value * (2 ** (second_evaluation.value % 64))), self.number_type))
-            else:
-                stack.push(FixedNumber(first_evaluation.value * (2 ** (64 - abs(second_evaluation.value) % 64)),
-                                       self.number_type))
+class ShruExpression(IntegerBinaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.shr_u)
 
 
-class ShrsExpression(BinaryEvaluation):
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.number_type == NumberType.i32:
-            stack.push(FixedNumber(first_evaluation.value >> (abs(second_evaluation.value) % 32), self.number_type))
-        else:
-            stack.push(FixedNumber(first_evaluation.value >> (abs(second_evaluation.value) % 64), self.number_type))
+class RotlExpression(IntegerBinaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.rotl)
 
 
-class ShruExpression(BinaryEvaluation):
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.number_type == NumberType.i32:
-            if second_evaluation.value >= 0 or second_evaluation.value % 32 == 0:
-                result = first_evaluation.value >> (abs(second_evaluation.value) % 32)
-                mask = 0xffffffff
-                for i in range(abs(second_evaluation.value) % 32):
-                    mask = mask - (1 << (32 - abs(second_evaluation.value) % 32 + i))
-                result = result & mask
-                stack.push(FixedNumber(result, self.number_type))
-            else:
-                result = first_evaluation.value >> (32 - abs(second_evaluation.value) % 32)
-                mask = 0xffffffff
-                for i in range(32 - abs(second_evaluation.value) % 32):
-                    mask = mask - (1 << (32 - abs(second_evaluation.value) % 32 - i))
-
-                result = result & mask
-                stack.push(FixedNumber(result, self.number_type))
-        else:
-            if second_evaluation.value >= 0 or second_evaluation.value % 64 == 0:
-                result = first_evaluation.value >> (abs(second_evaluation.value) % 64)
-                mask = 0xffffffffffffffff
-                for i in range(abs(second_evaluation.value) % 64):
-                    mask = mask - (1 << (64 - abs(second_evaluation.value) % 64 + i))
-                result = result & mask
-                stack.push(FixedNumber(result, self.number_type))
-            else:
-                result = first_evaluation.value >> (64 - abs(second_evaluation.value) % 64)
-                mask = 0xffffffffffffffff
-                for i in range(64 - abs(second_evaluation.value) % 64):
-                    mask = mask - (1 << (64 - abs(second_evaluation.value) % 64 - i))
-
-                result = result & mask
-                stack.push(FixedNumber(result, self.number_type))
-
-
-class RotlExpression(BinaryEvaluation):
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.number_type == NumberType.i32:
-            if second_evaluation.value >= 0:
-                nshift = second_evaluation.value % 32
-            else:
-                nshift = 32 - abs(second_evaluation.value) % 32
+class RotrExpression(IntegerBinaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.rotr)
 
-            nshiftl = 32 - nshift
 
-            result = first_evaluation.value >> (nshiftl)
-            mask = 0xffffffff
-            for i in range(nshiftl):
-                mask = mask - (1 << (32 - nshiftl + i))
-            result = result & mask
+class CtzExpression(IntegerUnaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.ctz)
 
-            stack.push(FixedNumber(((first_evaluation.value << nshift) & 0xffffffff) + result, self.number_type))
 
-        else:
-            if second_evaluation.value >= 0:
-                nshift = second_evaluation.value % 64
-            else:
-                nshift = 64 - abs(second_evaluation.value) % 64
+class ClzExpression(IntegerUnaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.clz)
 
-            nshiftl = 64 - nshift
 
-            result = first_evaluation.value >> (nshiftl)
-            mask = 0xffffffffffffffff
-            for i in range(nshiftl):
-                mask = mask - (1 << (64 - nshiftl + i))
-            result = result & mask
+class PopcntExpression(IntegerUnaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.popcnt)
 
-            stack.push(
-                FixedNumber(((first_evaluation.value << nshift) & 0xffffffffffffffff) + result, self.number_type))
 
+class WrapI64Expression(UnaryEvaluation):
 
-class RotrExpression(BinaryEvaluation):
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.number_type == NumberType.i32:
-            if second_evaluation.value >= 0:
-                nshift = second_evaluation.value % 32
-            else:
-                nshift = 32 - abs(second_evaluation.value) % 32
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        stack.push(FixedNumber(integer_arithmetic.wrap(evaluation.value, 32), self.number_type))
 
-            nshiftl = 32 - nshift
 
-            result = first_evaluation.value >> (nshift)
-            mask = 0xffffffff
-            for i in range(nshift):
-                mask = mask - (1 << (32 - nshift + i))
-            result = result & mask
+class EqExpression(IntegerComparisonEvaluation):
+    integer_function = staticmethod(integer_arithmetic.eq)
 
-            stack.push(FixedNumber(((first_evaluation.value << nshiftl) & 0xffffffff) + result, self.number_type))
 
-        else:
-            if second_evaluation.value >= 0:
-                nshift = second_evaluation.value % 64
-            else:
-                nshift = 64 - abs(second_evaluation.value) % 64
+class EqzExpression(IntegerUnaryEvaluation):
+    integer_function = staticmethod(integer_arithmetic.eqz)
 
-            nshiftl = 64 - nshift
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.number_type = NumberType.i32
 
-            result = first_evaluation.value >> (nshift)
-            mask = 0xffffffffffffffff
-            for i in range(nshift):
-                mask = mask - (1 << (64 - nshift + i))
-            result = result & mask
 
-            stack.push(
-                FixedNumber(((first_evaluation.value << nshiftl) & 0xffffffffffffffff) + result, self.number_type))
+class NeExpression(IntegerComparisonEvaluation):
+    integer_function = staticmethod(integer_arithmetic.ne)
 
 
-class CtzExpression(UnaryEvaluation):
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation = self.check_and_evaluate(stack, local_variables)
-
-        def count_t(number):
-            count = 0
-            if number & 1 == 1:
-                return 0
-            while (number & 1) == 0:
-                count += 1
-                number = number >> 1
-            return count
-
-        if first_evaluation.value == 0:
-            if first_evaluation.number_type == NumberType.i32:
-                stack.push(FixedNumber(32, self.number_type))
-            else:
-                stack.push(FixedNumber(64, self.number_type))
-        else:
-            stack.push(FixedNumber(count_t(first_evaluation.value), self.number_type))
+class LtsExpression(IntegerComparisonEvaluation):
+    integer_function = staticmethod(integer_arithmetic.lt_s)
 
 
-class WrapI64Expression(UnaryEvaluation):
+class LtuExpression(IntegerComparisonEvaluation):
+    integer_function = staticmethod(integer_arithmetic.lt_u)
 
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        evaluation = self.check_and_evaluate(stack, local_variables)
-        # Detect sign of new value
-        if evaluation.value & 0x80000000:
-            value = evaluation.value & 0x7fffffff - 0x80000000
-        else:
-            value = evaluation.value & 0x7fffffff
-        stack.push(FixedNumber(value, self.number_type))
 
-class ClzExpression(UnaryEvaluation):
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation = self.check_and_evaluate(stack, local_variables)
-
-        def count_l(number, nBits):
-            count = 0
-            for i in range(nBits, 0, -1):
-                if (number & (1 << i)) >> i == 0:
-                    count += 1
-                else:
-                    break
-            return count
-
-        ok = 0
-        if first_evaluation.number_type == NumberType.i32:
-            nBits = 31
-            if first_evaluation.value == 0:
-                stack.push(FixedNumber(32, self.number_type))
-                ok = 1
+class LesExpression(IntegerComparisonEvaluation):
+    integer_function = staticmethod(integer_arithmetic.le_s)
 
-        else:
-            nBits = 63
-            if first_evaluation.value == 0:
-                stack.push(FixedNumber(64, self.number_type))
-                ok = 1
-        if ok == 0:
-            print(count_l(first_evaluation.value, nBits))
-            stack.push(FixedNumber(count_l(first_evaluation.value, nBits), self.number_type))
 
+class LeuExpression(IntegerComparisonEvaluation):
+    integer_function = staticmethod(integer_arithmetic.le_u)
 
-class PopcntExpression(UnaryEvaluation):
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation = self.check_and_evaluate(stack, local_variables)
-        number = first_evaluation.value
-        count = 0
-        if first_evaluation.value == 0:
-            stack.push(FixedNumber(0, self.number_type))
-        else:
-            if first_evaluation.number_type == NumberType.i32:
-                nBits = 31
-            else:
-                nBits = 63
-            while number != 0:
-                if (number & (1 << nBits)) >> nBits == 1:
-                    count += 1
-                if nBits == 63:
-                    number = (number << 1) & 0xffffffffffffffff
-                else:
-                    number = (number << 1) & 0xffffffff
-            stack.push(FixedNumber(count, self.number_type))
-
-
-class EqExpression(BinaryEvaluation):
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.value == second_evaluation.value:
-            stack.push(FixedNumber(1, self.number_type))
-        else:
-            stack.push(FixedNumber(0, self.number_type))
 
+class GtsExpression(IntegerComparisonEvaluation):
+    integer_function = staticmethod(integer_arithmetic.gt_s)
 
-class EqzExpression(UnaryEvaluation):
 
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.value == 0:
-            stack.push(FixedNumber(1, self.number_type))
-        else:
-            stack.push(FixedNumber(0, self.number_type))
+class GtuExpression(IntegerComparisonEvaluation):
+    integer_function = staticmethod(integer_arithmetic.gt_u)
 
 
-class NeExpression(BinaryEvaluation):
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.value != second_evaluation.value:
-            stack.push(FixedNumber(1, self.number_type))
-        else:
-            stack.push(FixedNumber(0, self.number_type))
+class GesExpression(IntegerComparisonEvaluation):
+    integer_function = staticmethod(integer_arithmetic.ge_s)
 
 
-class LtsExpression(BinaryEvaluation):
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.value < second_evaluation.value:
-            stack.push(FixedNumber(1, self.number_type))
-        else:
-            stack.push(FixedNumber(0, self.number_type))
+class GeuExpression(IntegerComparisonEvaluation):
+    integer_function = staticmethod(integer_arithmetic.ge_u)
 
 
-class LtuExpression(BinaryEvaluation):
+class Extend8Expression(UnaryEvaluation):
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.unsigned_value < second_evaluation.unsigned_value:
-            stack.push(FixedNumber(1, self.number_type))
-        else:
-            stack.push(FixedNumber(0, self.number_type))
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        stack.push(FixedNumber(integer_arithmetic.extend_s(evaluation.value, 8), self.number_type))
 
 
-class LesExpression(BinaryEvaluation):
+class Extend16Expression(UnaryEvaluation):
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.value <= second_evaluation.value:
-            stack.push(FixedNumber(1, self.number_type))
-        else:
-            stack.push(FixedNumber(0, self.number_type))
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        stack.push(FixedNumber(integer_arithmetic.extend_s(evaluation.value, 16), self.number_type))
 
 
-class LeuExpression(BinaryEvaluation):
+class Extend32Expression(UnaryEvaluation):
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.unsigned_value <= second_evaluation.unsigned_value:
-            stack.push(FixedNumber(1, self.number_type))
-        else:
-            stack.push(FixedNumber(0, self.number_type))
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        stack.push(FixedNumber(integer_arithmetic.extend_s(evaluation.value, 32), self.number_type))
 
 
-class GtsExpression(BinaryEvaluation):
+class Extendi32sExpression(UnaryEvaluation):
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.value > second_evaluation.value:
-            stack.push(FixedNumber(1, self.number_type))
-        else:
-            stack.push(FixedNumber(0, self.number_type))
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        stack.push(FixedNumber(integer_arithmetic.extend_s(evaluation.value, 32), self.number_type))
 
 
-class GtuExpression(BinaryEvaluation):
+class Extendi32uExpression(UnaryEvaluation):
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.unsigned_value > second_evaluation.unsigned_value:
-            stack.push(FixedNumber(1, self.number_type))
-        else:
-            stack.push(FixedNumber(0, self.number_type))
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        stack.push(FixedNumber(integer_arithmetic.extend_u(evaluation.value, 32), self.number_type))
+
 
+class AddPairwiseSignedExpression(UnaryEvaluation):
 
-class GesExpression(BinaryEvaluation):
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.value >= second_evaluation.value:
-            stack.push(FixedNumber(1, self.number_type))
-        else:
-            stack.push(FixedNumber(0, self.number_type))
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        value: int = 0
+        for lane in range(8):
+            # Each 16 bit lane is the sum of the two 8 bit lanes it covers
+            first: int = integer_arithmetic.extend_s(evaluation.value >> (16 * lane), 8)
+            second: int = integer_arithmetic.extend_s(evaluation.value >> (16 * lane + 8), 8)
+            value |= integer_arithmetic.to_unsigned(first + second, 16) << (16 * lane)
+        stack.push(FixedNumber(value, self.number_type))
+
 
+class AddPairwiseUnsignedExpression(UnaryEvaluation):
 
-class GeuExpression(BinaryEvaluation):
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        value: int = 0
+        for lane in range(8):
+            first: int = integer_arithmetic.extend_u(evaluation.value >> (16 * lane), 8)
+            second: int = integer_arithmetic.extend_u(evaluation.value >> (16 * lane + 8), 8)
+            value |= (first + second) << (16 * lane)
+        stack.push(FixedNumber(value, self.number_type))
+
+
+class FloatBinaryEvaluation(BinaryEvaluation):
+    # Function from float_arithmetic implementing the operation
+    float_function: staticmethod = None
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> EvaluationReport | None:
         first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.unsigned_value >= second_evaluation.unsigned_value:
-            stack.push(FixedNumber(1, self.number_type))
-        else:
-            stack.push(FixedNumber(0, self.number_type))
+        if first_evaluation is None:
+            return second_evaluation
+        stack.push(FixedNumber(self.float_function(first_evaluation.value, second_evaluation.value,
+                                                   float_arithmetic.BITS[self.operand_type]), self.number_type))
 
 
-class Extend8Expression(UnaryEvaluation):
-    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.number_type == NumberType.i32:
-            def extend(value):
-                if value == 0:
-                    return 0
-                if (value & (1 << 7)) >> 7 == 0:
-                    return value & 0xff
-                else:
-                    return value | 0xffffff00
-
-            stack.push(FixedNumber(extend(first_evaluation.value), self.number_type))
-        else:
-            def extend(value):
-                if value == 0:
-                    return 0
-                if (value & (1 << 7)) >> 7 == 0:
-                    return value & 0xff
-                else:
-                    return value | 0xffffffffffffff00
+class FloatComparisonEvaluation(FloatBinaryEvaluation):
+    result_type = NumberType.i32
 
-            stack.push(FixedNumber(extend(first_evaluation.value), self.number_type))
 
+class FloatUnaryEvaluation(UnaryEvaluation):
+    # Function from float_arithmetic implementing the operation
+    float_function: staticmethod = None
 
-class Extend16Expression(UnaryEvaluation):
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.number_type == NumberType.i32:
-            def extend(value):
-                if value == 0:
-                    return 0
-                if (value & (1 << 15)) >> 15 == 0:
-                    return value & 0xffff
-                else:
-                    return value | 0xffff0000
-
-            stack.push(FixedNumber(extend(first_evaluation.value), self.number_type))
-        else:
-            def extend(value):
-                if value == 0:
-                    return 0
-                if (value & (1 << 15)) >> 15 == 0:
-                    return value & 0xffff
-                else:
-                    return value | 0xffffffffffff0000
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        stack.push(FixedNumber(self.float_function(evaluation.value, float_arithmetic.BITS[self.number_type]),
+                               self.number_type))
 
-            stack.push(FixedNumber(extend(first_evaluation.value), self.number_type))
 
+class FloatAddExpression(FloatBinaryEvaluation):
+    float_function = staticmethod(float_arithmetic.add)
 
-class Extend32Expression(UnaryEvaluation):
+
+class FloatSubExpression(FloatBinaryEvaluation):
+    float_function = staticmethod(float_arithmetic.sub)
+
+
+class FloatMulExpression(FloatBinaryEvaluation):
+    float_function = staticmethod(float_arithmetic.mul)
+
+
+class FloatDivExpression(FloatBinaryEvaluation):
+    float_function = staticmethod(float_arithmetic.div)
+
+
+class FloatMinExpression(FloatBinaryEvaluation):
+    float_function = staticmethod(float_arithmetic.min_)
+
+
+class FloatMaxExpression(FloatBinaryEvaluation):
+    float_function = staticmethod(float_arithmetic.max_)
+
+
+class FloatCopysignExpression(FloatBinaryEvaluation):
+    float_function = staticmethod(float_arithmetic.copysign)
+
+
+class FloatSqrtExpression(FloatUnaryEvaluation):
+    float_function = staticmethod(float_arithmetic.sqrt)
+
+
+class FloatCeilExpression(FloatUnaryEvaluation):
+    float_function = staticmethod(float_arithmetic.ceil)
+
+
+class FloatFloorExpression(FloatUnaryEvaluation):
+    float_function = staticmethod(float_arithmetic.floor)
+
+
+class FloatTruncExpression(FloatUnaryEvaluation):
+    float_function = staticmethod(float_arithmetic.trunc)
+
+
+class FloatNearestExpression(FloatUnaryEvaluation):
+    float_function = staticmethod(float_arithmetic.nearest)
+
+
+class FloatAbsExpression(FloatUnaryEvaluation):
+    float_function = staticmethod(float_arithmetic.abs_)
+
+
+class FloatNegExpression(FloatUnaryEvaluation):
+    float_function = staticmethod(float_arithmetic.neg)
+
+
+class FloatEqExpression(FloatComparisonEvaluation):
+    float_function = staticmethod(float_arithmetic.eq)
+
+
+class FloatNeExpression(FloatComparisonEvaluation):
+    float_function = staticmethod(float_arithmetic.ne)
+
+
+class FloatLtExpression(FloatComparisonEvaluation):
+    float_function = staticmethod(float_arithmetic.lt)
+
+
+class FloatLeExpression(FloatComparisonEvaluation):
+    float_function = staticmethod(float_arithmetic.le)
+
+
+class FloatGtExpression(FloatComparisonEvaluation):
+    float_function = staticmethod(float_arithmetic.gt)
+
+
+class FloatGeExpression(FloatComparisonEvaluation):
+    float_function = staticmethod(float_arithmetic.ge)
+
+
+class ConvertSignedExpression(UnaryEvaluation):
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation = self.check_and_evaluate(stack, local_variables)
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        stack.push(FixedNumber(float_arithmetic.convert_s(evaluation.value, BITS[self.operand_type],
+                                                          float_arithmetic.BITS[self.number_type]), self.number_type))
 
-        def extend(value):
-            if value == 0:
-                return 0
-            if (value & (1 << 31)) >> 31 == 0:
-                return value & 0xffffffff
-            else:
-                return value | 0xffffffff00000000
 
-        stack.push(FixedNumber(extend(first_evaluation.value), self.number_type))
+class ConvertUnsignedExpression(UnaryEvaluation):
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        stack.push(FixedNumber(float_arithmetic.convert_u(evaluation.value, BITS[self.operand_type],
+                                                          float_arithmetic.BITS[self.number_type]), self.number_type))
 
 
-class Extendi32uExpression(UnaryEvaluation):
+class TruncSignedExpression(UnaryEvaluation):
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation = self.check_and_evaluate(stack, local_variables)
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        stack.push(FixedNumber(float_arithmetic.trunc_s(evaluation.value, BITS[self.number_type]), self.number_type))
+
 
-        def extend(value):
-            if value == 0:
-                return 0x0000000000000000
-            if (value & (1<<31)) >> 31 == 1:
-                return 0xffffffff00000000 | value
-            else:
-                return 0x0000000000000000 | value
+class TruncUnsignedExpression(UnaryEvaluation):
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        stack.push(FixedNumber(float_arithmetic.trunc_u(evaluation.value, BITS[self.number_type]), self.number_type))
 
-        stack.push(FixedNumber(extend(first_evaluation.value), self.number_type))
 
-class F32GTExpression(BinaryEvaluation):
+class TruncSatSignedExpression(UnaryEvaluation):
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        first_evaluation, second_evaluation = self.check_and_evaluate(stack, local_variables)
-        if first_evaluation.value > second_evaluation.value:
-            stack.push(FixedNumber(1, self.number_type))
-        else:
-            stack.push(FixedNumber(0, self.number_type))
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        stack.push(FixedNumber(float_arithmetic.trunc_sat_s(evaluation.value, BITS[self.number_type]),
+                               self.number_type))
 
 
-class AddPairwiseSignedExpression(UnaryEvaluation):
+class TruncSatUnsignedExpression(UnaryEvaluation):
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        stack.push(FixedNumber(float_arithmetic.trunc_sat_u(evaluation.value, BITS[self.number_type]),
+                               self.number_type))
+
 
+class PromoteExpression(UnaryEvaluation):
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        evaluation = self.check_and_evaluate(stack, local_variables)
-        numbers: list[int] = []
-        for index in range(15, 0, -1):
-            numbers.append(evaluation.value >> (index * 8) & 0xff)
-        # Convert elements to signed values
-        numbers = [number if number < 128 else number - 256 for number in numbers]
-        result = [first + second for first, second in zip(numbers[::2], numbers[1::2])]
-        value = 0
-        for index, number in reversed(list(enumerate(result))):
-            if number < 0:
-                number = 65536 + number
-            value += number << (16 * index)
-        stack.push(FixedNumber(value, self.number_type))
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        stack.push(FixedNumber(float_arithmetic.promote(evaluation.value), self.number_type))
 
 
-class AddPairwiseUnsignedExpression(UnaryEvaluation):
+class DemoteExpression(UnaryEvaluation):
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        stack.push(FixedNumber(float_arithmetic.demote(evaluation.value), self.number_type))
+
 
+class ReinterpretExpression(UnaryEvaluation):
     def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
-        super().evaluate(stack, local_variables)
-        evaluation = self.check_and_evaluate(stack, local_variables)
-        numbers: list[int] = []
-        for index in range(15, 0, -1):
-            numbers.append(evaluation.value >> (index * 8) & 0xff)
-        result = [first + second for first, second in zip(numbers[::2], numbers[1::2])]
-        value = 0
-        for index, number in reversed(list(enumerate(result))):
-            value += number << (16 * index)
-        stack.push(FixedNumber(value, self.number_type))
\ No newline at end of file
+        evaluation: FixedNumber = self.check_and_evaluate(stack, local_variables)
+        if self.number_type in BITS:
+            value: int | float = float_arithmetic.reinterpret_as_integer(evaluation.value, BITS[self.number_type])
+        else:
+            value = float_arithmetic.reinterpret_as_float(evaluation.value, float_arithmetic.BITS[self.number_type])
+        stack.push(FixedNumber(value, self.number_type))
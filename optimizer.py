@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+import operations
+from custom_exceptions import WebAssemblyException
+from enums import NumberType
+from evaluations import Evaluation, UnaryEvaluation, BinaryEvaluation, LocalGetter, LocalSetter, LocalTee, LocalCopy, \
+    NOPExpression, UnreachableExpression, OPERAND_ATTRIBUTES, operands
+from expressions import SExpression, ModuleExpression
+from function import FunctionExpression, ReturnExpression
+from logic import BlockExpression, LoopExpression, IfExpression, ThenExpression, ElseExpression, BranchExpression, \
+    BranchTableExpression
+from operations import ConstExpression, AddExpression, SubExpression, MulExpression, DivSignedExpression, \
+    DivUnsignedExpression, AndExpression, OrExpression, XorExpression, ShlExpression, ShrsExpression, ShruExpression, \
+    RotlExpression, RotrExpression
+from source_map import copy_location
+from variables import Stack, VariableWatch
+
+# Expressions whose children are executed one after the other
+SEQUENCE_TYPES: tuple[type, ...] = (FunctionExpression, BlockExpression, LoopExpression, ThenExpression, ElseExpression)
+
+# Nothing placed after these expressions in the same sequence can be executed
+TERMINATOR_TYPES: tuple[type, ...] = (UnreachableExpression, BranchExpression, BranchTableExpression, ReturnExpression)
+
+# Every operation from operations.py can be folded, since it only depends on its operands
+FOLDABLE_TYPES: tuple[type, ...] = tuple(
+    cls for cls in vars(operations).values()
+    if isinstance(cls, type) and issubclass(cls, (UnaryEvaluation, BinaryEvaluation))
+    and cls.__module__ == operations.__name__ and cls is not ConstExpression
+)
+
+# Operand values for which an integer operation returns the other operand unchanged
+# (operation, neutral value, neutral operand may be on the left)
+IDENTITIES: dict[type, tuple[int, bool]] = {
+    AddExpression: (0, True),
+    SubExpression: (0, False),
+    MulExpression: (1, True),
+    DivSignedExpression: (1, False),
+    DivUnsignedExpression: (1, False),
+    AndExpression: (-1, True),
+    OrExpression: (0, True),
+    XorExpression: (0, True),
+    ShlExpression: (0, False),
+    ShrsExpression: (0, False),
+    ShruExpression: (0, False),
+    RotlExpression: (0, False),
+    RotrExpression: (0, False),
+}
+
+
+def count_nodes(expression: SExpression) -> int:
+    return 1 + sum(count_nodes(operand) for operand in operands(expression))
+
+
+@dataclass
+class FunctionOptimizationReport:
+    function_name: str
+    nodes_before: int
+    nodes_after: int = 0
+    folded: int = 0
+    simplified: int = 0
+    fused: int = 0
+    dead: int = 0
+
+    @property
+    def removed(self) -> int:
+        return self.nodes_before - self.nodes_after
+
+    def __str__(self) -> str:
+        return f'Function {self.function_name}: {self.nodes_before} -> {self.nodes_after} nodes ' \
+               f'({self.removed} removed; folded {self.folded}, simplified {self.simplified}, ' \
+               f'fused {self.fused}, dead {self.dead})'
+
+
+@dataclass
+class OptimizationReport:
+    functions: list[FunctionOptimizationReport] = field(default_factory=list)
+
+    @property
+    def removed(self) -> int:
+        return sum(function.removed for function in self.functions)
+
+    def __str__(self) -> str:
+        lines: list[str] = [str(function) for function in self.functions]
+        lines.append(f'Optimized {len(self.functions)} functions, {self.removed} nodes removed.')
+        return '\n'.join(lines)
+
+
+class Optimizer:
+    fold_constants: bool = True
+    simplify: bool = True
+    fuse_locals: bool = True
+    remove_dead_code: bool = True
+
+    _report: FunctionOptimizationReport = None
+
+    def __init__(self, fold_constants: bool = True, simplify: bool = True, fuse_locals: bool = True,
+                 remove_dead_code: bool = True):
+        self.fold_constants = fold_constants
+        self.simplify = simplify
+        self.fuse_locals = fuse_locals
+        self.remove_dead_code = remove_dead_code
+
+    def optimize_module(self, module: ModuleExpression) -> OptimizationReport:
+        report: OptimizationReport = OptimizationReport()
+        for child in module.children:
+            if isinstance(child, FunctionExpression):
+                report.functions.append(self.optimize_function(child))
+        # Folding evaluates expressions on the global stack
+        Stack().init()
+        return report
+
+    def optimize_function(self, function: FunctionExpression) -> FunctionOptimizationReport:
+        self._report = FunctionOptimizationReport(function.display_name, count_nodes(function))
+        self._optimize(function)
+        self._report.nodes_after = count_nodes(function)
+        return self._report
+
+    def _optimize(self, expression: SExpression) -> SExpression:
+        if not isinstance(expression, Evaluation):
+            return expression
+        # Bottom-up, so that folded operands can be folded again by their parents
+        if len(expression.children) > 0:
+            expression.children = [self._optimize(child) for child in expression.children]
+        for attribute in OPERAND_ATTRIBUTES:
+            operand = expression.__dict__.get(attribute)
+            if isinstance(operand, Evaluation):
+                setattr(expression, attribute, self._optimize(operand))
+        if isinstance(expression, SEQUENCE_TYPES):
+            expression.children = self._optimize_sequence(expression.children)
+        original: Evaluation = expression
+        if self.fold_constants:
+            expression = self._fold(expression)
+        if self.simplify:
+            expression = self._simplify(expression)
+        if self.fuse_locals:
+            expression = self._fuse(expression)
+        if expression is not original:
+            copy_location(original, expression)
+        return expression
+
+    def _fold(self, expression: Evaluation) -> Evaluation:
+        if isinstance(expression, IfExpression):
+            return self._fold_if(expression)
+        if not isinstance(expression, FOLDABLE_TYPES):
+            return expression
+        expected_operands: int = 2 if isinstance(expression, BinaryEvaluation) else 1
+        if len(expression.children) != expected_operands or \
+                not all(isinstance(child, ConstExpression) for child in expression.children):
+            return expression
+        stack: Stack = Stack()
+        stack.init()
+        try:
+            expression.evaluate(stack, VariableWatch())
+            value = stack.pop()
+        except WebAssemblyException:
+            # Traps (e.g. division by zero) have to happen at run time
+            return expression
+        self._report.folded += 1
+        return ConstExpression.from_number(value)
+
+    def _fold_if(self, expression: IfExpression) -> Evaluation:
+        # Branches to a named if are resolved by the if itself, so it can't be replaced by a clause
+        if not isinstance(expression.condition, ConstExpression) or expression.name is not None:
+            return expression
+        self._report.folded += 1
+        if expression.condition.value.value != 0:
+            return expression.then_clause
+        if expression.else_clause is not None:
+            return expression.else_clause
+        return NOPExpression()
+
+    def _simplify(self, expression: Evaluation) -> Evaluation:
+        if expression.__class__ not in IDENTITIES or len(expression.children) != 2 or \
+                expression.number_type not in (NumberType.i32, NumberType.i64):
+            return expression
+        neutral_value, commutative = IDENTITIES[expression.__class__]
+        first_operand, second_operand = expression.children
+        if isinstance(second_operand, ConstExpression) and second_operand.value.value == neutral_value:
+            self._report.simplified += 1
+            return first_operand
+        if commutative and isinstance(first_operand, ConstExpression) and first_operand.value.value == neutral_value:
+            self._report.simplified += 1
+            return second_operand
+        return expression
+
+    def _fuse(self, expression: Evaluation) -> Evaluation:
+        # (local.set $x (local.get $y)) -> local.copy $x $y
+        if expression.__class__ is LocalSetter and len(expression.children) == 1 and \
+                expression.children[0].__class__ is LocalGetter:
+            self._report.fused += 1
+            return LocalCopy(expression.name, expression.children[0].name)
+        return expression
+
+    def _optimize_sequence(self, sequence: list[SExpression]) -> list[SExpression]:
+        optimized: list[SExpression] = []
+        for index, expression in enumerate(sequence):
+            if isinstance(expression, NOPExpression) or \
+                    (isinstance(expression, LocalCopy) and expression.name == expression.source):
+                self._report.simplified += 1
+                continue
+            if self.fuse_locals and expression.__class__ is LocalGetter and len(optimized) > 0 and \
+                    optimized[-1].__class__ is LocalSetter and len(optimized[-1].children) == 1 and \
+                    optimized[-1].name == expression.name:
+                # (local.set $x ...) (local.get $x) -> (local.tee $x ...)
+                setter: LocalSetter = optimized.pop()
+                tee: LocalTee = LocalTee.__new__(LocalTee)
+                tee.expression_name = 'local.tee'
+                tee.name = setter.name
+                tee.children = setter.children
+                optimized.append(tee)
+                self._report.fused += 1
+                continue
+            optimized.append(expression)
+            if self.remove_dead_code and isinstance(expression, TERMINATOR_TYPES):
+                self._report.dead += sum(count_nodes(dead) for dead in sequence[index + 1:]
+                                         if isinstance(dead, Evaluation))
+                break
+        return optimized
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import pickle
+import struct
+import zlib
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Iterable
+
+from api import Instance, Module, ExportedFunction, switch_instance
+from custom_exceptions import InvalidFunctionSignatureError, UnknownFunctionError, WebAssemblyException, \
+    WorkerTrapError, WorkerError, trap_name
+from enums import NumberType
+from evaluations import MemoryExpression
+from function import FunctionExpression
+from host import HostFunction
+from module_cache import instantiate_module
+from variables import Memory, SharedLinearMemory
+
+# Record: generation (the map call it belongs to), call index, export index, number of values, status; then the
+# values, 8 bytes each
+RECORD: struct.Struct = struct.Struct('<IIHBB')
+MAX_VALUES: int = 16
+RECORD_SIZE: int = RECORD.size + MAX_VALUES * 8
+# Head and tail of a ring
+INDEX: struct.Struct = struct.Struct('<Q')
+
+STATUS_OK: int = 0
+STATUS_TRAP: int = 1
+STATUS_STOP: int = 2
+STATUS_ERROR: int = 3
+
+# Seconds between two checks that the workers are still running, while waiting for a result
+POLL_INTERVAL: float = 0.1
+
+VALUE_FORMATS: dict[NumberType, str] = {
+    NumberType.i32: 'q',
+    NumberType.i64: 'q',
+    NumberType.f32: 'd',
+    NumberType.f64: 'd',
+}
+
+
+def values_format(number_types: list[NumberType]) -> str:
+    return '<' + ''.join(VALUE_FORMATS[number_type] for number_type in number_types)
+
+
+def module_image(module: Module) -> bytes:
+    # Compact form of a parsed and validated module: the workers don't parse or validate it again
+    return zlib.compress(pickle.dumps(module.expression, pickle.HIGHEST_PROTOCOL))
+
+
+class Ring:
+    # Fixed-size records in shared memory, written and read by any number of processes. The semaphores count the
+    # records and the free slots, and the locks guard the head (readers) and the tail (writers)
+    slots: int
+    memory: SharedMemory
+
+    def __init__(self, context: Any, slots: int):
+        self.slots = slots
+        self.memory = SharedMemory(create=True, size=2 * INDEX.size + slots * RECORD_SIZE)
+        INDEX.pack_into(self.memory.buf, 0, 0)
+        INDEX.pack_into(self.memory.buf, INDEX.size, 0)
+        self.items = context.Semaphore(0)
+        self.spaces = context.Semaphore(slots)
+        self.read_lock = context.Lock()
+        self.write_lock = context.Lock()
+
+    def _offset(self, position: int) -> int:
+        return 2 * INDEX.size + position % self.slots * RECORD_SIZE
+
+    def put(self, generation: int, call: int, export: int, status: int, count: int = 0, data: bytes = b'') -> None:
+        # data: count values, already packed (so that values that don't fit never take a slot)
+        self.spaces.acquire()
+        with self.write_lock:
+            buffer: memoryview = self.memory.buf
+            tail: int = INDEX.unpack_from(buffer, INDEX.size)[0]
+            offset: int = self._offset(tail)
+            RECORD.pack_into(buffer, offset, generation, call, export, count, status)
+            buffer[offset + RECORD.size:offset + RECORD.size + len(data)] = data
+            INDEX.pack_into(buffer, INDEX.size, tail + 1)
+        self.items.release()
+
+    def put_message(self, generation: int, call: int, export: int, status: int, message: str) -> None:
+        self.put(generation, call, export, status, 0, message.encode()[:MAX_VALUES * 8].ljust(MAX_VALUES * 8, b'\0'))
+
+    def get(self, timeout: float | None = None) -> bytes | None:
+        # None when no record arrives within timeout
+        if not self.items.acquire(timeout=timeout):
+            return None
+        with self.read_lock:
+            buffer: memoryview = self.memory.buf
+            head: int = INDEX.unpack_from(buffer, 0)[0]
+            offset: int = self._offset(head)
+            record: bytes = bytes(buffer[offset:offset + RECORD_SIZE])
+            INDEX.pack_into(buffer, 0, head + 1)
+        self.spaces.release()
+        return record
+
+    def close(self, unlink: bool = False) -> None:
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def run_worker(image: bytes, imports: dict[str, dict[str, HostFunction]] | None,
+               shared: SharedLinearMemory | None, requests: Ring, results: Ring) -> None:
+    module: Module = Module(pickle.loads(zlib.decompress(image)))
+    if shared is not None:
+        # The calls are threads of the same instance: the memory of the parent (with the data segments) is mapped
+        # instead of a new one
+        switch_instance(None)
+        Memory().attach(shared)
+        module.bind_imports(imports)
+        instantiate_module(module.expression, memory=False)
+        instance: Instance = Instance(module)
+    else:
+        instance = module.instantiate(imports)
+    exports: list[ExportedFunction] = list(instance.exports[name] for name in module.exports)
+    formats: list[str] = [values_format(function.parameter_types) for function in exports]
+    try:
+        while True:
+            record: bytes = requests.get()
+            generation, call, export, count, status = RECORD.unpack_from(record)
+            if status == STATUS_STOP:
+                break
+            function: ExportedFunction = exports[export]
+            args: tuple = struct.unpack_from(formats[export], record, RECORD.size)
+            try:
+                result: Any = function(*args)
+                values: tuple = () if result is None else result if isinstance(result, tuple) else (result,)
+                data: bytes = struct.pack(values_format(function.result_types), *values)
+                results.put(generation, call, export, STATUS_OK, len(values), data)
+            except WebAssemblyException as exception:
+                results.put_message(generation, call, export, STATUS_TRAP, trap_name(exception))
+            except RecursionError:
+                results.put_message(generation, call, export, STATUS_TRAP, 'call stack exhausted')
+            except Exception as error:
+                # Errors of host functions or of the interpreter itself must not stop the worker
+                results.put_message(generation, call, export, STATUS_ERROR, f'{type(error).__name__}: {error}')
+    finally:
+        requests.close()
+        results.close()
+
+
+class ParallelExecutor:
+    # Runs independent calls of one module on several processes. The module is parsed once, and its image is sent to
+    # each worker when it starts. Arguments and results go through two rings in shared memory (requests and results)
+    # instead of pickled messages, and idle workers take the next request, so the load is balanced.
+    # Every worker has its own instance, so globals aren't shared. A shared memory (memory ... shared) is the exception:
+    # the module is instantiated in this process too, and the workers map its memory, so that calls can work together
+    # through atomics and memory.atomic.wait/notify
+    module: Module
+    workers: int
+    _requests: Ring
+    _results: Ring
+    _processes: list[multiprocessing.Process]
+    _exports: list[str]
+    _functions: dict[str, ExportedFunction]
+    # Instance of this process, for a shared memory
+    _instance: Instance | None = None
+    # Generation of the last map call, and calls of earlier ones that are still in flight
+    _generation: int = 0
+    _stale: int = 0
+
+    def __init__(self, module: Module, workers: int | None = None, slots: int = 256,
+                 imports: dict[str, dict[str, HostFunction]] | None = None):
+        self.module = module
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self._exports = module.exports
+        image: bytes = module_image(module)
+        context: Any = multiprocessing.get_context()
+        self._requests = Ring(context, slots)
+        self._results = Ring(context, slots)
+        shared: SharedLinearMemory | None = None
+        if any(isinstance(child, MemoryExpression) and child.shared for child in module.expression.children):
+            # Kept, since the shared memory is released with the instance
+            self._instance = module.instantiate(imports)
+            shared = Memory().shared
+        self._processes = [context.Process(target=run_worker,
+                                           args=(image, imports, shared, self._requests, self._results),
+                                           daemon=True) for _ in range(self.workers)]
+        for process in self._processes:
+            process.start()
+        # For the signatures of the exports
+        self._functions = {child.export_as: ExportedFunction(child.export_as, child)
+                           for child in module.expression.children
+                           if isinstance(child, FunctionExpression) and child.export_as is not None}
+
+    def map(self, name: str, calls: Iterable[tuple | list], return_exceptions: bool = False) -> list[Any]:
+        # Results of name(*args) for every args in calls, in order. A trap raises WorkerTrapError, unless
+        # return_exceptions is set, in which case the exception takes the place of the result. Other errors of the
+        # calls raise WorkerError once all the results are in, and so does a worker that stopped
+        if name not in self._functions:
+            raise UnknownFunctionError(name)
+        function: ExportedFunction = self._functions[name]
+        export: int = self._exports.index(name)
+        parameters: str = values_format(function.parameter_types)
+        results_format: str = values_format(function.result_types)
+        if len(function.parameter_types) > MAX_VALUES or len(function.result_types) > MAX_VALUES:
+            raise InvalidFunctionSignatureError(function.function)
+        arguments: list[tuple] = [tuple(args) for args in calls]
+        # Every call is checked before the first one is submitted
+        packed: list[bytes] = []
+        for args in arguments:
+            if len(args) != len(function.parameter_types):
+                raise InvalidFunctionSignatureError(function.function, *args)
+            try:
+                packed.append(struct.pack(parameters, *args))
+            except struct.error as error:
+                raise TypeError(f'Invalid arguments {args} for "{name}": {error}') from error
+        self._generation = (self._generation + 1) % (1 << 32)
+        generation: int = self._generation
+        results: list[Any] = [None] * len(arguments)
+        submitted: int = 0
+        received: int = 0
+        try:
+            while received < len(arguments):
+                # At most as many calls in flight (including the ones of earlier map calls that failed) as there are
+                # slots, so that the workers never wait for the result ring
+                while submitted < len(arguments) and submitted - received + self._stale < self._requests.slots:
+                    self._requests.put(generation, submitted, export, STATUS_OK, len(arguments[submitted]),
+                                       packed[submitted])
+                    submitted += 1
+                record: bytes | None = self._results.get(POLL_INTERVAL)
+                if record is None:
+                    self._check_workers()
+                    continue
+                record_generation, call, _, count, status = RECORD.unpack_from(record)
+                if record_generation != generation:
+                    # Result of an earlier map call that failed
+                    self._stale -= 1
+                    continue
+                if status in (STATUS_TRAP, STATUS_ERROR):
+                    message: str = record[RECORD.size:].rstrip(b'\0').decode(errors='replace')
+                    results[call] = WorkerTrapError(message, arguments[call]) if status == STATUS_TRAP \
+                        else WorkerError(message, arguments[call])
+                else:
+                    values: tuple = struct.unpack_from(results_format, record, RECORD.size)
+                    results[call] = None if count == 0 else values[0] if count == 1 else values
+                received += 1
+        finally:
+            # Their results are skipped by the next map calls
+            self._stale += submitted - received
+        for result in results:
+            if isinstance(result, WorkerError) or (isinstance(result, WorkerTrapError) and not return_exceptions):
+                raise result
+        return results
+
+    def _check_workers(self) -> None:
+        # A worker that stopped took its request with it: the result would never come
+        for process in self._processes:
+            if not process.is_alive():
+                raise WorkerError(f'Worker process {process.pid} stopped (exit code {process.exitcode})')
+
+    def close(self) -> None:
+        for _ in self._processes:
+            self._requests.put(0, 0, 0, STATUS_STOP)
+        for process in self._processes:
+            process.join()
+        self._requests.close(unlink=True)
+        self._results.close(unlink=True)
+
+    def __enter__(self) -> ParallelExecutor:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
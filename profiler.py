@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import json
+import time
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import Callable
+
+from evaluations import Evaluation
+from function import FunctionExpression
+from source_map import SourceLocation, location_of
+
+# Caller of the functions invoked by the assertions
+HOST: str = '<host>'
+
+
+@dataclass
+class ExecutionStatistics:
+    count: int = 0
+    # Nanoseconds, including the time spent in nested expressions (counted once for recursive ones)
+    total_time: int = 0
+    # Nanoseconds, excluding the time spent in nested expressions
+    self_time: int = 0
+
+
+@dataclass
+class CallEdgeStatistics:
+    caller: str
+    callee: str
+    count: int = 0
+    total_time: int = 0
+
+
+class _Frame:
+    __slots__ = ('key', 'expression', 'start', 'children_time', 'function_path')
+
+    def __init__(self, key: str, expression: Evaluation, start: int, function_path: str):
+        self.key = key
+        self.expression = expression
+        self.start = start
+        self.children_time = 0
+        self.function_path = function_path
+
+
+def _evaluation_classes() -> list[type]:
+    classes: list[type] = []
+    pending: list[type] = [Evaluation]
+    while len(pending) > 0:
+        cls: type = pending.pop()
+        classes.append(cls)
+        pending.extend(subclass for subclass in cls.__subclasses__() if subclass not in classes)
+    return classes
+
+
+class Profiler:
+    # Counts executions and wall time per expression class, per function and per call edge.
+    # enable() replaces the evaluate methods of every Evaluation class and disable() puts the originals back,
+    # so the interpreter doesn't pay anything while profiling is off.
+    opcodes: dict[str, ExecutionStatistics]
+    functions: dict[str, ExecutionStatistics]
+    call_edges: dict[tuple[str, str], CallEdgeStatistics]
+    # Self time per stack of functions (optionally ending in an expression class), in flamegraph's folded format
+    folded_stacks: Counter[str]
+    # Executions and self time of every expression, mapped to source lines when reporting
+    expression_counts: Counter[Evaluation]
+    expression_times: Counter[Evaluation]
+
+    _originals: dict[type, Callable]
+    _frames: list[_Frame]
+    _function_frames: list[_Frame]
+    # Number of frames of each opcode / function currently running, to count recursion once in the total time
+    _active: Counter[str]
+
+    def __init__(self):
+        self.opcodes = {}
+        self.functions = {}
+        self.call_edges = {}
+        self.folded_stacks = Counter()
+        self.expression_counts = Counter()
+        self.expression_times = Counter()
+        self._originals = {}
+        self._frames = []
+        self._function_frames = []
+        self._active = Counter()
+
+    @property
+    def enabled(self) -> bool:
+        return len(self._originals) > 0
+
+    def enable(self) -> None:
+        if self.enabled:
+            return
+        for cls in _evaluation_classes():
+            original: Callable | None = cls.__dict__.get('evaluate')
+            if original is None:
+                continue
+            self._originals[cls] = original
+            if issubclass(cls, FunctionExpression):
+                setattr(cls, 'evaluate', self._profile_function(original))
+            else:
+                setattr(cls, 'evaluate', self._profile_opcode(original))
+
+    def disable(self) -> None:
+        for cls, original in self._originals.items():
+            setattr(cls, 'evaluate', original)
+        self._originals = {}
+
+    def __enter__(self) -> Profiler:
+        self.enable()
+        return self
+
+    def __exit__(self, *exception_info) -> None:
+        self.disable()
+
+    def _profile_opcode(self, original: Callable) -> Callable:
+        profiler: Profiler = self
+
+        def evaluate(expression: Evaluation, *args, **kwargs):
+            frames: list[_Frame] = profiler._frames
+            # super().evaluate calls of the same expression belong to the frame that is already open
+            if len(frames) > 0 and frames[-1].expression is expression:
+                return original(expression, *args, **kwargs)
+            # Keyed by the class of the expression, since evaluate is often inherited (e.g. from IntegerBinaryEvaluation)
+            key: str = expression.__class__.__name__
+            function_path: str = frames[-1].function_path if len(frames) > 0 else HOST
+            frames.append(_Frame(key, expression, time.perf_counter_ns(), function_path))
+            profiler._active[key] += 1
+            try:
+                return original(expression, *args, **kwargs)
+            finally:
+                profiler._close_frame(profiler.opcodes, frames.pop())
+
+        return evaluate
+
+    def _profile_function(self, original: Callable) -> Callable:
+        profiler: Profiler = self
+
+        def evaluate(function: FunctionExpression, *args, **kwargs):
+            frames: list[_Frame] = profiler._frames
+            if len(frames) > 0 and frames[-1].expression is function:
+                return original(function, *args, **kwargs)
+            key: str = function.display_name
+            caller_path: str = frames[-1].function_path if len(frames) > 0 else HOST
+            caller: str = profiler._function_frames[-1].key if len(profiler._function_frames) > 0 else HOST
+            frame: _Frame = _Frame(key, function, time.perf_counter_ns(), f'{caller_path};{key}')
+            frames.append(frame)
+            profiler._function_frames.append(frame)
+            profiler._active[key] += 1
+            try:
+                return original(function, *args, **kwargs)
+            finally:
+                frames.pop()
+                profiler._function_frames.pop()
+                elapsed: int = profiler._close_frame(profiler.functions, frame)
+                edge: CallEdgeStatistics = profiler.call_edges.setdefault((caller, key),
+                                                                          CallEdgeStatistics(caller, key))
+                edge.count += 1
+                edge.total_time += elapsed
+
+        return evaluate
+
+    def _close_frame(self, statistics: dict[str, ExecutionStatistics], frame: _Frame) -> int:
+        elapsed: int = time.perf_counter_ns() - frame.start
+        entry: ExecutionStatistics | None = statistics.get(frame.key)
+        if entry is None:
+            entry = statistics[frame.key] = ExecutionStatistics()
+        entry.count += 1
+        self._active[frame.key] -= 1
+        if self._active[frame.key] == 0:
+            entry.total_time += elapsed
+        self_time: int = elapsed - frame.children_time
+        entry.self_time += self_time
+        if statistics is self.opcodes:
+            self.folded_stacks[f'{frame.function_path};{frame.key}'] += self_time
+            self.expression_counts[frame.expression] += 1
+            self.expression_times[frame.expression] += self_time
+        else:
+            self.folded_stacks[frame.function_path] += self_time
+        if len(self._frames) > 0:
+            self._frames[-1].children_time += elapsed
+        return elapsed
+
+    @property
+    def lines(self) -> dict[str, ExecutionStatistics]:
+        # Self time per source line, for the expressions that have a known location
+        lines: dict[str, ExecutionStatistics] = {}
+        for expression, self_time in self.expression_times.items():
+            location: SourceLocation | None = location_of(expression)
+            if location is None:
+                continue
+            entry: ExecutionStatistics = lines.setdefault(f'{location.file_name}:{location.line}', ExecutionStatistics())
+            entry.count += self.expression_counts[expression]
+            entry.self_time += self_time
+        return dict(sorted(lines.items(), key=lambda item: item[1].self_time, reverse=True))
+
+    def to_json(self) -> dict:
+        return {
+            'opcodes': {key: asdict(entry) for key, entry in
+                        sorted(self.opcodes.items(), key=lambda item: item[1].self_time, reverse=True)},
+            'functions': {key: asdict(entry) for key, entry in
+                          sorted(self.functions.items(), key=lambda item: item[1].self_time, reverse=True)},
+            'lines': {key: {'count': entry.count, 'self_time': entry.self_time} for key, entry in self.lines.items()},
+            'call_edges': [asdict(edge) for edge in
+                           sorted(self.call_edges.values(), key=lambda edge: edge.total_time, reverse=True)],
+        }
+
+    def write_json(self, output_file_name: str) -> None:
+        with open(output_file_name, 'w') as output_file:
+            json.dump(self.to_json(), output_file, indent=4)
+
+    def write_folded_stacks(self, output_file_name: str) -> None:
+        # One "frame;frame;... value" line per stack, with the self time in microseconds
+        with open(output_file_name, 'w') as output_file:
+            for stack, self_time in sorted(self.folded_stacks.items()):
+                output_file.write(f'{stack} {self_time // 1000}\n')
+
+    def __str__(self) -> str:
+        lines: list[str] = ['Expression            Count   Total (ms)   Self (ms)']
+        for key, entry in sorted(self.opcodes.items(), key=lambda item: item[1].self_time, reverse=True):
+            lines.append(f'{key:<20} {entry.count:>6} {entry.total_time / 1e6:>12.3f} {entry.self_time / 1e6:>11.3f}')
+        lines.append('Function              Calls   Total (ms)   Self (ms)')
+        for key, entry in sorted(self.functions.items(), key=lambda item: item[1].self_time, reverse=True):
+            lines.append(f'{key:<20} {entry.count:>6} {entry.total_time / 1e6:>12.3f} {entry.self_time / 1e6:>11.3f}')
+        lines.append('Hottest lines                        Count   Self (ms)')
+        for key, entry in list(self.lines.items())[:10]:
+            lines.append(f'{key:<35} {entry.count:>6} {entry.self_time / 1e6:>11.3f}')
+        return '\n'.join(lines)
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, asdict, field
+from xml.etree import ElementTree
+
+
+@dataclass
+class AssertionResult:
+    index: int
+    kind: str
+    passed: bool
+    # Class name of the WebAssemblyException raised while checking the assertion (expected or not)
+    trap: str | None = None
+    location: str | None = None
+    # Nanoseconds spent building the expressions, in the constructors of the instructions (validation) and of the
+    # modules they contain (instantiation), and in the assertion
+    parse_time: int = 0
+    validate_time: int = 0
+    instantiate_time: int = 0
+    execute_time: int = 0
+
+
+@dataclass
+class TestReport:
+    file_name: str
+    results: list[AssertionResult] = field(default_factory=list)
+
+    @property
+    def passed(self) -> int:
+        return sum(1 for result in self.results if result.passed)
+
+    @property
+    def failed(self) -> int:
+        return len(self.results) - self.passed
+
+    def to_json(self) -> dict:
+        return {
+            'file': self.file_name,
+            'assertions': len(self.results),
+            'passed': self.passed,
+            'failed': self.failed,
+            'results': [asdict(result) for result in self.results],
+        }
+
+    def write_json(self, output_file_name: str) -> None:
+        with open(output_file_name, 'w') as output_file:
+            json.dump(self.to_json(), output_file, indent=4)
+
+    def to_junit(self) -> ElementTree.ElementTree:
+        total_time: float = sum(result.parse_time + result.validate_time + result.instantiate_time +
+                                result.execute_time for result in self.results) / 1e9
+        test_suite: ElementTree.Element = ElementTree.Element('testsuite', {
+            'name': self.file_name,
+            'tests': str(len(self.results)),
+            'failures': str(self.failed),
+            'errors': '0',
+            'time': f'{total_time:.6f}',
+        })
+        for result in self.results:
+            test_case: ElementTree.Element = ElementTree.SubElement(test_suite, 'testcase', {
+                'classname': self.file_name,
+                'name': f'#{result.index} {result.kind}',
+                'time': f'{result.execute_time / 1e9:.6f}',
+            })
+            properties: ElementTree.Element = ElementTree.SubElement(test_case, 'properties')
+            for name in ('parse_time', 'validate_time', 'instantiate_time', 'execute_time'):
+                ElementTree.SubElement(properties, 'property', {'name': name, 'value': str(getattr(result, name))})
+            if result.trap is not None:
+                ElementTree.SubElement(properties, 'property', {'name': 'trap', 'value': result.trap})
+            if not result.passed:
+                message: str = f'{result.kind} failed' + (f' at {result.location}' if result.location else '')
+                ElementTree.SubElement(test_case, 'failure', {'message': message, 'type': result.trap or result.kind})
+        test_suites: ElementTree.Element = ElementTree.Element('testsuites')
+        test_suites.append(test_suite)
+        return ElementTree.ElementTree(test_suites)
+
+    def write_junit(self, output_file_name: str) -> None:
+        tree: ElementTree.ElementTree = self.to_junit()
+        ElementTree.indent(tree)
+        tree.write(output_file_name, encoding='utf-8', xml_declaration=True)
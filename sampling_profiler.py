@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import json
+import sys
+import threading
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Callable
+
+from evaluations import Evaluation
+from function import FunctionExpression
+from source_map import SourceLocation, location_of
+
+# Root of every sampled stack
+HOST: str = '<host>'
+
+
+# Taken before anything (e.g. the Profiler) replaces the method, so it is the code that actually runs the function
+_FUNCTION_CODE: CodeType = FunctionExpression.__dict__['evaluate'].__code__
+
+
+def recognize_function(frame: FrameType) -> str | None:
+    # Guest functions of the tree-walking engine are FunctionExpression.evaluate frames
+    if frame.f_code is not _FUNCTION_CODE:
+        return None
+    return frame.f_locals['self'].display_name
+
+
+def recognize_instruction(frame: FrameType) -> str | None:
+    if frame.f_code.co_name not in ('evaluate', 'compute'):
+        return None
+    expression = frame.f_locals.get('self')
+    if not isinstance(expression, Evaluation) or isinstance(expression, FunctionExpression):
+        return None
+    location: SourceLocation | None = location_of(expression)
+    if location is None:
+        return expression.__class__.__name__
+    return f'{expression.__class__.__name__} ({location.file_name}:{location.line})'
+
+
+# Functions turning a Python frame into the name of a guest function (or None); other engines can add their own
+FUNCTION_RECOGNIZERS: list[Callable[[FrameType], str | None]] = [recognize_function]
+# Same, for the instruction running in the innermost guest function
+INSTRUCTION_RECOGNIZERS: list[Callable[[FrameType], str | None]] = [recognize_instruction]
+
+
+class SamplingProfiler:
+    # A background thread looks at the stack of the profiled thread every interval seconds and counts the guest call
+    # stacks it finds, so the profiled code itself runs unchanged
+    interval: float = 0.005
+    # Folded stacks (host;function;...;instruction) and the function part of them
+    samples: Counter[str]
+    function_stacks: Counter[tuple[str, ...]]
+    total_samples: int = 0
+
+    _thread_id: int = None
+    _thread: threading.Thread | None = None
+    _stop: threading.Event = None
+
+    def __init__(self, interval: float = 0.005, thread_id: int | None = None):
+        self.interval = interval
+        self.samples = Counter()
+        self.function_stacks = Counter()
+        self.total_samples = 0
+        self._thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self) -> SamplingProfiler:
+        self.start()
+        return self
+
+    def __exit__(self, *exception_info) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        frame: FrameType | None = sys._current_frames().get(self._thread_id)
+        if frame is None:
+            return
+        self.total_samples += 1
+        functions, instruction = self.guest_stack(frame)
+        if len(functions) == 0:
+            return
+        self.function_stacks[functions] += 1
+        self.samples[';'.join((HOST,) + functions + ((instruction,) if instruction is not None else ()))] += 1
+
+    @staticmethod
+    def guest_stack(frame: FrameType | None) -> tuple[tuple[str, ...], str | None]:
+        # Guest functions (outermost first) and the instruction running in the innermost one
+        functions: list[str] = []
+        instruction: str | None = None
+        while frame is not None:
+            name: str | None = None
+            for recognizer in FUNCTION_RECOGNIZERS:
+                name = recognizer(frame)
+                if name is not None:
+                    functions.append(name)
+                    break
+            if name is None and instruction is None and len(functions) == 0:
+                for recognizer in INSTRUCTION_RECOGNIZERS:
+                    instruction = recognizer(frame)
+                    if instruction is not None:
+                        break
+            frame = frame.f_back
+        return tuple(reversed(functions)), instruction
+
+    def hot_functions(self, limit: int = 10) -> list[tuple[str, int, int]]:
+        # (function, samples in which it was the innermost function, samples in which it was on the stack)
+        self_samples: Counter[str] = Counter()
+        total_samples: Counter[str] = Counter()
+        for functions, count in self.function_stacks.items():
+            self_samples[functions[-1]] += count
+            for function in set(functions):
+                total_samples[function] += count
+        return [(function, self_samples[function], total_samples[function])
+                for function, _ in self_samples.most_common(limit)]
+
+    def write_folded_stacks(self, output_file_name: str) -> None:
+        with open(output_file_name, 'w') as output_file:
+            for stack, count in sorted(self.samples.items()):
+                output_file.write(f'{stack} {count}\n')
+
+    def write_json(self, output_file_name: str, limit: int = 10) -> None:
+        with open(output_file_name, 'w') as output_file:
+            json.dump({
+                'interval': self.interval,
+                'total_samples': self.total_samples,
+                'guest_samples': sum(self.samples.values()),
+                'hot_functions': [{'function': function, 'self_samples': self_samples, 'total_samples': total}
+                                  for function, self_samples, total in self.hot_functions(limit)],
+            }, output_file, indent=4)
+
+    def __str__(self) -> str:
+        guest_samples: int = sum(self.samples.values())
+        lines: list[str] = [f'{guest_samples} guest samples out of {self.total_samples}',
+                            'Function                  Self   Total']
+        for function, self_samples, total in self.hot_functions():
+            lines.append(f'{function:<24} {self_samples:>6} {total:>7}')
+        return '\n'.join(lines)
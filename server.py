@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import signal
+import socketserver
+import sys
+import threading
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from os.path import basename, splitext
+from typing import Any, BinaryIO
+
+from api import Instance, Module
+from custom_exceptions import WebAssemblyException, InvalidFunctionSignatureError, UnknownFunctionError, \
+    trap_name
+
+# Instances of the worker process, loaded once by load_instances
+_instances: dict[str, Instance] | None = None
+
+
+def load_instances(file_names: list[str]) -> dict[str, Instance]:
+    # Modules are named after their file. Each instance has its own memory and globals (see api.InstanceState)
+    global _instances
+    if _instances is None:
+        _instances = {splitext(basename(file_name))[0]: Module.from_file(file_name).instantiate()
+                      for file_name in file_names}
+    return _instances
+
+
+def handle(request: dict[str, Any]) -> dict[str, Any]:
+    # {"invoke": export, "args": [...], "module": name?, "id": any?} -> {"id", "result": [...]} or {"id", "trap"}.
+    # Requests that can't be run get {"id", "error"}
+    response: dict[str, Any] = {'id': request['id']} if 'id' in request else {}
+    name: Any = request.get('invoke')
+    args: Any = request.get('args', [])
+    if not isinstance(name, str) or not isinstance(args, list):
+        response['error'] = 'Expected {"invoke": name, "args": [...]}'
+        return response
+    module_name: str | None = request.get('module')
+    if module_name is not None and module_name not in _instances:
+        response['error'] = f'Unknown module "{module_name}"'
+        return response
+    candidates: list[Instance] = [_instances[module_name]] if module_name is not None else list(_instances.values())
+    instance: Instance | None = next((instance for instance in candidates if name in instance.exports), None)
+    try:
+        if instance is None:
+            raise UnknownFunctionError(name)
+        result: Any = instance.exports[name](*args)
+    except (UnknownFunctionError, InvalidFunctionSignatureError) as error:
+        response['error'] = str(error)
+    except WebAssemblyException as exception:
+        response['trap'] = trap_name(exception)
+    except RecursionError:
+        response['trap'] = 'call stack exhausted'
+    except Exception as error:
+        # Errors of the interpreter itself must not stop the server
+        response['error'] = f'{type(error).__name__}: {error}'
+    else:
+        response['result'] = [] if result is None else list(result) if isinstance(result, tuple) else [result]
+    return response
+
+
+class InlineExecutor(Executor):
+    # Runs the requests in the server process, one at a time (the interpreter state is global), without the
+    # round trip to a worker
+    _lock: threading.Lock
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def submit(self, function, *args, **kwargs) -> Future:
+        future: Future = Future()
+        with self._lock:
+            try:
+                future.set_result(function(*args, **kwargs))
+            except BaseException as exception:
+                future.set_exception(exception)
+        return future
+
+
+def error_response(request: dict[str, Any], error: Exception) -> dict[str, Any]:
+    response: dict[str, Any] = {'id': request['id']} if 'id' in request else {}
+    response['error'] = f'{type(error).__name__}: {error}'
+    return response
+
+
+def serve(executor: Executor, reader: BinaryIO, writer: BinaryIO) -> None:
+    # One JSON request per line. Requests are read and submitted without waiting for the previous answers
+    # (pipelining); the answers are written in the order of the requests, flushed when no other answer is ready
+    pending: queue.Queue[tuple[dict[str, Any], Future] | dict[str, Any] | None] = queue.Queue()
+
+    def write_responses() -> None:
+        while True:
+            item: tuple[dict[str, Any], Future] | dict[str, Any] | None = pending.get()
+            if item is None:
+                break
+            if isinstance(item, dict):
+                response: dict[str, Any] = item
+            else:
+                request, future = item
+                try:
+                    response = future.result()
+                except Exception as error:
+                    # A worker that stopped (BrokenProcessPool) fails its requests, not the writer
+                    response = error_response(request, error)
+            writer.write(json.dumps(response).encode() + b'\n')
+            if pending.empty():
+                writer.flush()
+        writer.flush()
+
+    writer_thread: threading.Thread = threading.Thread(target=write_responses, daemon=True)
+    writer_thread.start()
+    try:
+        for line in reader:
+            if line.strip() == b'':
+                continue
+            try:
+                request: Any = json.loads(line)
+            except ValueError as error:
+                pending.put({'error': f'Invalid JSON: {error}'})
+                continue
+            if not isinstance(request, dict):
+                pending.put({'error': 'Expected a JSON object'})
+                continue
+            try:
+                pending.put((request, executor.submit(handle, request)))
+            except Exception as error:
+                # The pool of workers is broken once one of them stopped
+                pending.put(error_response(request, error))
+    finally:
+        pending.put(None)
+        writer_thread.join()
+
+
+def create_executor(file_names: list[str], workers: int) -> Executor:
+    # Each worker process loads its own instances, so their state (memory, globals) isn't shared between workers,
+    # and consecutive requests may run on different workers: with several workers the exports should be stateless
+    load_instances(file_names)
+    if workers <= 1:
+        return InlineExecutor()
+    return ProcessPoolExecutor(max_workers=workers, initializer=load_instances, initargs=(file_names,))
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    executor: Executor = None
+
+    def handle(self) -> None:
+        serve(self.executor, self.rfile, self.wfile)
+
+
+if __name__ == '__main__':
+    parser: ArgumentParser = ArgumentParser(description="Keep modules instantiated and answer invoke requests "
+                                                        "(JSON lines) on stdin or a Unix socket")
+    parser.add_argument("input_files", nargs="+")
+    parser.add_argument("--socket", metavar="PATH",
+                        help="listen on a Unix socket instead of stdin/stdout")
+    parser.add_argument("--workers", type=int, default=1, metavar="N",
+                        help="worker processes, each with its own instances (memory, globals), so that a request "
+                             "doesn't see the changes of the previous ones unless they ran on the same worker "
+                             "(default: run in the server process)")
+
+    args: Namespace = parser.parse_args()
+
+    executor: Executor = create_executor(args.input_files, args.workers)
+    try:
+        if args.socket is None:
+            serve(executor, sys.stdin.buffer, sys.stdout.buffer)
+        else:
+            if os.path.exists(args.socket):
+                os.remove(args.socket)
+            RequestHandler.executor = executor
+            # Stopping the server (Ctrl+C or SIGTERM) removes the socket
+            signal.signal(signal.SIGTERM, signal.default_int_handler)
+            with socketserver.ThreadingUnixStreamServer(args.socket, RequestHandler) as server:
+                try:
+                    server.serve_forever()
+                except KeyboardInterrupt:
+                    pass
+            os.remove(args.socket)
+    finally:
+        executor.shutdown()
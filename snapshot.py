@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import mmap
+import pickle
+import struct
+import zlib
+from typing import Any, BinaryIO, Callable
+
+from api import Instance, Module, switch_instance
+from custom_exceptions import InvalidSyntaxError
+from function import FunctionRegistry, FunctionExpression, EXPORTED_FUNCTIONS
+from host import HostFunction
+from variables import GlobalVariableWatch, Memory, PAGE_SIZE
+
+# Magic, version, flags, length of the state, offset and length of the memory image, size of the memory, maximum
+# (0 for none)
+HEADER: struct.Struct = struct.Struct('<8sIIQQQQQ')
+MAGIC: bytes = b'WASMSNAP'
+VERSION: int = 1
+COMPRESSED: int = 1
+
+
+def save_snapshot(instance: Instance, file_name: str, compress: bool = False) -> None:
+    # The module, globals and table are pickled together (the table refers to functions of the module). The memory
+    # follows at a page-aligned offset, raw so that it can be mapped when the snapshot is loaded, or compressed
+    switch_instance(instance)
+    memory: Memory = Memory()
+    state: bytes = zlib.compress(pickle.dumps({
+        'module': instance.module.expression,
+        'globals': GlobalVariableWatch().save(),
+        'table': FunctionRegistry().functions,
+    }, pickle.HIGHEST_PROTOCOL))
+    view: memoryview = memory.view()
+    try:
+        image: bytes | memoryview = zlib.compress(view) if compress else view
+        memory_offset: int = -(-(HEADER.size + len(state)) // PAGE_SIZE) * PAGE_SIZE
+        with open(file_name, 'wb') as output_file:
+            output_file.write(HEADER.pack(MAGIC, VERSION, COMPRESSED if compress else 0, len(state), memory_offset,
+                                          len(image), len(view),
+                                          memory.maximum + 1 if memory.maximum is not None else 0))
+            output_file.write(state)
+            output_file.seek(memory_offset)
+            output_file.write(image)
+    finally:
+        view.release()
+
+
+def read_header(input_file: BinaryIO) -> tuple[int, int, int, int, int, int | None]:
+    magic, version, flags, state_length, memory_offset, image_length, memory_size, maximum = \
+        HEADER.unpack(input_file.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise InvalidSyntaxError(f'Not a snapshot (version {VERSION})')
+    return flags, state_length, memory_offset, image_length, memory_size, maximum - 1 if maximum != 0 else None
+
+
+def load_snapshot(file_name: str, imports: dict[str, dict[str, HostFunction | Callable]] | None = None) -> Instance:
+    # Replaces the interpreter state with the one of the snapshot, without running the module again. An uncompressed
+    # memory is mapped copy-on-write: pages are read from the file when they are used, and writes stay private
+    with open(file_name, 'rb') as input_file:
+        flags, state_length, memory_offset, image_length, memory_size, maximum = read_header(input_file)
+        state: dict[str, Any] = pickle.loads(zlib.decompress(input_file.read(state_length)))
+        if flags & COMPRESSED:
+            input_file.seek(memory_offset)
+            data: bytearray | mmap.mmap = bytearray(zlib.decompress(input_file.read(image_length)))
+        elif memory_size == 0:
+            data = bytearray()
+        else:
+            data = mmap.mmap(input_file.fileno(), memory_size, access=mmap.ACCESS_COPY, offset=memory_offset)
+    module: Module = Module(state['module'])
+    switch_instance(None)
+    module.bind_imports(imports)
+    for child in module.expression.children:
+        if isinstance(child, FunctionExpression) and child.export_as is not None:
+            EXPORTED_FUNCTIONS[child.export_as] = child
+    GlobalVariableWatch().restore(state['globals'])
+    FunctionRegistry().functions = state['table']
+    Memory().load(data, maximum)
+    return Instance(module)
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import re
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+from weakref import WeakKeyDictionary
+
+if TYPE_CHECKING:
+    from expressions import SExpression
+
+# Everything the parser doesn't need to see: strings are matched first so that ';' and spaces inside them survive,
+# and "if(then" gets a space so that the expression name can be split from its children
+_NORMALIZE_REGEX: re.Pattern[str] = re.compile(r'"(?:[^"\\\n]|\\.)*"|\(;.*?;\)|;[^\n]*|\s+|(?<=if)(?=\(then)', re.S)
+
+
+@dataclass(frozen=True)
+class SourceLocation:
+    file_name: str
+    line: int
+    column: int
+
+    def __str__(self) -> str:
+        return f'{self.file_name}:{self.line}:{self.column}'
+
+
+class SourceMap:
+    # Maps offsets in the normalized text (the one the parser sees) back to lines and columns of the source file.
+    # Normalization only replaces runs of text (comments, whitespace) with at most one space, so the map is a list of
+    # segments in which both texts advance together.
+    file_name: str
+    _line_starts: array
+    _normalized_starts: array
+    _original_starts: array
+
+    def __init__(self, file_name: str, line_starts: array, normalized_starts: array, original_starts: array):
+        self.file_name = file_name
+        self._line_starts = line_starts
+        self._normalized_starts = normalized_starts
+        self._original_starts = original_starts
+
+    def original_offset(self, offset: int) -> int:
+        segment: int = bisect_right(self._normalized_starts, offset) - 1
+        return self._original_starts[segment] + offset - self._normalized_starts[segment]
+
+    def location(self, offset: int) -> SourceLocation:
+        original_offset: int = self.original_offset(offset)
+        line: int = bisect_right(self._line_starts, original_offset) - 1
+        return SourceLocation(self.file_name, line + 1, original_offset - self._line_starts[line] + 1)
+
+
+def normalize(text: str, file_name: str) -> tuple[str, SourceMap]:
+    # Removes comments and collapses whitespace, remembering where every part of the result came from
+    pieces: list[str] = []
+    normalized_length: int = 0
+    normalized_starts: array = array('q', [0])
+    original_starts: array = array('q', [0])
+    previous_end: int = 0
+    last_character: str = ''
+    for match in _NORMALIZE_REGEX.finditer(text):
+        start, end = match.span()
+        if start > previous_end:
+            pieces.append(text[previous_end:start])
+            normalized_length += start - previous_end
+            last_character = text[start - 1]
+        if match.group().startswith('"'):
+            # Strings are kept as they are
+            pieces.append(text[start:end])
+            normalized_length += end - start
+            last_character = '"'
+            previous_end = end
+            continue
+        if last_character != ' ':
+            pieces.append(' ')
+            normalized_length += 1
+            last_character = ' '
+        previous_end = end
+        normalized_starts.append(normalized_length)
+        original_starts.append(end)
+    pieces.append(text[previous_end:])
+    line_starts: array = array('q', [0])
+    line_starts.extend(match.end() for match in re.finditer('\n', text))
+    return ''.join(pieces), SourceMap(file_name, line_starts, normalized_starts, original_starts)
+
+
+# Side table instead of an attribute on every expression; entries go away with the expressions
+_LOCATIONS: WeakKeyDictionary[SExpression, tuple[SourceMap, int]] = WeakKeyDictionary()
+
+
+def record_location(expression: SExpression, source_map: SourceMap, offset: int) -> None:
+    _LOCATIONS[expression] = (source_map, offset)
+
+
+def copy_location(source: SExpression, target: SExpression) -> None:
+    # For expressions replaced by the optimizations
+    entry: tuple[SourceMap, int] | None = _LOCATIONS.get(source)
+    if entry is not None and target not in _LOCATIONS:
+        _LOCATIONS[target] = entry
+
+
+def location_of(expression: SExpression) -> SourceLocation | None:
+    entry: tuple[SourceMap, int] | None = _LOCATIONS.get(expression)
+    if entry is None:
+        return None
+    source_map, offset = entry
+    return source_map.location(offset)
+
+
+def locate_exception(exception: BaseException) -> SourceLocation | None:
+    # The innermost expression whose evaluate was running when the exception was raised, found through the
+    # traceback so that evaluate doesn't have to keep track of anything
+    location: SourceLocation | None = None
+    traceback = exception.__traceback__
+    while traceback is not None:
+        expression = traceback.tb_frame.f_locals.get('self')
+        if expression is not None:
+            try:
+                expression_location: SourceLocation | None = location_of(expression)
+            except TypeError:
+                # Not an expression (can't be weakly referenced)
+                expression_location = None
+            if expression_location is not None:
+                location = expression_location
+        traceback = traceback.tb_next
+    return location
@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import json
+from abc import ABCMeta, abstractmethod
+from collections import Counter
+from typing import Callable
+
+from custom_exceptions import UnknownVariableError, InvalidNumberTypeError
+from enums import NumberType
+from integer_arithmetic import BITS
+from evaluations import Evaluation, BinaryEvaluation, LocalGetter, LocalSetter, EvaluationReport
+from expressions import SExpression, ModuleExpression
+from function import FunctionExpression
+from logic import BranchIfExpression
+from operations import ConstExpression, AddExpression, SubExpression, MulExpression, AndExpression, EqExpression, \
+    EqzExpression, NeExpression, LtsExpression, LtuExpression, LesExpression, LeuExpression, GtsExpression, \
+    GtuExpression, GesExpression, GeuExpression
+from optimizer import OPERAND_ATTRIBUTES
+from source_map import copy_location
+from variables import Stack, VariableWatch, FixedNumber
+
+# Raw result of a binary operation, from the same kernel as the expressions in operations.py
+BINARY_FUNCTIONS: dict[type, Callable[[int, int, int], int]] = {
+    operation: operation.integer_function
+    for operation in (AddExpression, SubExpression, MulExpression, AndExpression, EqExpression, NeExpression,
+                      LtsExpression, LtuExpression, LesExpression, LeuExpression, GtsExpression, GtuExpression,
+                      GesExpression, GeuExpression)
+}
+
+
+class FusedEvaluation(Evaluation, metaclass=ABCMeta):
+    # ABCMeta, so that a fused expression without compute can't be created
+    fusion: str = None
+
+    @abstractmethod
+    def compute(self, local_variables: VariableWatch) -> int:
+        pass
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        stack.push(FixedNumber(self.compute(local_variables), self.number_type))
+
+
+def _get_local(local_variables: VariableWatch, name: int | str, number_type: NumberType) -> FixedNumber:
+    if name not in local_variables:
+        raise UnknownVariableError(name)
+    value: FixedNumber = local_variables[name]
+    if value.number_type != number_type:
+        raise InvalidNumberTypeError(value, number_type)
+    return value
+
+
+class LocalBinaryExpression(FusedEvaluation):
+    # local.get + local.get + operation
+    fusion = 'local-local-op'
+    first_local: int | str = None
+    second_local: int | str = None
+    operand_type: NumberType = None
+    bits: int = None
+    function: Callable[[int, int, int], int] = None
+
+    def __init__(self, operation: BinaryEvaluation, **kwargs):
+        self.expression_name = operation.expression_name
+        # Comparisons have an i32 result, whatever the type of their operands
+        self.number_type = operation.number_type
+        self.operand_type = operation.operand_type
+        self.bits = BITS[self.operand_type]
+        self.first_local = operation.children[0].name
+        self.second_local = operation.children[1].name
+        self.function = BINARY_FUNCTIONS[operation.__class__]
+        self.children = []
+
+    def compute(self, local_variables: VariableWatch) -> int:
+        return self.function(_get_local(local_variables, self.first_local, self.operand_type).value,
+                             _get_local(local_variables, self.second_local, self.operand_type).value, self.bits)
+
+    def __str__(self) -> str:
+        return f'{self.expression_name}({self.first_local}, {self.second_local})'
+
+
+class LocalConstBinaryExpression(FusedEvaluation):
+    # local.get + const + operation
+    fusion = 'local-const-op'
+    local: int | str = None
+    constant: FixedNumber = None
+    operand_type: NumberType = None
+    bits: int = None
+    function: Callable[[int, int, int], int] = None
+
+    def __init__(self, operation: BinaryEvaluation, **kwargs):
+        self.expression_name = operation.expression_name
+        self.number_type = operation.number_type
+        self.operand_type = operation.operand_type
+        self.bits = BITS[self.operand_type]
+        self.local = operation.children[0].name
+        self.constant = operation.children[1].value
+        self.function = BINARY_FUNCTIONS[operation.__class__]
+        self.children = []
+
+    def compute(self, local_variables: VariableWatch) -> int:
+        return self.function(_get_local(local_variables, self.local, self.operand_type).value, self.constant.value,
+                             self.bits)
+
+    def __str__(self) -> str:
+        return f'{self.expression_name}({self.local}, {self.constant})'
+
+
+class FusedBranchIfExpression(Evaluation):
+    # fused comparison + br_if
+    fusion = 'compare-br_if'
+    label: str = None
+    condition: FusedEvaluation = None
+
+    def __init__(self, branch: BranchIfExpression, **kwargs):
+        self.expression_name = branch.expression_name
+        self.label = branch.children[0].expression_name
+        self.condition = branch.children[1]
+        self.children = []
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> EvaluationReport:
+        if self.condition.compute(local_variables) != 0:
+            return EvaluationReport(signal_break=True, jump_to=self.label)
+
+    def __str__(self) -> str:
+        return f'{self.expression_name}({self.label}, {self.condition})'
+
+
+class FusedLocalSetter(Evaluation):
+    # fused operation + local.set
+    fusion = 'set-local-op'
+    operation: FusedEvaluation = None
+
+    def __init__(self, setter: LocalSetter, **kwargs):
+        self.expression_name = setter.expression_name
+        self.name = setter.name
+        self.operation = setter.children[0]
+        self.number_type = self.operation.number_type
+        self.children = []
+
+    def evaluate(self, stack: Stack, local_variables: VariableWatch = None, global_variables=None) -> None:
+        local_variables[self.name] = FixedNumber(self.operation.compute(local_variables), self.number_type)
+
+    def __str__(self) -> str:
+        return f'{self.expression_name}({self.name}, {self.operation})'
+
+
+class FusedEqzExpression(EqzExpression):
+    # const 0 + eq
+    fusion = 'eq-zero'
+
+
+def _is_constant(expression: SExpression, value: int) -> bool:
+    return isinstance(expression, ConstExpression) and expression.value.value == value
+
+
+def _fuse_binary(expression: Evaluation, enabled: set[str]) -> Evaluation | None:
+    if expression.__class__ not in BINARY_FUNCTIONS or len(expression.children) != 2:
+        return None
+    first_operand, second_operand = expression.children
+    if first_operand.__class__ is not LocalGetter:
+        return None
+    if second_operand.__class__ is LocalGetter and LocalBinaryExpression.fusion in enabled:
+        return LocalBinaryExpression(expression)
+    if isinstance(second_operand, ConstExpression) and LocalConstBinaryExpression.fusion in enabled and \
+            second_operand.number_type == expression.operand_type:
+        return LocalConstBinaryExpression(expression)
+    return None
+
+
+def _fuse_eq_zero(expression: Evaluation, enabled: set[str]) -> Evaluation | None:
+    if expression.__class__ is not EqExpression or len(expression.children) != 2 or \
+            FusedEqzExpression.fusion not in enabled:
+        return None
+    first_operand, second_operand = expression.children
+    if _is_constant(second_operand, 0):
+        operand = first_operand
+    elif _is_constant(first_operand, 0):
+        operand = second_operand
+    else:
+        return None
+    eqz: FusedEqzExpression = FusedEqzExpression.__new__(FusedEqzExpression)
+    eqz.expression_name = f'{expression.operand_type.value}.eqz'
+    eqz.number_type = expression.number_type
+    eqz.operand_type = expression.operand_type
+    eqz.children = [operand]
+    return eqz
+
+
+def _fuse_branch_if(expression: Evaluation, enabled: set[str]) -> Evaluation | None:
+    if expression.__class__ is not BranchIfExpression or len(expression.children) != 2 or \
+            FusedBranchIfExpression.fusion not in enabled or not isinstance(expression.children[1], FusedEvaluation):
+        return None
+    return FusedBranchIfExpression(expression)
+
+
+def _fuse_local_setter(expression: Evaluation, enabled: set[str]) -> Evaluation | None:
+    if expression.__class__ is not LocalSetter or len(expression.children) != 1 or \
+            FusedLocalSetter.fusion not in enabled or not isinstance(expression.children[0], FusedEvaluation):
+        return None
+    return FusedLocalSetter(expression)
+
+
+# Applied bottom-up, so the fusions of a node can build on the fusions of its operands
+FUSIONS: dict[str, Callable[[Evaluation, set[str]], Evaluation | None]] = {
+    'local-local-op': _fuse_binary,
+    'local-const-op': _fuse_binary,
+    'eq-zero': _fuse_eq_zero,
+    'compare-br_if': _fuse_branch_if,
+    'set-local-op': _fuse_local_setter,
+}
+
+# Fusions which only apply on top of other fusions
+REQUIREMENTS: dict[str, tuple[str, ...]] = {
+    'compare-br_if': ('local-local-op', 'local-const-op'),
+    'set-local-op': ('local-local-op', 'local-const-op'),
+}
+
+
+class Fuser:
+    enabled: set[str]
+    fused: Counter[str]
+
+    def __init__(self, enabled: set[str] | None = None):
+        self.enabled = set(FUSIONS.keys()) if enabled is None else set(enabled)
+        self.fused = Counter()
+
+    def fuse_module(self, module: ModuleExpression) -> Counter[str]:
+        self.fused = Counter()
+        for child in module.children:
+            if isinstance(child, FunctionExpression):
+                self._fuse(child)
+        return self.fused
+
+    def _fuse(self, expression: SExpression) -> SExpression:
+        if not isinstance(expression, Evaluation):
+            return expression
+        if len(expression.children) > 0:
+            expression.children = [self._fuse(child) for child in expression.children]
+        for attribute in OPERAND_ATTRIBUTES:
+            operand = expression.__dict__.get(attribute)
+            if isinstance(operand, Evaluation):
+                setattr(expression, attribute, self._fuse(operand))
+        for fusion in dict.fromkeys(FUSIONS.values()):
+            fused: Evaluation | None = fusion(expression, self.enabled)
+            if fused is not None:
+                copy_location(expression, fused)
+                self.fused[fused.fusion] += 1
+                return fused
+        return expression
+
+
+class FusionProfiler:
+    # Fuses everything and counts how often each fused expression runs
+    executions: Counter[str]
+
+    def __init__(self):
+        self.executions = Counter()
+
+    def instrument_module(self, module: ModuleExpression) -> None:
+        Fuser().fuse_module(module)
+        for child in module.children:
+            if isinstance(child, FunctionExpression):
+                self._instrument(child)
+
+    def _instrument(self, expression: SExpression) -> None:
+        if not isinstance(expression, Evaluation):
+            return
+        fusion: str | None = getattr(expression, 'fusion', None)
+        if fusion is not None:
+            self._count(expression, fusion)
+        for child in expression.children:
+            self._instrument(child)
+        for attribute in OPERAND_ATTRIBUTES + ('operation',):
+            operand = expression.__dict__.get(attribute)
+            if isinstance(operand, Evaluation):
+                self._instrument(operand)
+
+    def _count(self, expression: Evaluation, fusion: str) -> None:
+        # An instance attribute shadows the class method, so only the profiled expressions pay for counting.
+        # Fused operations are counted in compute, which is also used when they are nested in other fusions.
+        method_name: str = 'compute' if isinstance(expression, FusedEvaluation) else 'evaluate'
+        method = getattr(expression, method_name)
+        executions: Counter[str] = self.executions
+
+        def counted(*args, **kwargs):
+            executions[fusion] += 1
+            return method(*args, **kwargs)
+
+        setattr(expression, method_name, counted)
+
+    def select(self, minimum_share: float = 0.01) -> set[str]:
+        total: int = sum(self.executions.values())
+        selected: set[str] = {fusion for fusion, count in self.executions.items()
+                              if total > 0 and count / total >= minimum_share}
+        for fusion in list(selected):
+            selected.update(requirement for requirement in REQUIREMENTS.get(fusion, ())
+                            if self.executions[requirement] > 0)
+        return selected
+
+    def write(self, output_file_name: str, minimum_share: float = 0.01) -> None:
+        with open(output_file_name, 'w') as output_file:
+            json.dump({
+                'executions': dict(self.executions.most_common()),
+                'selected': sorted(self.select(minimum_share)),
+            }, output_file, indent=4)
+
+
+def read_fusion_profile(input_file_name: str) -> set[str]:
+    with open(input_file_name, 'r') as input_file:
+        return set(json.load(input_file)['selected'])
@@ -1,13 +1,23 @@
 from __future__ import annotations
 
+import atexit
+import contextlib
 import ctypes
-import math
-
+import mmap
+import multiprocessing
+import os
+import struct
+import time
 from dataclasses import dataclass
-from typing import Any
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, ContextManager
 
-from custom_exceptions import StackEmptyError, StackOverflowError, InvalidNumberTypeError
+from custom_exceptions import StackEmptyError, StackOverflowError, InvalidNumberTypeError, \
+    OutOfBoundsMemoryAccessError, UnalignedAtomicError, ExpectedSharedMemoryError, InvalidSyntaxError, \
+    SharedMemoryTooLargeError
 from enums import NumberType
+import float_arithmetic
+from integer_arithmetic import BITS, wrap, to_unsigned
 from singleton import singleton
 
 
@@ -66,6 +76,13 @@ class Stack:
         self._stacks = [[]]
         self._stack_size = stack_size
 
+    def save(self) -> tuple[list[list[Any]], int]:
+        # Stacks of a call that is suspended and resumed later
+        return self._stacks, self._stack_size
+
+    def restore(self, state: tuple[list[list[Any]], int]) -> None:
+        self._stacks, self._stack_size = state
+
     def pop(self) -> Any:
         if self.get_total_size() == 0:
             raise StackEmptyError()
@@ -133,13 +150,12 @@ class FixedNumber:
 
     @property
     def unsigned_value(self) -> int:
-        if self.number_type in [NumberType.f32, NumberType.f64]:
-            return self._value
-        if self.number_type == NumberType.i32:
-            mask = 0x80000000
-        else:
-            mask = 0x8000000000000000
-        return (self._value & (mask - 1)) + (self._value & mask)
+        # Floats are represented by their bit pattern, so that NaNs and signed zeros compare exactly
+        if self.number_type in BITS:
+            return to_unsigned(self._value, BITS[self.number_type])
+        if self.number_type in float_arithmetic.BITS:
+            return float_arithmetic.to_bits(self._value, float_arithmetic.BITS[self.number_type])
+        return self._value
 
     @value.setter
     def value(self, new_value: int | float):
@@ -168,13 +184,6 @@ class FixedNumber:
 
 
 def assert_number_type(number: int | float, number_type: NumberType) -> int | float:
-    def can_be_represented_in_32_bits(f: float):
-        numerator, denominator = f.as_integer_ratio()
-        gcd = math.gcd(numerator, denominator)
-        if gcd != 1:
-            return False
-        return -2147483648 <= numerator <= 2147483647 and -2147483648 <= denominator <= 2147483647
-
     if number_type == NumberType.v128:
         return number
 
@@ -187,11 +196,14 @@ def assert_number_type(number: int | float, number_type: NumberType) -> int | fl
 
     # Overflow
     if number_type == NumberType.i32:
-        number = (number & 0x7FFFFFFF) + (number & 0x80000000) * (1 if number > 0 else -1)
+        number = wrap(number, 32)
     elif number_type == NumberType.i64:
-        number = (number & 0x7FFFFFFFFFFFFFFF) + (number & 0x8000000000000000) * (1 if number > 0 else -1)
-    elif number_type == NumberType.f32 and not can_be_represented_in_32_bits(number):
-        number = ctypes.c_float(number)
+        number = wrap(number, 64)
+    elif number_type == NumberType.f32:
+        number = float_arithmetic.from_integer(number, 32) if isinstance(number, int) else \
+            float_arithmetic.round_f32(number)
+    elif number_type == NumberType.f64 and isinstance(number, int):
+        number = float_arithmetic.from_integer(number, 64)
     return number
 
 
@@ -215,6 +227,12 @@ class GlobalVariableWatch:
             item = '$' + item
         return self._variables[item]
 
+    def save(self) -> tuple[int, dict[int | str, GlobalVariable]]:
+        return self._variable_counter, self._variables
+
+    def restore(self, state: tuple[int, dict[int | str, GlobalVariable]]) -> None:
+        self._variable_counter, self._variables = state
+
     def add_variable(self, value, mutable: bool, name=None) -> None:
         self._variables[self._variable_counter] = GlobalVariable(mutable, value)
         self._variable_counter += 1
@@ -237,57 +255,322 @@ class GlobalVariableWatch:
         return item in self._variables
 
 
+# Current size in pages, then the waiters of memory.atomic.wait: address + 1 (0 for a free slot) and whether it was
+# notified
+SIZE_HEADER: struct.Struct = struct.Struct('<Q')
+WAITER: struct.Struct = struct.Struct('<QQ')
+WAITER_SLOTS: int = 64
+PAGE_SIZE: int = 65536
+# Limit of the 32-bit address space
+MAX_PAGES: int = 65536
+# Where multiprocessing.shared_memory puts its segments (Linux)
+SHARED_MEMORY_DIRECTORY: str = '/dev/shm'
+
+
+def shared_memory_space() -> int | None:
+    # Free bytes for shared memory segments, None when unknown
+    try:
+        stats: os.statvfs_result = os.statvfs(SHARED_MEMORY_DIRECTORY)
+    except (OSError, AttributeError):
+        return None
+    return stats.f_bavail * stats.f_frsize
+
+
+class SharedLinearMemory:
+    # Backing of a shared memory (threads proposal). The pages, the current size and the waiters live in a
+    # multiprocessing SharedMemory, and the condition guards atomic operations, growth and waits, so that worker
+    # processes which inherit it map the same memory. The whole maximum is reserved (sparse) when it is created
+    DATA_OFFSET: int = 4096
+    maximum: int
+    memory: SharedMemory
+    condition: Any
+    _owner: int
+    _views: list[memoryview]
+    _closed: bool = False
+
+    def __init__(self, pages: int, maximum: int):
+        if maximum > MAX_PAGES:
+            raise InvalidSyntaxError(f'memory size must be at most {MAX_PAGES} pages (4GiB)')
+        self.maximum = maximum
+        self._views = []
+        size: int = self.DATA_OFFSET + maximum * PAGE_SIZE
+        available: int | None = shared_memory_space()
+        if available is not None and size > available:
+            raise SharedMemoryTooLargeError(maximum, size, available)
+        try:
+            self.memory = SharedMemory(create=True, size=size)
+        except OSError as error:
+            raise SharedMemoryTooLargeError(maximum, size, available) from error
+        self.memory.buf[:self.DATA_OFFSET] = bytes(self.DATA_OFFSET)
+        self.pages = pages
+        self.condition = multiprocessing.get_context().Condition()
+        self._owner = os.getpid()
+        atexit.register(self.close)
+
+    def mapped(self) -> SharedLinearMemory:
+        # Another mapping of the same memory, for a process that didn't create it
+        other: SharedLinearMemory = SharedLinearMemory.__new__(SharedLinearMemory)
+        other.__dict__.update(self.__getstate__())
+        other.memory = SharedMemory(name=self.memory.name)
+        other._closed = False
+        return other
+
+    def __getstate__(self) -> dict[str, Any]:
+        # Sent to worker processes, which map the memory again
+        state: dict[str, Any] = self.__dict__.copy()
+        state['_views'] = []
+        return state
+
+    @property
+    def pages(self) -> int:
+        return SIZE_HEADER.unpack_from(self.memory.buf, 0)[0]
+
+    @pages.setter
+    def pages(self, pages: int) -> None:
+        SIZE_HEADER.pack_into(self.memory.buf, 0, pages)
+
+    def data(self) -> memoryview:
+        view: memoryview = self.memory.buf[self.DATA_OFFSET:self.DATA_OFFSET + self.pages * PAGE_SIZE]
+        # Released before the memory is closed
+        self._views.append(view)
+        return view
+
+    def _waiter_offset(self, slot: int) -> int:
+        return SIZE_HEADER.size + slot * WAITER.size
+
+    def _free_slot(self) -> int | None:
+        for slot in range(WAITER_SLOTS):
+            if WAITER.unpack_from(self.memory.buf, self._waiter_offset(slot))[0] == 0:
+                return slot
+        return None
+
+    def wait(self, index: int, matches: Callable[[], bool], timeout: int) -> int:
+        # 0 when notified, 1 when the value wasn't the expected one, 2 on timeout (nanoseconds, negative for none)
+        deadline: float | None = time.monotonic() + timeout / 1e9 if timeout >= 0 else None
+        with self.condition:
+            if not matches():
+                return 1
+            slot: int | None = self._free_slot()
+            while slot is None:
+                self.condition.wait()
+                slot = self._free_slot()
+            offset: int = self._waiter_offset(slot)
+            WAITER.pack_into(self.memory.buf, offset, index + 1, 0)
+            while WAITER.unpack_from(self.memory.buf, offset)[1] == 0:
+                remaining: float | None = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            notified: bool = WAITER.unpack_from(self.memory.buf, offset)[1] != 0
+            WAITER.pack_into(self.memory.buf, offset, 0, 0)
+            # Someone may be waiting for a free slot
+            self.condition.notify_all()
+            return 0 if notified else 2
+
+    def notify(self, index: int, count: int) -> int:
+        # Number of waiters woken
+        woken: int = 0
+        with self.condition:
+            for slot in range(WAITER_SLOTS):
+                if woken == count:
+                    break
+                offset: int = self._waiter_offset(slot)
+                address, notified = WAITER.unpack_from(self.memory.buf, offset)
+                if address == index + 1 and notified == 0:
+                    WAITER.pack_into(self.memory.buf, offset, address, 1)
+                    woken += 1
+            if woken > 0:
+                self.condition.notify_all()
+        return woken
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        for view in self._views:
+            view.release()
+        self._views = []
+        self.memory.close()
+        # Only the process that created it removes it; the others just unmap it
+        if os.getpid() == self._owner:
+            self.memory.unlink()
+            atexit.unregister(self.close)
+
+
 @singleton
 class Memory:
-    PAGE_SIZE = 65536
-    _memory: bytearray = bytearray()
+    PAGE_SIZE = PAGE_SIZE
+    MAX_PAGES = MAX_PAGES
+    _memory: bytearray | memoryview | mmap.mmap = bytearray()
+    maximum: int | None = None
+    shared: SharedLinearMemory | None = None
 
     def __init__(self, pages: int = 1):
         super().__init__()
         self._memory = bytearray(pages * self.PAGE_SIZE)
-
-    def grow(self, pages: int):
-        self._memory += bytearray(pages * self.PAGE_SIZE)
+        self.maximum = None
+        self.shared = None
+
+    def reset(self, pages: int, maximum: int | None = None, shared: bool = False) -> None:
+        # New memory of a module
+        self._release_shared()
+        if shared:
+            if maximum is None:
+                raise InvalidSyntaxError('shared memory must have maximum')
+            self.shared = SharedLinearMemory(pages, maximum)
+            self._memory = self.shared.data()
+        else:
+            self._memory = bytearray(pages * self.PAGE_SIZE)
+        self.maximum = maximum
+
+    def attach(self, shared: SharedLinearMemory) -> None:
+        # Use the shared memory of another process (see parallel.py) instead of the one of the module
+        self._release_shared()
+        self.shared = shared.mapped()
+        self.maximum = shared.maximum
+        self._memory = self.shared.data()
+
+    def load(self, data: bytearray | mmap.mmap, maximum: int | None = None) -> None:
+        # Contents of a snapshot (snapshot.py), possibly a copy-on-write mapping of the file
+        self._release_shared()
+        self._memory = data
+        self.maximum = maximum
+
+    def save(self) -> tuple[bytearray | memoryview | mmap.mmap, int | None, SharedLinearMemory | None]:
+        # Memory of an instance (api.py), kept aside while another instance runs
+        return self._memory, self.maximum, self.shared
+
+    def restore(self, state: tuple[bytearray | memoryview | mmap.mmap, int | None, SharedLinearMemory | None]) -> None:
+        self._memory, self.maximum, self.shared = state
+
+    def _release_shared(self) -> None:
+        if self.shared is not None:
+            self.shared.close()
+            self.shared = None
+
+    def _refresh(self) -> None:
+        # Another process may have grown the shared memory
+        if self.shared is not None and self.shared.pages * self.PAGE_SIZE != len(self._memory):
+            self._memory.release()
+            self._memory = self.shared.data()
+
+    def grow(self, pages: int) -> int:
+        # Previous size in pages, or -1 when the memory can't grow that much
+        with self.atomic():
+            self._refresh()
+            previous: int = self.allocated
+            if pages < 0 or previous + pages > (self.maximum if self.maximum is not None else self.MAX_PAGES):
+                return -1
+            if self.shared is not None:
+                # The pages are already reserved
+                self.shared.pages = previous + pages
+                self._refresh()
+            else:
+                if not isinstance(self._memory, bytearray):
+                    # A mapped snapshot can't be resized: it is copied once
+                    self._memory = bytearray(self._memory)
+                self._memory += bytearray(pages * self.PAGE_SIZE)
+            return previous
+
+    def view(self) -> memoryview:
+        # Shares the buffer; grow fails while a view is alive (unless the memory is shared)
+        return memoryview(self._memory)
 
     @property
     def allocated(self):
         return len(self._memory) // self.PAGE_SIZE
 
+    def check_bounds(self, index: int, length: int) -> None:
+        if index < 0 or length < 0 or index + length > len(self._memory):
+            self._refresh()
+            if index < 0 or length < 0 or index + length > len(self._memory):
+                raise OutOfBoundsMemoryAccessError(index, length, len(self._memory))
+
+    def atomic(self) -> ContextManager:
+        # Atomic operations of a shared memory exclude each other across processes; otherwise there is a single thread
+        return self.shared.condition if self.shared is not None else contextlib.nullcontext()
+
+    def check_atomic(self, index: int, number_type: NumberType) -> None:
+        width: int = BITS[number_type] // 8
+        if index % width != 0:
+            raise UnalignedAtomicError(index, width)
+        self.check_bounds(index, width)
+
+    def atomic_load(self, index: int, number_type: NumberType) -> FixedNumber:
+        self.check_atomic(index, number_type)
+        with self.atomic():
+            return self[index, number_type]
+
+    def atomic_store(self, index: int, value: FixedNumber) -> None:
+        self.check_atomic(index, value.number_type)
+        with self.atomic():
+            self[index] = value
+
+    def atomic_rmw(self, index: int, number_type: NumberType, operation: Callable[[int], int]) -> FixedNumber:
+        # Replaces the (unsigned) value with operation(value) and returns the old one
+        self.check_atomic(index, number_type)
+        width: int = BITS[number_type] // 8
+        with self.atomic():
+            old: int = int.from_bytes(self._memory[index:index + width], byteorder='little')
+            new: int = operation(old) & ((1 << BITS[number_type]) - 1)
+            self._memory[index:index + width] = new.to_bytes(width, byteorder='little')
+        return FixedNumber(old, number_type)
+
+    def wait(self, index: int, expected: FixedNumber, timeout: int) -> int:
+        if self.shared is None:
+            raise ExpectedSharedMemoryError()
+        self.check_atomic(index, expected.number_type)
+        return self.shared.wait(index, lambda: self[index, expected.number_type].value == expected.value, timeout)
+
+    def notify(self, index: int, count: int) -> int:
+        self.check_atomic(index, NumberType.i32)
+        # Nobody can wait on an unshared memory
+        return self.shared.notify(index, count) if self.shared is not None else 0
+
+    def write(self, index: int, data: bytes | bytearray | memoryview) -> None:
+        self.check_bounds(index, len(data))
+        self._memory[index:index + len(data)] = data
+
+    def copy(self, destination: int, source: int, length: int) -> None:
+        # One slice assignment; the source slice is a copy, so overlapping ranges work like memmove
+        self.check_bounds(source, length)
+        self.check_bounds(destination, length)
+        self._memory[destination:destination + length] = self._memory[source:source + length]
+
+    def fill(self, destination: int, value: int, length: int) -> None:
+        self.check_bounds(destination, length)
+        if length == 0:
+            return
+        # memset on the buffer itself (bytearray, shared memory or mapped snapshot), without a temporary
+        target: ctypes.Array = (ctypes.c_char * length).from_buffer(self._memory, destination)
+        ctypes.memset(target, value & 0xFF, length)
+
     def __setitem__(self, index: int, value: FixedNumber):
-        if index < 0:
-            raise IndexError(f"Cannot access memory at negative index {index}")
-        if index >= len(self._memory):
-            raise IndexError(f"Cannot access memory at index {index} because it is out of bounds")
-        if value.number_type == NumberType.i32:
-            for byte_index in range(4):
-                self._memory[index + byte_index] = (value.unsigned_value >> (8 * byte_index)) & 0xFF
-        elif value.number_type == NumberType.i64:
-            for byte_index in range(8):
-                self._memory[index + byte_index] = (value.unsigned_value >> (8 * byte_index)) & 0xFF
-        elif value.number_type == NumberType.f32:
-            for byte_index in range(4):
-                self._memory[index + byte_index] = (value.value >> (8 * byte_index)) & 0xFF
-        elif value.number_type == NumberType.f64:
-            for byte_index in range(8):
-                self._memory[index + byte_index] = (value.value >> (8 * byte_index)) & 0xFF
+        # Floats are stored as their bit pattern
+        if value.number_type == NumberType.i32 or value.number_type == NumberType.f32:
+            self.check_bounds(index, 4)
+            self._memory[index:index + 4] = value.unsigned_value.to_bytes(4, byteorder='little')
+        elif value.number_type == NumberType.i64 or value.number_type == NumberType.f64:
+            self.check_bounds(index, 8)
+            self._memory[index:index + 8] = value.unsigned_value.to_bytes(8, byteorder='little')
 
     def __getitem__(self, index_tuple: tuple[int, NumberType]) -> FixedNumber:
         index, number_type = index_tuple
-        if index < 0:
-            raise IndexError(f"Cannot access memory at negative index {index}")
-        if index >= len(self._memory):
-            raise IndexError(f"Cannot access memory at index {index} because it is out of bounds")
         if number_type == NumberType.i32:
+            self.check_bounds(index, 4)
             return FixedNumber(int.from_bytes(self._memory[index:index + 4], byteorder='little', signed=True),
                                NumberType.i32)
         elif number_type == NumberType.i64:
+            self.check_bounds(index, 8)
             return FixedNumber(int.from_bytes(self._memory[index:index + 8], byteorder='little', signed=True),
                                NumberType.i64)
         elif number_type == NumberType.f32:
+            self.check_bounds(index, 4)
             return FixedNumber(
-                ctypes.c_float(int.from_bytes(self._memory[index:index + 4], byteorder='little', signed=True)).value,
+                float_arithmetic.from_bits(int.from_bytes(self._memory[index:index + 4], byteorder='little'), 32),
                 NumberType.f32)
         elif number_type == NumberType.f64:
+            self.check_bounds(index, 8)
             return FixedNumber(
-                ctypes.c_double(int.from_bytes(self._memory[index:index + 8], byteorder='little', signed=True)).value,
+                float_arithmetic.from_bits(int.from_bytes(self._memory[index:index + 8], byteorder='little'), 64),
                 NumberType.f64)
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import os
+import struct
+import sys
+import time
+from argparse import ArgumentParser, Namespace, REMAINDER
+from typing import BinaryIO, Callable
+
+from custom_exceptions import ProcessExitError
+from host import Caller, HostFunction
+
+MODULE_NAME: str = 'wasi_snapshot_preview1'
+
+# Error codes of WASI
+SUCCESS: int = 0
+EBADF: int = 8
+EINVAL: int = 28
+EIO: int = 29
+ESPIPE: int = 70
+
+CLOCKS: dict[int, Callable[[], int]] = {
+    0: time.time_ns,
+    1: time.monotonic_ns,
+    2: time.process_time_ns,
+    3: time.thread_time_ns,
+}
+
+# Two little-endian u32: buffer address and length
+IOVEC: struct.Struct = struct.Struct('<II')
+U32: struct.Struct = struct.Struct('<I')
+U64: struct.Struct = struct.Struct('<Q')
+
+
+def address(value: int) -> int:
+    # i32 arguments arrive signed
+    return value & 0xFFFFFFFF
+
+
+class WASI:
+    # Subset of wasi_snapshot_preview1 over stdio and local files. Data goes between the linear memory and the files
+    # through memoryview slices (readinto / write on buffered files), without copying it byte by byte
+    args: list[bytes]
+    environment: list[bytes]
+    files: dict[int, BinaryIO]
+    exit_code: int | None = None
+
+    def __init__(self, args: list[str] | None = None, environment: dict[str, str] | None = None,
+                 stdin: BinaryIO | None = None, stdout: BinaryIO | None = None, stderr: BinaryIO | None = None,
+                 files: dict[int, BinaryIO | str] | None = None):
+        self.args = [arg.encode() for arg in (args if args is not None else [])]
+        self.environment = [f'{key}={value}'.encode() for key, value in (environment or {}).items()]
+        self.files = {
+            0: stdin if stdin is not None else sys.stdin.buffer,
+            1: stdout if stdout is not None else sys.stdout.buffer,
+            2: stderr if stderr is not None else sys.stderr.buffer,
+        }
+        for fd, file in (files or {}).items():
+            # Paths are opened buffered, for reading and writing
+            self.files[fd] = open(file, 'r+b') if isinstance(file, str) else file
+        self.exit_code = None
+
+    def imports(self) -> dict[str, dict[str, HostFunction]]:
+        # For Module.instantiate
+        return {MODULE_NAME: {
+            'fd_write': HostFunction(self.fd_write, ['i32', 'i32', 'i32', 'i32'], ['i32'], access_caller=True),
+            'fd_read': HostFunction(self.fd_read, ['i32', 'i32', 'i32', 'i32'], ['i32'], access_caller=True),
+            'fd_seek': HostFunction(self.fd_seek, ['i32', 'i64', 'i32', 'i32'], ['i32'], access_caller=True),
+            'args_get': HostFunction(self.args_get, ['i32', 'i32'], ['i32'], access_caller=True),
+            'args_sizes_get': HostFunction(self.args_sizes_get, ['i32', 'i32'], ['i32'], access_caller=True),
+            'environ_get': HostFunction(self.environ_get, ['i32', 'i32'], ['i32'], access_caller=True),
+            'environ_sizes_get': HostFunction(self.environ_sizes_get, ['i32', 'i32'], ['i32'], access_caller=True),
+            'clock_time_get': HostFunction(self.clock_time_get, ['i32', 'i64', 'i32'], ['i32'], access_caller=True),
+            'random_get': HostFunction(self.random_get, ['i32', 'i32'], ['i32'], access_caller=True),
+            'proc_exit': HostFunction(self.proc_exit, ['i32'], []),
+        }}
+
+    def flush(self) -> None:
+        for file in self.files.values():
+            if file.writable():
+                file.flush()
+
+    def fd_write(self, caller: Caller, fd: int, iovs: int, iovs_length: int, written_address: int) -> int:
+        file: BinaryIO | None = self.files.get(fd)
+        if file is None:
+            return EBADF
+        memory: memoryview = caller.memory
+        written: int = 0
+        try:
+            for index in range(iovs_length):
+                buffer, length = IOVEC.unpack_from(memory, address(iovs) + index * IOVEC.size)
+                with memory[buffer:buffer + length] as chunk:
+                    written += file.write(chunk)
+        except OSError:
+            return EIO
+        U32.pack_into(memory, address(written_address), written)
+        return SUCCESS
+
+    def fd_read(self, caller: Caller, fd: int, iovs: int, iovs_length: int, read_address: int) -> int:
+        file: BinaryIO | None = self.files.get(fd)
+        if file is None:
+            return EBADF
+        memory: memoryview = caller.memory
+        read: int = 0
+        try:
+            for index in range(iovs_length):
+                buffer, length = IOVEC.unpack_from(memory, address(iovs) + index * IOVEC.size)
+                with memory[buffer:buffer + length] as chunk:
+                    count: int = file.readinto(chunk) or 0
+                read += count
+                if count < length:
+                    # Nothing more available for now
+                    break
+        except OSError:
+            return EIO
+        U32.pack_into(memory, address(read_address), read)
+        return SUCCESS
+
+    def fd_seek(self, caller: Caller, fd: int, offset: int, whence: int, position_address: int) -> int:
+        file: BinaryIO | None = self.files.get(fd)
+        if file is None:
+            return EBADF
+        if fd <= 2 or not file.seekable():
+            return ESPIPE
+        if whence not in (os.SEEK_SET, os.SEEK_CUR, os.SEEK_END):
+            return EINVAL
+        try:
+            position: int = file.seek(offset, whence)
+        except (OSError, ValueError):
+            return EINVAL
+        U64.pack_into(caller.memory, address(position_address), position)
+        return SUCCESS
+
+    @staticmethod
+    def _write_strings(memory: memoryview, strings: list[bytes], pointers: int, buffer: int) -> None:
+        # Null-terminated strings one after the other in buffer, and their addresses in pointers
+        pointers, buffer = address(pointers), address(buffer)
+        for index, string in enumerate(strings):
+            U32.pack_into(memory, pointers + index * U32.size, buffer)
+            memory[buffer:buffer + len(string)] = string
+            memory[buffer + len(string)] = 0
+            buffer += len(string) + 1
+
+    @staticmethod
+    def _write_sizes(memory: memoryview, strings: list[bytes], count_address: int, size_address: int) -> None:
+        U32.pack_into(memory, address(count_address), len(strings))
+        U32.pack_into(memory, address(size_address), sum(len(string) + 1 for string in strings))
+
+    def args_get(self, caller: Caller, argv: int, argv_buffer: int) -> int:
+        self._write_strings(caller.memory, self.args, argv, argv_buffer)
+        return SUCCESS
+
+    def args_sizes_get(self, caller: Caller, count_address: int, size_address: int) -> int:
+        self._write_sizes(caller.memory, self.args, count_address, size_address)
+        return SUCCESS
+
+    def environ_get(self, caller: Caller, environ: int, environ_buffer: int) -> int:
+        self._write_strings(caller.memory, self.environment, environ, environ_buffer)
+        return SUCCESS
+
+    def environ_sizes_get(self, caller: Caller, count_address: int, size_address: int) -> int:
+        self._write_sizes(caller.memory, self.environment, count_address, size_address)
+        return SUCCESS
+
+    def clock_time_get(self, caller: Caller, clock_id: int, precision: int, time_address: int) -> int:
+        if clock_id not in CLOCKS:
+            return EINVAL
+        U64.pack_into(caller.memory, address(time_address), CLOCKS[clock_id]())
+        return SUCCESS
+
+    def random_get(self, caller: Caller, buffer: int, length: int) -> int:
+        buffer, length = address(buffer), address(length)
+        caller.memory[buffer:buffer + length] = os.urandom(length)
+        return SUCCESS
+
+    def proc_exit(self, exit_code: int) -> None:
+        self.flush()
+        self.exit_code = exit_code
+        raise ProcessExitError(exit_code)
+
+
+if __name__ == '__main__':
+    from api import Module
+
+    parser: ArgumentParser = ArgumentParser(description="Run the _start function of a WASI module")
+    parser.add_argument("input_file")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="environment variable of the program (repeatable)")
+    parser.add_argument("args", nargs=REMAINDER, help="arguments of the program")
+
+    args: Namespace = parser.parse_args()
+
+    wasi: WASI = WASI([args.input_file] + args.args, dict(variable.split('=', 1) for variable in args.env))
+    instance = Module.from_file(args.input_file).instantiate(wasi.imports())
+    try:
+        instance.exports['_start']()
+    except ProcessExitError as exit_error:
+        sys.exit(exit_error.exit_code)
+    finally:
+        wasi.flush()
@@ -0,0 +1,18 @@
+(module
+  (func (export "br-out-of-then") (result i32)
+    (block (if (i32.const 1) (then (br 1))) (return (i32.const 10))) (i32.const 20))
+  (func (export "br-out-of-else") (result i32)
+    (block (if (i32.const 0) (then) (else (br 1))) (return (i32.const 10))) (i32.const 20))
+  (func (export "br-to-if") (result i32)
+    (block (if (i32.const 1) (then (br 0) (return (i32.const 30)))) (return (i32.const 10))) (i32.const 20))
+  (func (export "br-to-named-if") (result i32)
+    (block (if $l (i32.const 1) (then (br $l) (return (i32.const 30)))) (return (i32.const 10))) (i32.const 20))
+  (func (export "br-to-named-block") (result i32)
+    (block $b (if (i32.const 1) (then (br $b))) (return (i32.const 10))) (i32.const 20))
+)
+
+(assert_return (invoke "br-out-of-then") (i32.const 20))
+(assert_return (invoke "br-out-of-else") (i32.const 20))
+(assert_return (invoke "br-to-if") (i32.const 10))
+(assert_return (invoke "br-to-named-if") (i32.const 10))
+(assert_return (invoke "br-to-named-block") (i32.const 20))
@@ -0,0 +1,19 @@
+(module
+  (type (;0;) (func (param i32 i32) (result i32)))
+  (type (;1;) (func (result i32)))
+  (func (;0;) (type 0) (param i32 i32) (result i32)
+    (i32.add (local.get 0) (local.get 1)))
+  (func (;1;) (type 1) (result i32)
+    (i32.const 42))
+  (func $sub (type 0)
+    (i32.sub (local.get 0) (local.get 1)))
+  (memory (;0;) 1)
+  (export "memory" (memory 0))
+  (export "add" (func 0))
+  (export "answer" (func 1))
+  (export "sub" (func $sub))
+)
+
+(assert_return (invoke "add" (i32.const 2) (i32.const 3)) (i32.const 5))
+(assert_return (invoke "answer") (i32.const 42))
+(assert_return (invoke "sub" (i32.const 2) (i32.const 3)) (i32.const -1))
@@ -0,0 +1,13 @@
+(module
+  (type (;0;) (func (param i32 i32 i32 i32) (result i32)))
+  (type (;1;) (func))
+  (import "wasi_snapshot_preview1" "fd_write" (func $fd_write (type 0)))
+  (func $_start (type 1)
+    ;; iovec at address 0: buffer at address 8, 14 bytes
+    (i32.store (i32.const 0) (i32.const 8))
+    (i32.store (i32.const 4) (i32.const 14))
+    (drop (call $fd_write (i32.const 1) (i32.const 0) (i32.const 1) (i32.const 32))))
+  (memory (;0;) 1)
+  (export "memory" (memory 0))
+  (export "_start" (func $_start))
+  (data (;0;) (i32.const 8) "Hello, world!\0a"))
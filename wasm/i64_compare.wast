@@ -0,0 +1,33 @@
+(module
+  (func (export "eqz-add") (param $x i64) (result i32)
+    (i32.add (i64.eqz (local.get $x)) (i32.const 1)))
+  (func (export "eq-add") (param $x i64) (param $y i64) (result i32)
+    (i32.add (i64.eq (local.get $x) (local.get $y)) (i32.const 1)))
+  (func (export "eq-zero") (param $x i64) (result i32)
+    (i32.add (i64.eq (local.get $x) (i64.const 0)) (i32.const 1)))
+  (func (export "ne") (param $x i64) (param $y i64) (result i32) (i64.ne (local.get $x) (local.get $y)))
+  (func (export "lt_s") (param $x i64) (param $y i64) (result i32) (i64.lt_s (local.get $x) (local.get $y)))
+  (func (export "lt_u") (param $x i64) (param $y i64) (result i32) (i64.lt_u (local.get $x) (local.get $y)))
+  (func (export "le_s") (param $x i64) (param $y i64) (result i32) (i64.le_s (local.get $x) (local.get $y)))
+  (func (export "gt_u") (param $x i64) (param $y i64) (result i32) (i64.gt_u (local.get $x) (local.get $y)))
+  (func (export "ge_s-const") (param $x i64) (result i32) (i64.ge_s (local.get $x) (i64.const -1)))
+  (func (export "select") (param $x i64) (result i32)
+    (select (i32.const 10) (i32.const 20) (i64.lt_s (local.get $x) (i64.const 0))))
+  (func (export "br_if") (param $x i64) (result i32)
+    (block $b (br_if $b (i64.gt_s (local.get $x) (i64.const 5))) (return (i32.const 1))) (i32.const 2))
+)
+
+(assert_return (invoke "eqz-add" (i64.const 0)) (i32.const 2))
+(assert_return (invoke "eqz-add" (i64.const 7)) (i32.const 1))
+(assert_return (invoke "eq-add" (i64.const 3) (i64.const 3)) (i32.const 2))
+(assert_return (invoke "eq-add" (i64.const 3) (i64.const 4)) (i32.const 1))
+(assert_return (invoke "eq-zero" (i64.const 0)) (i32.const 2))
+(assert_return (invoke "ne" (i64.const 3) (i64.const 4)) (i32.const 1))
+(assert_return (invoke "lt_s" (i64.const -1) (i64.const 0)) (i32.const 1))
+(assert_return (invoke "lt_u" (i64.const -1) (i64.const 0)) (i32.const 0))
+(assert_return (invoke "le_s" (i64.const 0x7fffffffffffffff) (i64.const 0x7fffffffffffffff)) (i32.const 1))
+(assert_return (invoke "gt_u" (i64.const 0x8000000000000000) (i64.const 1)) (i32.const 1))
+(assert_return (invoke "ge_s-const" (i64.const -2)) (i32.const 0))
+(assert_return (invoke "select" (i64.const -5)) (i32.const 10))
+(assert_return (invoke "br_if" (i64.const 6)) (i32.const 2))
+(assert_return (invoke "br_if" (i64.const 5)) (i32.const 1))